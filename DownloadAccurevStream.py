@@ -14,8 +14,19 @@ import getopt
 import os
 import shutil
 import sys
+import tempfile
 import time
-from subprocess import call
+from xml.etree.ElementTree import ParseError
+import accurevParsers
+import accurevSession
+import migrationMetrics
+import transactionCache
+import materializer
+import MigrateEmptyDirs
+import populatePlanner
+import processRunner
+import snapshotCache
+import treeScanner
 
 __author__ = "Samuel M Gile"
 __copyright__ = "Copyright 2018, PTC, Inc."
@@ -31,69 +42,161 @@ class Accurev:
         self.username = username
         self.password = password
         self.transaction = ""
+        # every Accurev object of a run shares one session, which logs in only once
+        self.session = accurevSession.getSession(username, password)
 
     def login(self):
         try:
-            print("Logging into AccuRev as user: %s" % self.username)
-            returnCode = call(["accurev", "login", "-H", "URLtoAccuRevServer:Port", self.username, self.password])
-            if returnCode == 0:
-                print("Successful login to Accurev")
-            else:
-                print("Failed login to Accurev!")
-                sys.exit(ERR_ACCUREV)
+            self.session.login()
         except Exception as ex:
             print(ex)
             sys.exit(ERR_ACCUREV)
 
-    def download(self, stream_name, dirname):
-        create_directory(dirname)
+    def download(self, stream_name, dirname, initRepo=True, blacklist=None):
+        # Paths matching blacklist (a populatePlanner.Blacklist) are left out of the population
+        create_directory(dirname, initRepo)
 
         try:
             print("Downloading stream %s files to directory %s" % (stream_name, dirname))
             self._getTransactionNumber(stream_name)
-            with open(os.devnull, 'w') as silent:
-                returnCode = call(["accurev", "pop", "-R", "-v" + stream_name, "-L" + dirname, "-t" + self.transaction,
-                                   ".\\"], stdout=silent)
-            if returnCode == 0:
+            cache = snapshotCache.getCache()
+            if cache is not None and self._restoreSnapshot(cache, stream_name, dirname, blacklist):
+                return
+            plan = None
+            if blacklist:
+                plan = populatePlanner.planPopulate(self.session, stream_name, self.transaction, blacklist)
+            if plan is None or plan.roots is None:
+                result = self.session.run(["pop", "-R", "-v" + stream_name, "-L" + dirname, "-t" + self.transaction, ".\\"])
+            else:
+                print("Populating %d include roots of stream %s, skipping %d blacklisted files (%d bytes)"
+                      % (len(plan.roots), stream_name, plan.skippedFiles, plan.skippedBytes))
+                migrationMetrics.current().add(skippedFiles=plan.skippedFiles, skippedBytes=plan.skippedBytes)
+                result = self._populateRoots(stream_name, dirname, plan)
+            if result.returncode == 0:
                 print("Successfully downloaded stream %s from AccuRev" % stream_name)
                 print("Local download directory: %s" % dirname)
+                if cache is not None:
+                    cache.store(stream_name, self.transaction, dirname, blacklist or populatePlanner.Blacklist([]))
             else:
                 print("Failed to download files from AccuRev!")
+                print(result.stderr)
                 sys.exit(ERR_ACCUREV)
         except Exception as ex:
             print(ex)
             sys.exit(ERR_ACCUREV)
 
-    def _getTransactionNumber(self, stream_name):
-        # if filestream.txt already exists
+    def _restoreSnapshot(self, cache, stream_name, dirname, blacklist):
+        # True when the tree of the stream at self.transaction came from the snapshot cache
+        blacklist = blacklist or populatePlanner.Blacklist([])
+        snapshot = cache.lookup(stream_name, self.transaction, blacklist)
+        if snapshot is None:
+            return False
+        if cache.restore(snapshot, dirname, blacklist):
+            migrationMetrics.current().add(mode='cache')
+            return True
+        print("Falling back to populating stream %s from AccuRev" % stream_name)
+        clearDirectory(dirname)
+        return False
+
+    def _populateRoots(self, stream_name, dirname, plan):
+        # folders above the blacklisted paths are only partially populated, create them in case nothing else is
+        for directory in plan.directories:
+            os.makedirs(accurevParsers.depotPathToLocal(dirname, directory), exist_ok=True)
+        if not plan.roots:
+            return accurevSession.CommandResult(0, "", "")
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as populateList:
+            populateList.write('\n'.join('/./' + root for root in plan.roots) + '\n')
         try:
-            os.remove('filestream.txt')
-        except OSError:
-            pass
-        # ran into issues with String.IO, had to use text file
-        with open('filestream.txt', 'w+') as filestream:
+            return self.session.run(["pop", "-R", "-v" + stream_name, "-L" + dirname, "-t" + self.transaction,
+                                     "-l", populateList.name])
+        finally:
+            os.remove(populateList.name)
+
+    def downloadDelta(self, stream_name, dirname, previous_stream, previous_transaction, blacklist=None):
+        # Bring a working copy that already holds previous_stream at previous_transaction up to date with
+        # stream_name by fetching only the elements that differ. Returns False when the delta can't be trusted
+        # and the caller has to fall back to a full population.
+        print("Computing delta from stream %s to stream %s" % (previous_stream, stream_name))
+        # the diff compares the current state of both streams, which must still be the migrated transactions
+        transaction = self._getTransactionNumber(stream_name)
+        expected = (previous_transaction, transaction)
+        current = transactionCache.queryTransactions(self.session, [previous_stream, stream_name])
+        for stream, current, expected in zip((previous_stream, stream_name), current, expected):
+            if current != expected:
+                print("Stream %s is at transaction %s, not %s" % (stream, current, expected))
+                return False
+        changes = self._diffStreams(previous_stream, stream_name)
+        if changes is None:
+            return False
+
+        self.transaction = transaction
+        removed = [change.oldPath for change in changes if change.oldPath and change.oldPath != change.newPath]
+        fetched = [change.newPath for change in changes if change.newPath]
+        if blacklist:
+            fetched = [path for path in fetched if not blacklist.excludes(populatePlanner.relativePath(path))]
+        print("Delta from %s: %d elements to fetch, %d to remove" % (previous_stream, len(fetched), len(removed)))
+        migrationMetrics.current().add(elements=len(fetched), removed=len(removed))
+
+        for path in removed:
+            removeLocalPath(accurevParsers.depotPathToLocal(dirname, path))
+        if not fetched:
+            return True
+
+        # a directory which held only a generated .gitignore would otherwise hide the files fetched into it
+        MigrateEmptyDirs.removeStaleGitIgnoreFiles(dirname,
+                                                   [accurevParsers.depotPathToLocal(dirname, p) for p in fetched])
+        materializer.detach([accurevParsers.depotPathToLocal(dirname, p) for p in fetched])
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as populateList:
+            populateList.write('\n'.join(fetched) + '\n')
+        try:
+            result = self.session.run(["pop", "-R", "-O", "-v" + stream_name, "-L" + dirname,
+                                       "-t" + self.transaction, "-l", populateList.name])
+        finally:
+            os.remove(populateList.name)
+        if result.returncode != 0:
+            print("Failed to download changed elements of stream %s from AccuRev!" % stream_name)
+            print(result.stderr)
+            sys.exit(ERR_ACCUREV)
+        print("Successfully updated %s to stream %s" % (dirname, stream_name))
+        return True
+
+    def _diffStreams(self, stream1, stream2):
+        # Returns the list of accurevParsers.ElementChange between both streams, or None on failure.
+        # The diff of two old releases can be very large, so it goes to a temporary file rather than memory.
+        with tempfile.TemporaryFile() as diffstream:
+            # diff returns 0 for no differences, 1 for differences, 2 for error
+            result = self.session.run(["diff", "-a", "-i", "-v", stream1, "-V", stream2, "-fx"], okCodes=(0, 1),
+                                      stdout=diffstream)
+            if result.returncode not in (0, 1):
+                print("Failed to diff streams %s and %s in AccuRev" % (stream1, stream2))
+                return None
+            diffstream.seek(0)
             try:
-                call(["accurev", "hist", "-ft", "-s" + stream_name, "-t", "now.1"], stdout=filestream)
-            except Exception as ex:
-                print(ex)
-                sys.exit(ERR_ACCUREV)
-        with open('filestream.txt', 'r') as file:
-            # Find the desired line, seems to always be a blank line preceding the desired line
-            for line in file.readlines():
-                if line.split(" ")[0] == "transaction":
-                    break
-            self.transaction = line.split(";")[0].split(" ")[1]
-
-def create_directory(dir):
+                return accurevParsers.parseDiff(diffstream)
+            except ParseError as ex:
+                print("Could not parse diff of streams %s and %s: %s" % (stream1, stream2, ex))
+                return None
+
+    def _getTransactionNumber(self, stream_name, live=False):
+        # The transaction comes from the run's transaction cache unless live is set
+        if live:
+            self.transaction = transactionCache.queryTransaction(self.session, stream_name)
+        else:
+            self.transaction = transactionCache.getCache().transaction(self.session, stream_name)
+        return self.transaction
+
+def create_directory(dir, initRepo=True):
     try:
         if os.path.exists(dir):
             print ("Local directory already exists")
         else:
             os.mkdir(dir)
             print ("Successfully created the directory %s " % dir)
+            if not initRepo:
+                return
             try:
-                returncode = call(["git", "init", dir])
-                if returncode == 0:
+                result = processRunner.getRunner().call(["git", "init", dir])
+                if result.returncode == 0:
                     print("Successfully initialized git repo.")
                 else:
                     print("Failed to execute git repo initialization.")
@@ -105,22 +208,54 @@ def create_directory(dir):
         print ("Creation of the directory %s failed\n%s" % (dir, ex))
         sys.exit(ERR_CREATEDIR)
 
+def removeLocalPath(path):
+    if os.path.islink(path) or os.path.isfile(path):
+        os.remove(path)
+    elif os.path.isdir(path):
+        shutil.rmtree(path)
+
+def clearDirectory(dirname):
+    # delete everything in the directory except the .git folder
+    if not os.path.isdir(dirname):
+        return
+    for entry in os.listdir(dirname):
+        if entry != '.git':
+            removeLocalPath(os.path.join(dirname, entry))
+
 def deletePaths(dirname, blacklist):
+    # the paths are removed at the same time
+    filepaths = []
     for item in blacklist:
         filepath = dirname + item
-        try:
-            if os.path.exists(filepath):
-                try:
-                    call("rmdir /s /q " + '"' + filepath + '"', shell=True)
-                    print("Successfully removed " + filepath)
-                except Exception as ex:
-                    print("os.system calling of command did not work due to: " + ex)
-                    sys.exit(ERR_DELETION)
-            else:
-                print("Path %s does not exist." % filepath)
-        except Exception as e:
-            print ("Deletion of path %s failed\n%s" % (filepath, e))
+        if os.path.exists(filepath):
+            filepaths.append(filepath)
+        else:
+            print("Path %s does not exist." % filepath)
+    try:
+        results = processRunner.getRunner().callAll([["rmdir", "/s", "/q", filepath] for filepath in filepaths],
+                                                    tool='cmd', shell=True)
+    except Exception as e:
+        print("Deletion of paths %s failed\n%s" % (", ".join(filepaths), e))
+        sys.exit(ERR_DELETION)
+    for filepath, result in zip(filepaths, results):
+        if result.returncode != 0:
+            print("Deletion of path %s failed\n%s" % (filepath, result.stderr.decode('utf-8', 'replace')))
             sys.exit(ERR_DELETION)
+        print("Successfully removed " + filepath)
+
+class BlacklistHandler(treeScanner.ScanHandler):
+    # Deletes the blacklisted paths met by a treeScanner.TreeScanner, which then skips them
+    stage = 'blacklist'
+
+    def __init__(self, blacklist):
+        self.blacklist = populatePlanner.Blacklist(blacklist)
+
+    def include(self, scanner, path, relative, isDir):
+        if not self.blacklist.matches(relative):
+            return True
+        removeLocalPath(path)
+        print("Successfully removed " + path)
+        return False
 
 def parse_arguments(argv):
     try:
@@ -149,23 +284,36 @@ def parse_arguments(argv):
     print("Finished importing arguments")
     return {'streamname': streamname, 'dirname': dirname, 'user': accurevuser, 'pass': accurevpass, 'blacklist': blacklist}  
 
-def main(streamname, dirname, accurevuser, accurevpass, blacklist):
+def main(streamname, dirname, accurevuser, accurevpass, blacklist, previousStream=None, previousTransaction=None,
+         exclude=None):
+    # When previousStream is given, dirname is expected to hold that stream at previousTransaction
+    # and only the differences are downloaded. Paths matching the exclude entries (blacklist paths or
+    # glob patterns) are not downloaded at all.
     try:
         print("Starting DownloadAccurevStream.py: %s" % time.strftime("%I:%M:%S"))
         accurev = Accurev(accurevuser, accurevpass)
         accurev.login()
-        accurev.download(streamname, dirname)
+        exclude = populatePlanner.Blacklist(exclude or [])
+        cache = snapshotCache.getCache()
+        if previousStream is not None and cache is not None \
+                and cache.lookup(streamname, accurev._getTransactionNumber(streamname), exclude) is not None:
+            # restoring the cached snapshot needs no diff from the server
+            clearDirectory(dirname)
+            previousStream = None
+        if previousStream is None or not os.path.isdir(dirname) \
+                or not accurev.downloadDelta(streamname, dirname, previousStream, previousTransaction, exclude):
+            if previousStream is not None:
+                print("Falling back to a full population of stream %s" % streamname)
+                clearDirectory(dirname)
+            accurev.download(streamname, dirname, blacklist=exclude)
         deletePaths(dirname, blacklist)
     except Exception as ex:
         print(ex)
         sys.exit(ERR_UNKNOWN)
     finally:
-        try:
-            os.remove('filestream.txt')
-        except OSError:
-            pass
         print("Finished DownloadAccurevStream.py: %s" % time.strftime("%I:%M:%S"))
-        return accurev.transaction
+    # not returned from the finally block, which would swallow the exit of a failed download
+    return accurev.transaction
 
 
 if __name__ == '__main__':
@@ -9,10 +9,11 @@ Example args:
 """
 
 import os
-from subprocess import call
 import sys
 import time
 import getopt
+import reparsePoints
+import treeScanner
 
 __author__ = "James Newkirk"
 __copyright__ = "Copyright 2018, PTC, Inc."
@@ -20,44 +21,59 @@ __copyright__ = "Copyright 2018, PTC, Inc."
 ERR_PARSING_ARGS = 1    # Encounter an error parsing arguments
 ERR_UNKNOWN = 2         # Fail unknown reason
 
+GITIGNORE_MARKER = "# Ignore everything in this directory\n*\n# Except this file\n!.gitignore"
+
 def createGitIgnoreFile(gitIgnoreFilePath):
+    gitIgnoreFile = os.path.join(gitIgnoreFilePath, '.gitignore')
     # Check to see if .gitignore file already exist.
-    if not os.path.isfile(gitIgnoreFilePath + '\.gitignore'):
+    if not os.path.isfile(gitIgnoreFile):
         # Create and open .gitignore file inside of the new directory
-        file = open(gitIgnoreFilePath + "\.gitignore", "w+")
+        file = open(gitIgnoreFile, "w+")
         
         # Configure .gitignore file
-        file.write("# Ignore everything in this directory\n")
-        file.write("*\n")
-        file.write("# Except this file\n")
-        file.write("!.gitignore")
+        file.write(GITIGNORE_MARKER)
         
         # Close .gitignore file
         file.close()
         
-        print (".gitignore file created at: " + gitIgnoreFilePath + "\.gitignore")
+        print (".gitignore file created at: " + gitIgnoreFile)
         
     else:
-        print(".gitignore file already exists at: " + gitIgnoreFilePath + "\.gitignore")
-
-def findEmptyDirectories(startPath):
-    # Crawl through repoPath looking for empty directories. When an empty directory is found, generate a .gitignore
-    for (path, dirs, files) in os.walk(startPath, topdown = True, followlinks = False):
-        # check if this is an empty directory before removing junctions
-        isEmpty = not dirs and not files
-
-        # os.walk follows Windows junctions even when specifying followlinks = False, this will remove them
-        with open(os.devnull, 'w') as silent: # ignore the output of fsutil reparsepoint query
-            dirs[:] = [d for d in dirs
-                       if call(
-                           ["fsutil", "reparsepoint", "query", os.path.join(path, d)], 
-                           stdout=silent, 
-                           stderr=silent
-                           ) == 1]
-
-        if isEmpty:
-            # Put a .gitignore file inside of the empty directory so that it is no longer empty
+        print(".gitignore file already exists at: " + gitIgnoreFile)
+
+def removeStaleGitIgnoreFiles(startPath, paths):
+    # Remove the .gitignore files generated by this script from the directories containing paths, since those
+    # directories are about to receive content which the generated file would ignore.
+    startPath = os.path.normpath(startPath)
+    checked = set()
+    for path in paths:
+        directory = os.path.normpath(path)
+        while directory.startswith(startPath) and directory not in checked:
+            checked.add(directory)
+            gitIgnoreFile = os.path.join(directory, '.gitignore')
+            if os.path.isfile(gitIgnoreFile):
+                with open(gitIgnoreFile, 'r') as file:
+                    isMarker = file.read() == GITIGNORE_MARKER
+                if isMarker:
+                    os.remove(gitIgnoreFile)
+                    print(".gitignore file removed at: " + gitIgnoreFile)
+            if directory == startPath:
+                break
+            directory = os.path.dirname(directory)
+
+class EmptyDirectoryHandler(treeScanner.ScanHandler):
+    # Puts a .gitignore file inside of the empty directories met by a treeScanner.TreeScanner
+    stage = 'emptyDirs'
+
+    def directory(self, scanner, path, relative, entryCount):
+        if entryCount == 0:
             createGitIgnoreFile(path)
+            scanner.manifest.files[(relative + '/' if relative else '') + '.gitignore'] = len(GITIGNORE_MARKER)
+
+def findEmptyDirectories(startPath, detector=None):
+    # Crawl through repoPath looking for empty directories. When an empty directory is found, generate a .gitignore.
+    # Junctions are not descended into.
+    treeScanner.scanTree(startPath, [EmptyDirectoryHandler()], detector)
 
 def parse_arguments(argv):
     try:
@@ -75,10 +91,13 @@ def parse_arguments(argv):
     print("Finished importing arguments")
     return dirname
 
-def main(path):
+def main(path, detector=None):
     try:
         print("Starting MigrateEmptyDirs.py: %s" % time.strftime("%I:%M:%S"))
-        findEmptyDirectories(path)
+        detector = detector or reparsePoints.getDetector()
+        findEmptyDirectories(path, detector)
+        if detector.subprocessCalls:
+            print("Started %d processes to inspect reparse points" % detector.subprocessCalls)
     except Exception as ex:
         print(ex)
         sys.exit(ERR_UNKNOWN)
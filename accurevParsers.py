@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+"""
+accurevParsers.py:
+Parse the XML (-fx) output of AccuRev commands into simple records. Output is parsed incrementally and every
+record is dropped from the tree once it was read, so memory stays flat however large the output is. Files are
+read with the iter functions, output arriving line by line from a running command is fed to a DiffFeed.
+Python version 3.6
+"""
+
+import collections
+import os
+import xml.etree.ElementTree as ET
+
+__author__ = "Samuel M Gile"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+# One element that differs between two streams.
+# oldPath is None when the element only exists in the second stream, newPath is None when it was removed.
+ElementChange = collections.namedtuple('ElementChange', ['what', 'oldPath', 'newPath', 'isDir'])
+
+# characters of output DiffFeed collects before parsing them
+FEED_BATCH_SIZE = 64 * 1024
+
+def depotPathToLocal(dirname, depotPath):
+    # AccuRev reports element paths as "/./dir/file" (or "\.\dir\file" on Windows)
+    relative = depotPath.replace('\\', '/')
+    if relative.startswith('/./'):
+        relative = relative[3:]
+    return os.path.join(dirname, *[part for part in relative.split('/') if part not in ('', '.')])
+
+class _RecordReader:
+    # build(element) of every complete tag in the (event, element) pairs of a parser listening to start and end.
+    # The records are removed from the root once built, the tree never grows past the record being read.
+    def __init__(self, tag, build):
+        self.tag = tag
+        self.build = build
+        self.root = None
+
+    def read(self, events):
+        for event, element in events:
+            if self.root is None:
+                self.root = element
+            elif event == 'end' and element.tag == self.tag:
+                for record in self.build(element):
+                    yield record
+                element.clear()
+                self.root.clear()
+
+def _records(source, tag, build):
+    return _RecordReader(tag, build).read(ET.iterparse(source, events=('start', 'end')))
+
+def _changes(element):
+    # ElementChanges of a diff Element
+    for change in element.iter('Change'):
+        first = change.find('Stream1')
+        second = change.find('Stream2')
+        oldPath = first.get('Name') if first is not None else None
+        newPath = second.get('Name') if second is not None else None
+        if not oldPath and not newPath:
+            continue
+        side = second if second is not None else first
+        yield ElementChange(change.get('What', ''), oldPath or None, newPath or None,
+                            side.get('isDir', 'false') == 'true')
+
+def iterDiff(source):
+    # ElementChanges of "accurev diff -a -i -v <stream1> -V <stream2> -fx" from a file name or file object.
+    # Raises ET.ParseError when the output is not complete XML.
+    return _records(source, 'Element', _changes)
+
+def parseDiff(source):
+    return list(iterDiff(source))
+
+def isMove(change):
+    # The element is in both streams under another path. Paths are compared rather than the What keywords,
+    # a move can come with a content change.
+    return change.oldPath is not None and change.newPath is not None and change.oldPath != change.newPath
+
+def iterMoves(source):
+    # (old path, new path) of the elements moved between the streams of a diff
+    return ((change.oldPath, change.newPath) for change in iterDiff(source) if isMove(change))
+
+class DiffFeed:
+    # Incremental parser for diff output read while the command runs: feed() takes the next piece of the
+    # output and returns the ElementChanges completed so far. Small pieces such as lines are parsed in batches.
+    def __init__(self, batchSize=FEED_BATCH_SIZE):
+        self.parser = ET.XMLPullParser(events=('start', 'end'))
+        self.reader = _RecordReader('Element', _changes)
+        self.batchSize = batchSize
+        self.pending = []
+        self.pendingSize = 0
+
+    def _parse(self):
+        self.parser.feed(''.join(self.pending))
+        self.pending = []
+        self.pendingSize = 0
+        return list(self.reader.read(self.parser.read_events()))
+
+    def feed(self, data):
+        self.pending.append(data)
+        self.pendingSize += len(data)
+        if self.pendingSize < self.batchSize:
+            return []
+        return self._parse()
+
+    def close(self):
+        # Raises ET.ParseError when the output ended before the XML was complete
+        changes = self._parse()
+        self.parser.close()
+        return changes + list(self.reader.read(self.parser.read_events()))
+
+# A transaction of "accurev hist -fx", versions lists the ElementVersion it created
+Transaction = collections.namedtuple('Transaction', ['id', 'type', 'time', 'user', 'comment', 'versions'])
+
+# An element version of a transaction
+ElementVersion = collections.namedtuple('ElementVersion', ['path', 'eid', 'isDir'])
+
+# An element of "accurev stat -fx", size is None when AccuRev does not report it.
+# version is the real version ("\\stream number\\version number"), None when not reported.
+# isLink is set for element and symbolic links, which are populated as junctions.
+Element = collections.namedtuple('Element', ['path', 'eid', 'isDir', 'size', 'version', 'isLink'])
+
+LINK_TYPES = ('elink', 'slink')
+
+# A stream of "accurev show -fx streams"
+Stream = collections.namedtuple('Stream', ['name', 'number', 'basis', 'type', 'time'])
+
+def _elemType(element):
+    return element.get('elemType', element.get('elem_type'))
+
+def _isDir(element):
+    return element.get('dir') == 'yes' or _elemType(element) == 'dir'
+
+def iterTransactions(source):
+    # Transactions of "accurev hist -fx" from a file name or file object, in the order AccuRev reports them
+    return _records(source, 'transaction', _transaction)
+
+def _transaction(element):
+    versions = [ElementVersion(version.get('path'), version.get('eid'), _isDir(version))
+                for version in element.iter('version') if version.get('path')]
+    yield Transaction(element.get('id'), element.get('type'), element.get('time'), element.get('user'),
+                      (element.findtext('comment') or '').strip(), versions)
+
+def iterElements(source):
+    # Elements of "accurev stat -fx" from a file name or file object
+    return _records(source, 'element', _element)
+
+def _element(element):
+    size = element.get('size')
+    yield Element(element.get('location'), element.get('id'), _isDir(element),
+                  int(size) if size and size.isdigit() else None, element.get('Real'),
+                  _elemType(element) in LINK_TYPES)
+
+def parseStreams(source):
+    # {stream name: Stream} of "accurev show -fx streams"
+    return dict((stream.name, stream) for stream in _records(source, 'stream', _stream))
+
+def _stream(element):
+    yield Stream(element.get('name'), element.get('streamNumber'), element.get('basis'), element.get('type'),
+                 element.get('time'))
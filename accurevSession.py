@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+"""
+accurevSession.py:
+One AccuRev session shared by every script of a migration run. Logs in once, logs in again when a command
+reports an expired session, applies per-command timeouts, retries transient failures with backoff and
+captures command output in memory. Commands run through processRunner.py, independent ones can run at the
+same time with runAll().
+Set ACCUREV_EXE to run another accurev executable (for instance a fake one for tests).
+Python version 3.6
+"""
+
+import os
+import shlex
+import sys
+import threading
+import time
+from collections import namedtuple
+import processRunner
+
+__author__ = "Samuel M Gile"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+ERR_ACCUREV = 3         # Error communicating with Accurev
+
+SERVER = "URLtoAccuRevServer:Port"
+
+# seconds, None means no timeout
+DEFAULT_TIMEOUTS = {'login': 120, 'hist': 900, 'show': 900, 'stat': 3600, 'files': 3600, 'diff': 3600, 'pop': None}
+RETRIES = 3
+BACKOFF = 5
+
+EXPIRED_MESSAGES = ("not authenticated", "session expired", "session has expired", "please log in")
+TRANSIENT_MESSAGES = ("unable to connect", "communications failure", "connection reset", "timed out",
+                      "server is busy")
+
+CommandResult = namedtuple('CommandResult', ['returncode', 'stdout', 'stderr'])
+
+def accurevExecutable():
+    command = os.environ.get('ACCUREV_EXE')
+    if not command:
+        return ["accurev"]
+    return shlex.split(command, posix=(os.name != 'nt'))
+
+class AccurevSession:
+    def __init__(self, username, password, timeouts=None, retries=RETRIES, backoff=BACKOFF):
+        self.username = username
+        self.password = password
+        self.executable = accurevExecutable()
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+        self.retries = retries
+        self.backoff = backoff
+        self.loggedIn = False
+        self.commandCount = 0
+        # held while logging in, which counts its commands too
+        self.lock = threading.RLock()
+
+    def login(self):
+        with self.lock:
+            if self.loggedIn:
+                return
+            print("Logging into AccuRev as user: %s" % self.username)
+            result = self._retry(["login", "-H", SERVER, self.username, self.password], renew=False)
+            if result.returncode != 0:
+                print("Failed login to Accurev!")
+                sys.exit(ERR_ACCUREV)
+            print("Successful login to Accurev")
+            self.loggedIn = True
+
+    def _options(self, args, stdout=None, onStdout=None):
+        return {'tool': 'accurev', 'timeout': self.timeouts.get(args[0]), 'stdout': stdout, 'onStdout': onStdout}
+
+    def _result(self, args, process):
+        if process.returncode is None:
+            return CommandResult(None, "", "accurev %s timed out after %s seconds" % (args[0], self.timeouts.get(args[0])))
+        return CommandResult(process.returncode, process.stdout.decode('utf-8', 'replace'),
+                             process.stderr.decode('utf-8', 'replace'))
+
+    def _execute(self, args, stdout=None, onStdout=None):
+        # A single attempt. stdout is a file object to stream large outputs to and onStdout a parser receiving
+        # the output line by line, output is kept in memory otherwise.
+        with self.lock:
+            self.commandCount += 1
+        process = processRunner.getRunner().call(self.executable + args, **self._options(args, stdout, onStdout))
+        return self._result(args, process)
+
+    def run(self, args, okCodes=(0,), stdout=None, onStdout=None):
+        # Run "accurev <args>" and return a CommandResult. Expired sessions are renewed and transient failures
+        # retried; the last result is returned when the command still fails, callers decide how to report it.
+        # onStdout sees the output of a retried command again from its first line.
+        self.login()
+        return self._retry(args, okCodes, stdout, onStdout)
+
+    def _retry(self, args, okCodes=(0,), stdout=None, onStdout=None, renew=True):
+        # Attempts of run(), renew is False for the login itself
+        attempt = 0
+        relogged = False
+        while True:
+            if stdout is not None:
+                stdout.seek(0)
+                stdout.truncate()
+            result = self._execute(args, stdout, onStdout)
+            if result.returncode in okCodes:
+                return result
+            message = (result.stderr + result.stdout).lower()
+            if renew and not relogged and any(text in message for text in EXPIRED_MESSAGES):
+                print("AccuRev session expired, logging in again")
+                relogged = True
+                with self.lock:
+                    self.loggedIn = False
+                self.login()
+                continue
+            if attempt < self.retries and (result.returncode is None
+                                           or any(text in message for text in TRANSIENT_MESSAGES)):
+                delay = self.backoff * 2 ** attempt
+                attempt += 1
+                print("accurev %s failed (%s), retrying in %d seconds" % (args[0], result.stderr.strip(), delay))
+                time.sleep(delay)
+                continue
+            return result
+
+    def runAll(self, argsList, okCodes=(0,)):
+        # Run independent commands at the same time and return their CommandResults in the same order.
+        # Commands which fail go through run() again, which renews the session and retries them.
+        self.login()
+        with self.lock:
+            self.commandCount += len(argsList)
+        runner = processRunner.getRunner()
+        futures = [runner.submit(self.executable + args, **self._options(args)) for args in argsList]
+        processes = runner.wait(futures)
+        results = []
+        for args, process in zip(argsList, processes):
+            result = self._result(args, process)
+            results.append(result if result.returncode in okCodes else self.run(args, okCodes))
+        return results
+
+_sessions = {}
+_sessionsLock = threading.Lock()
+
+def getSession(username, password):
+    # The session shared by every script of this run
+    with _sessionsLock:
+        session = _sessions.get(username)
+        if session is None or session.password != password:
+            session = AccurevSession(username, password)
+            _sessions[username] = session
+        return session
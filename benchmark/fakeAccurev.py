@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+
+"""
+fakeAccurev.py:
+Stand-in accurev executable serving the streams written by generateStreams.py, so migrations can be timed
+without an AccuRev server. Supports login, show streams, hist, stat, diff and pop with the options the
+migration scripts use. Every call is appended to calls.jsonl in the stream root with the bytes it wrote.
+Failures listed per command in faults.json in the stream root are served first, one per call: a message the
+command fails with, or a number of seconds it hangs before answering.
+Set FAKE_ACCUREV_ROOT to the stream root and ACCUREV_EXE to "python fakeAccurev.py".
+Python version 3.6
+"""
+
+import json
+import os
+import shutil
+import sys
+import time
+from xml.sax.saxutils import quoteattr, escape
+
+__author__ = "Samuel M Gile"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+ERR_USAGE = 2
+
+# elemType reported by stat for the element types of generateStreams.py
+ELEMENT_TYPES = {'link': 'elink'}
+
+class FakeAccurev:
+    def __init__(self, root):
+        self.root = root
+        with open(os.path.join(root, 'streams.json'), 'r') as streamsFile:
+            self.streams = json.load(streamsFile)
+        self.bytesWritten = 0
+
+    def elements(self, stream):
+        with open(os.path.join(self.root, 'elements', stream + '.json'), 'r') as elementsFile:
+            return json.load(elementsFile)
+
+    def streamDir(self, stream):
+        return os.path.join(self.root, 'streams', stream)
+
+    def option(self, args, flag):
+        # "-s stream" and "-sstream" are both accepted, like accurev does
+        for index, arg in enumerate(args):
+            if arg == flag and index + 1 < len(args):
+                return args[index + 1]
+            if arg.startswith(flag) and len(arg) > len(flag):
+                return arg[len(flag):]
+        return None
+
+    def write(self, text):
+        sys.stdout.write(text)
+
+    def login(self, args):
+        return 0
+
+    def show(self, args):
+        self.write("<AcResponse>\n")
+        for name, stream in sorted(self.streams.items()):
+            self.write('  <stream name=%s streamNumber="%d" basis=%s type=%s time="%d"/>\n'
+                       % (quoteattr(name), stream['transaction'], quoteattr(stream['basis'] or ''),
+                          quoteattr(stream['type']), stream['transaction']))
+        self.write("</AcResponse>\n")
+        return 0
+
+    def hist(self, args):
+        stream = self.option(args, '-s')
+        if stream not in self.streams:
+            sys.stderr.write("Unknown stream %s\n" % stream)
+            return 1
+        with open(os.path.join(self.root, 'hist', stream + '.json'), 'r') as histFile:
+            history = json.load(histFile)
+        window = self.option(args, '-t') or 'now'
+        if window.startswith('now'):
+            history = history[-1:]
+        elif '-' in window:
+            high, low = [int(bound) for bound in window.split('-')]
+            history = [transaction for transaction in history if low <= transaction['id'] <= high]
+        elements = self.elements(stream)
+        self.write("<AcResponse>\n")
+        for transaction in reversed(history):
+            self.write('  <transaction id="%d" type=%s time="%d" user=%s>\n    <comment>%s</comment>\n'
+                       % (transaction['id'], quoteattr(transaction['type']), transaction['time'],
+                          quoteattr(transaction['user']), escape(transaction['comment'])))
+            for path in transaction['versions']:
+                element = elements.get(path)
+                if element is not None:
+                    self.write('    <version path=%s eid="%d" dir="%s"/>\n'
+                               % (quoteattr('/./' + path), element['eid'], 'yes' if element['type'] == 'dir' else 'no'))
+            self.write("  </transaction>\n")
+        self.write("</AcResponse>\n")
+        return 0
+
+    def stat(self, args):
+        stream = self.option(args, '-s')
+        streamDir = self.streamDir(stream)
+        self.write("<AcResponse>\n")
+        for path, element in sorted(self.elements(stream).items()):
+            size = ""
+            if element['type'] == 'file':
+                size = ' size="%d"' % os.path.getsize(os.path.join(streamDir, *path.split('/')))
+            self.write('  <element location=%s id="%d" dir="%s" elemType="%s" Real="\\1\\%d"%s/>\n'
+                       % (quoteattr('/./' + path), element['eid'], 'yes' if element['type'] == 'dir' else 'no',
+                          ELEMENT_TYPES.get(element['type'], element['type']), element['version'], size))
+        self.write("</AcResponse>\n")
+        return 0
+
+    def diff(self, args):
+        # Elements are matched by id, moves keep the id and changes increase the version
+        first = dict((element['eid'], (path, element)) for path, element in self.elements(self.option(args, '-v')).items())
+        second = dict((element['eid'], (path, element)) for path, element in self.elements(self.option(args, '-V')).items())
+        changes = []
+        for eid in sorted(set(first) | set(second)):
+            old = first.get(eid)
+            new = second.get(eid)
+            if old is None:
+                changes.append(('added', None, new))
+            elif new is None:
+                changes.append(('removed', old, None))
+            elif old[0] != new[0]:
+                changes.append(('moved', old, new))
+            elif old[1]['version'] != new[1]['version']:
+                changes.append(('changed', old, new))
+        if '-fx' in args:
+            self.write("<AcResponse>\n")
+            for what, old, new in changes:
+                self.write('  <Element>\n    <Change What="%s">\n' % what)
+                for tag, side in (('Stream1', old), ('Stream2', new)):
+                    if side is not None:
+                        self.write('      <%s Name=%s isDir="%s"/>\n'
+                                   % (tag, quoteattr('/./' + side[0]), 'true' if side[1]['type'] == 'dir' else 'false'))
+                self.write('    </Change>\n  </Element>\n')
+            self.write("</AcResponse>\n")
+        else:
+            for what, old, new in changes:
+                if what == 'moved':
+                    self.write("/./%s moved to /./%s\n" % (old[0], new[0]))
+                else:
+                    self.write("/./%s %s\n" % ((new or old)[0], what))
+        return 1 if changes else 0
+
+    def _copy(self, source, target):
+        if os.path.isdir(source):
+            os.makedirs(target, exist_ok=True)
+            for entry in os.listdir(source):
+                self._copy(os.path.join(source, entry), os.path.join(target, entry))
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if os.path.lexists(target):
+                os.remove(target)
+            shutil.copyfile(source, target)
+            self.bytesWritten += os.path.getsize(target)
+
+    def _link(self, dirname, path, element):
+        # links are created with an absolute target, the way AccuRev populates junctions
+        target = os.path.join(dirname, *path.split('/'))
+        if os.path.lexists(target):
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.symlink(os.path.abspath(os.path.join(dirname, *element['target'].split('/'))), target,
+                   target_is_directory=True)
+
+    def pop(self, args):
+        stream = self.option(args, '-v')
+        dirname = self.option(args, '-L')
+        if stream not in self.streams or not dirname:
+            sys.stderr.write("Unknown stream %s\n" % stream)
+            return 1
+        elements = self.elements(stream)
+        listFile = self.option(args, '-l')
+        if listFile is None:
+            paths = ['']
+        else:
+            with open(listFile, 'r') as populateList:
+                paths = ['/'.join(part for part in line.strip().replace('\\', '/').split('/') if part not in ('', '.'))
+                         for line in populateList if line.strip()]
+        streamDir = self.streamDir(stream)
+        for path in paths:
+            source = os.path.join(streamDir, *path.split('/')) if path else streamDir
+            if os.path.exists(source):
+                self._copy(source, os.path.join(dirname, *path.split('/')) if path else dirname)
+        for path, element in elements.items():
+            if element['type'] == 'link' and any(not root or path == root or path.startswith(root + '/') for root in paths):
+                self._link(dirname, path, element)
+        return 0
+
+    def fault(self, command):
+        # Next fault of the command from faults.json, None when there is none left
+        faultsPath = os.path.join(self.root, 'faults.json')
+        if not os.path.exists(faultsPath):
+            return None
+        with open(faultsPath, 'r') as faultsFile:
+            faults = json.load(faultsFile)
+        if not faults.get(command):
+            return None
+        fault = faults[command].pop(0)
+        with open(faultsPath, 'w') as faultsFile:
+            json.dump(faults, faultsFile)
+        return fault
+
+    def run(self, args):
+        commands = {'login': self.login, 'show': self.show, 'hist': self.hist, 'stat': self.stat,
+                    'diff': self.diff, 'pop': self.pop}
+        if not args or args[0] not in commands:
+            sys.stderr.write("Unsupported command: %s\n" % ' '.join(args))
+            return ERR_USAGE
+        start = time.time()
+        fault = self.fault(args[0])
+        if isinstance(fault, str):
+            sys.stderr.write(fault + "\n")
+            returncode = 1
+        else:
+            if fault:
+                time.sleep(fault)
+            returncode = commands[args[0]](args[1:])
+        with open(os.path.join(self.root, 'calls.jsonl'), 'a') as callLog:
+            callLog.write(json.dumps({'command': args[0], 'seconds': time.time() - start,
+                                      'bytes': self.bytesWritten}) + '\n')
+        return returncode
+
+def main(argv):
+    root = os.environ.get('FAKE_ACCUREV_ROOT')
+    if not root:
+        sys.stderr.write("FAKE_ACCUREV_ROOT is not set\n")
+        return ERR_USAGE
+    return FakeAccurev(root).run(argv)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
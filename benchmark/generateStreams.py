@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+
+"""
+generateStreams.py:
+Generate synthetic AccuRev streams for fakeAccurev.py. Each stream is derived from the previous one in
+migration order (release, then its maintenance streams) with a share of its files changed, moved and added.
+Example args:
+    --root C:\\benchmark\\streams
+    --releases 3
+    --maint 2
+    --files 5000
+    --depth 4
+    --meanSize 20000
+    --emptyDirs 50
+    --links 5
+    --changed 5
+    --moved 1
+Python version 3.6
+"""
+
+import getopt
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import time
+
+__author__ = "Samuel M Gile"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+ERR_PARSING_ARGS = 1    # Encounter an error parsing arguments
+
+DEFAULTS = {'releases': 2, 'maint': 2, 'files': 2000, 'depth': 4, 'fanout': 6, 'meanSize': 20000,
+            'sizeSpread': 1.5, 'emptyDirs': 20, 'links': 3, 'blacklistFiles': 50, 'changed': 5.0, 'moved': 1.0,
+            'added': 1.0, 'seed': 1}
+BLACKLIST_DIR = 'Skip'
+TRANSACTION_STEP = 100
+
+def streamNames(settings):
+    # Streams in the order masterScript.py migrates them
+    names = []
+    for release in range(1, settings['releases'] + 1):
+        names.append("Rel%d" % release)
+        names.extend("Rel%d_Maint%d" % (release, maint) for maint in range(1, settings['maint'] + 1))
+    return names
+
+def joinPath(directory, name):
+    return directory + '/' + name if directory else name
+
+def migrationConfig(settings, gitRepo):
+    # config.json content migrating the generated streams
+    releases = []
+    for release in range(1, settings['releases'] + 1):
+        releases.append({'Version': "%d.0" % release, 'ReleaseTag': "%d.0" % release, 'StreamName': "Rel%d" % release,
+                         'Maint': [{'name': "Rel%d_Maint%d" % (release, maint), 'tag': "%d.0.%d" % (release, maint)}
+                                   for maint in range(1, settings['maint'] + 1)]})
+    return {'gitRepo': gitRepo, 'blacklist': ["\\" + BLACKLIST_DIR], 'releases': releases}
+
+class StreamGenerator:
+    def __init__(self, root, settings):
+        self.root = root
+        self.settings = dict(DEFAULTS, **settings)
+        self.random = random.Random(self.settings['seed'])
+        # relative path -> {"eid": id, "type": "file"|"dir"|"link", "version": n, "target": relative path}
+        self.elements = {}
+        self.nextEid = 1
+        self.streams = {}
+
+    def _add(self, path, kind, **extra):
+        self.elements[path] = dict(eid=self.nextEid, type=kind, version=1, **extra)
+        self.nextEid += 1
+
+    def _size(self):
+        # log-normal sizes around meanSize, a few files are much larger than the rest
+        spread = self.settings['sizeSpread']
+        return int(self.random.lognormvariate(math.log(max(1, self.settings['meanSize'])) - spread * spread / 2, spread))
+
+    def _write(self, streamDir, path):
+        fullpath = os.path.join(streamDir, *path.split('/'))
+        os.makedirs(os.path.dirname(fullpath), exist_ok=True)
+        with open(fullpath, 'wb') as target:
+            target.write(os.urandom(self._size()))
+
+    def _directories(self):
+        directories = ['']
+        frontier = ['']
+        for level in range(self.settings['depth']):
+            children = []
+            for parent in frontier:
+                for index in range(self.random.randint(1, self.settings['fanout'])):
+                    child = joinPath(parent, "dir%d_%d" % (level, index))
+                    children.append(child)
+            directories.extend(children)
+            frontier = children
+        return directories
+
+    def _files(self):
+        return [path for path, element in self.elements.items() if element['type'] == 'file']
+
+    def firstStream(self, streamDir):
+        directories = self._directories()
+        for directory in directories[1:]:
+            self._add(directory, 'dir')
+            os.makedirs(os.path.join(streamDir, *directory.split('/')), exist_ok=True)
+        for index in range(self.settings['files']):
+            directory = self.random.choice(directories)
+            extension = self.random.choice(['c', 'h', 'txt', 'xml', 'dll'])
+            path = joinPath(directory, "file%d.%s" % (index, extension))
+            self._add(path, 'file')
+            self._write(streamDir, path)
+        for index in range(self.settings['emptyDirs']):
+            path = joinPath(self.random.choice(directories), "empty%d" % index)
+            self._add(path, 'dir')
+            os.makedirs(os.path.join(streamDir, *path.split('/')), exist_ok=True)
+        if self.settings['blacklistFiles']:
+            self._add(BLACKLIST_DIR, 'dir')
+            for index in range(self.settings['blacklistFiles']):
+                path = "%s/data%d.bin" % (BLACKLIST_DIR, index)
+                self._add(path, 'file')
+                self._write(streamDir, path)
+        # links stand in for junctions, fakeAccurev.py populates them with an absolute target
+        for index in range(self.settings['links']):
+            self._add("link%d" % index, 'link', target=self.random.choice(directories[1:] or ['']))
+
+    def nextStream(self, streamDir):
+        # Returns the paths changed compared to the previous stream
+        files = self._files()
+        changed = []
+        for path in self.random.sample(files, int(len(files) * self.settings['changed'] / 100)):
+            self.elements[path]['version'] += 1
+            self._write(streamDir, path)
+            changed.append(path)
+        directories = [path for path, element in self.elements.items()
+                       if element['type'] == 'dir' and not path.startswith(BLACKLIST_DIR)] or ['']
+        movable = [path for path in files if path not in changed and not path.startswith(BLACKLIST_DIR + '/')]
+        for path in self.random.sample(movable, int(len(movable) * self.settings['moved'] / 100)):
+            target = joinPath(self.random.choice(directories), 'moved_' + os.path.basename(path))
+            if target in self.elements:
+                continue
+            self.elements[target] = self.elements.pop(path)
+            os.makedirs(os.path.join(streamDir, *target.split('/')[:-1]), exist_ok=True)
+            os.rename(os.path.join(streamDir, *path.split('/')), os.path.join(streamDir, *target.split('/')))
+            changed.append(target)
+        for index in range(int(len(files) * self.settings['added'] / 100)):
+            path = joinPath(self.random.choice(directories), "added%d_%d.c" % (self.nextEid, index))
+            self._add(path, 'file')
+            self._write(streamDir, path)
+            changed.append(path)
+        return changed
+
+    def _record(self, stream, transaction, changed, basis=None):
+        # element listing and history of the stream as fakeAccurev.py reads them
+        self.streams[stream] = {'transaction': transaction, 'type': 'snapshot', 'basis': basis}
+        with open(os.path.join(self.root, 'elements', stream + '.json'), 'w') as elementsFile:
+            json.dump(self.elements, elementsFile)
+        history = [{'id': transaction, 'type': 'promote', 'time': int(time.time()), 'user': 'benchmark',
+                    'comment': 'Changes of %s' % stream, 'versions': sorted(changed)}]
+        with open(os.path.join(self.root, 'hist', stream + '.json'), 'w') as histFile:
+            json.dump(history, histFile)
+        with open(os.path.join(self.root, 'streams.json'), 'w') as streamsFile:
+            json.dump(self.streams, streamsFile, indent=4, sort_keys=True)
+
+    def generate(self):
+        if os.path.exists(self.root):
+            shutil.rmtree(self.root)
+        for folder in ('streams', 'elements', 'hist'):
+            os.makedirs(os.path.join(self.root, folder))
+        previous = None
+        for stream in streamNames(self.settings):
+            if previous is None:
+                self.firstStream(os.path.join(self.root, 'streams', stream))
+                self._record(stream, TRANSACTION_STEP, list(self.elements))
+            else:
+                self.deriveStream(stream, previous)
+            previous = stream
+        print("Generated %d streams with %d elements in %s" % (len(self.streams), len(self.elements), self.root))
+
+    def deriveStream(self, stream, basis):
+        # A new stream holding basis with a share of its files changed, moved and added
+        streamDir = os.path.join(self.root, 'streams', stream)
+        with open(os.path.join(self.root, 'elements', basis + '.json'), 'r') as elementsFile:
+            self.elements = json.load(elementsFile)
+        shutil.copytree(os.path.join(self.root, 'streams', basis), streamDir, symlinks=True)
+        changed = self.nextStream(streamDir)
+        self._record(stream, (len(self.streams) + 1) * TRANSACTION_STEP, changed, basis)
+
+OPTIONS = ["root=", "releases=", "maint=", "files=", "depth=", "fanout=", "meanSize=", "sizeSpread=", "emptyDirs=",
+           "links=", "blacklistFiles=", "changed=", "moved=", "added=", "seed="]
+
+def settingsFromOptions(opts):
+    settings = {}
+    for opt, arg in opts:
+        name = opt[2:]
+        if name in DEFAULTS:
+            settings[name] = type(DEFAULTS[name])(arg)
+    return settings
+
+def parse_arguments(argv):
+    try:
+        print("Importing arguments")
+        opts, args = getopt.getopt(argv, "", OPTIONS)
+    except Exception as e:
+        print(e)
+        sys.exit(ERR_PARSING_ARGS)
+
+    root = 'benchmark_streams'
+    for opt, arg in opts:
+        if opt == '--root':
+            root = arg
+
+    print("Finished importing arguments")
+    return {'root': root, 'settings': settingsFromOptions(opts)}
+
+def main(root, settings):
+    print("Starting generateStreams.py: %s" % time.strftime("%I:%M:%S"))
+    generator = StreamGenerator(root, settings)
+    generator.generate()
+    print("Finished generateStreams.py: %s" % time.strftime("%I:%M:%S"))
+    return generator
+
+
+if __name__ == '__main__':
+    arguments = parse_arguments(sys.argv[1:])
+    main(arguments['root'], arguments['settings'])
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+
+"""
+runBenchmark.py:
+Generate synthetic streams, migrate them with masterScript.py, migrateSingleSnapshot.py and moveFiles.py against
+fakeAccurev.py and record per-stage wall time, process launches and bytes written. The results are saved as JSON
+and compared with a baseline saved by an earlier run.
+Example args:
+    --workdir C:\\benchmark
+    --save results.json
+    --baseline baseline.json
+    --tolerance 10
+    --config "{\\"commitBackend\\": \\"fast-import\\"}"
+    (and any option of generateStreams.py)
+Python version 3.6
+"""
+
+import getopt
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+import accurevSession
+import generateStreams
+import masterScript
+import migrateSingleSnapshot
+import moveFiles
+import transactionCache
+import workspace2repo
+
+__author__ = "Samuel M Gile"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+ERR_PARSING_ARGS = 1    # Encounter an error parsing arguments
+ERR_REGRESSION = 2      # A stage is slower than the baseline allows
+ERR_MIGRATION = 3       # A migration script failed
+
+# masterScript.py stages timed inside the full migration
+STAGES = [(masterScript, 'populate'), (masterScript, 'postProcess'), (workspace2repo, 'main'),
+          (masterScript, 'createBranch'), (masterScript, 'finishBranch'), (masterScript, 'finishMigrate')]
+MOVED_STREAM = 'Moved'
+# differences below this many seconds are noise, they are never reported as regressions
+MIN_REGRESSION_SECONDS = 0.5
+
+def directorySize(path):
+    total = 0
+    for (dirpath, dirs, files) in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+    return total
+
+class BenchmarkRecorder:
+    # Counts the processes started by this process and times the stages of a run
+    def __init__(self, streamRoot, gitRepo):
+        self.gitDir = os.path.join(gitRepo, '.git')
+        self.callLog = os.path.join(streamRoot, 'calls.jsonl')
+        self.callOffset = 0
+        self.totalAccurevBytes = 0
+        self.processes = {}
+        self.stages = {}
+        self.active = []
+        self.originalInit = subprocess.Popen.__init__
+
+    def install(self):
+        recorder = self
+        original = self.originalInit
+
+        def countingInit(popen, args, *rest, **kwargs):
+            command = args if isinstance(args, str) else ' '.join(str(arg) for arg in args)
+            if 'fakeAccurev' in command:
+                kind = 'accurev'
+            elif command.split()[0:1] == ['git']:
+                kind = 'git'
+            else:
+                kind = 'other'
+            recorder.processes[kind] = recorder.processes.get(kind, 0) + 1
+            original(popen, args, *rest, **kwargs)
+        subprocess.Popen.__init__ = countingInit
+
+        for module, name in STAGES:
+            setattr(module, name, self.timed(module.__name__ + '.' + name, getattr(module, name)))
+
+    def timed(self, stage, function):
+        recorder = self
+
+        def wrapper(*args, **kwargs):
+            # nested stages (populate within a stage) are only counted once, by the outer one
+            if recorder.active:
+                return function(*args, **kwargs)
+            recorder.active.append(stage)
+            try:
+                return recorder.measure(stage, function, *args, **kwargs)
+            finally:
+                recorder.active.pop()
+        return wrapper
+
+    def accurevBytes(self):
+        # bytes written by fakeAccurev.py since the recorder was created
+        if os.path.exists(self.callLog):
+            with open(self.callLog, 'r') as callLog:
+                callLog.seek(self.callOffset)
+                for line in callLog:
+                    self.totalAccurevBytes += json.loads(line)['bytes']
+                self.callOffset = callLog.tell()
+        return self.totalAccurevBytes
+
+    def measure(self, stage, function, *args, **kwargs):
+        # the sizes are taken outside of the timed part
+        processes = dict(self.processes)
+        accurevBytes = self.accurevBytes()
+        gitBytes = directorySize(self.gitDir)
+        start = time.time()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            seconds = time.time() - start
+            result = self.stages.setdefault(stage, {'seconds': 0.0, 'calls': 0, 'processes': {}, 'accurevBytes': 0,
+                                                    'gitBytes': 0})
+            result['seconds'] += seconds
+            result['calls'] += 1
+            result['accurevBytes'] += self.accurevBytes() - accurevBytes
+            result['gitBytes'] += directorySize(self.gitDir) - gitBytes
+            for kind, count in self.processes.items():
+                result['processes'][kind] = result['processes'].get(kind, 0) + count - processes.get(kind, 0)
+
+def resetRunState():
+    # every script run starts with its own session and transaction cache, like separate processes would
+    accurevSession._sessions.clear()
+    transactionCache._cache = None
+
+def runScript(recorder, stage, function, *args):
+    resetRunState()
+    try:
+        recorder.measure(stage, function, *args)
+    except SystemExit as exit:
+        if exit.code not in (0, None):
+            print("%s failed with exit code %s" % (stage, exit.code))
+            sys.exit(ERR_MIGRATION)
+
+def compareWithBaseline(results, baseline, tolerance):
+    # Returns the stages slower than the baseline by more than tolerance percent
+    regressions = []
+    for stage, result in sorted(results['stages'].items()):
+        previous = baseline.get('stages', {}).get(stage)
+        if previous is None:
+            print("%-40s %8.2fs, processes %s, accurev bytes %d, git bytes %d (no baseline)"
+                  % (stage, result['seconds'], result['processes'], result['accurevBytes'], result['gitBytes']))
+            continue
+        ratio = result['seconds'] / previous['seconds'] if previous['seconds'] else 1.0
+        print("%-40s %8.2fs baseline %8.2fs (%+.0f%%), processes %s baseline %s, accurev bytes %d baseline %d"
+              % (stage, result['seconds'], previous['seconds'], (ratio - 1) * 100, result['processes'],
+                 previous['processes'], result['accurevBytes'], previous['accurevBytes']))
+        if ratio > 1 + tolerance / 100.0 and result['seconds'] - previous['seconds'] > MIN_REGRESSION_SECONDS:
+            regressions.append(stage)
+    return regressions
+
+def parse_arguments(argv):
+    try:
+        print("Importing arguments")
+        opts, args = getopt.getopt(argv, "", ["workdir=", "save=", "baseline=", "tolerance=", "config="]
+                                   + [option for option in generateStreams.OPTIONS if option != "root="])
+    except Exception as e:
+        print(e)
+        sys.exit(ERR_PARSING_ARGS)
+
+    arguments = {'workdir': 'benchmark_work', 'save': None, 'baseline': None, 'tolerance': 10.0, 'config': {}}
+    for opt, arg in opts:
+        if opt == '--workdir':
+            arguments['workdir'] = arg
+        elif opt == '--save':
+            arguments['save'] = arg
+        elif opt == '--baseline':
+            arguments['baseline'] = arg
+        elif opt == '--tolerance':
+            arguments['tolerance'] = float(arg)
+        elif opt == '--config':
+            arguments['config'] = json.loads(arg)
+    arguments['settings'] = generateStreams.settingsFromOptions(opts)
+
+    print("Finished importing arguments")
+    return arguments
+
+def main(workdir, settings, config=None, save=None, baseline=None, tolerance=10.0):
+    # config holds extra config.json settings (commitBackend, deltaPopulate, ...) to benchmark
+    print("Starting runBenchmark.py: %s" % time.strftime("%I:%M:%S"))
+    workdir = os.path.abspath(workdir)
+    if os.path.exists(workdir):
+        shutil.rmtree(workdir)
+    os.makedirs(workdir)
+    streamRoot = os.path.join(workdir, 'streams')
+    gitRepo = os.path.join(workdir, 'repo')
+    save = os.path.abspath(save) if save else None
+    baseline = os.path.abspath(baseline) if baseline else None
+
+    generator = generateStreams.main(streamRoot, settings)
+    # moveFiles.py and migrateSingleSnapshot.py bring master, which holds the last release, to a derived stream
+    lastRelease = "Rel%d" % generator.settings['releases']
+    generator.deriveStream(MOVED_STREAM, lastRelease)
+    migration = generateStreams.migrationConfig(generator.settings, gitRepo)
+    migration.update(config or {})
+    with open(os.path.join(workdir, 'config.json'), 'w') as configFile:
+        json.dump(migration, configFile, indent=4)
+    shutil.copy(os.path.join(os.path.dirname(BENCHMARK_DIR), 'gitignoreForMigration'), workdir)
+
+    os.environ['FAKE_ACCUREV_ROOT'] = streamRoot
+    command = [sys.executable, os.path.join(BENCHMARK_DIR, 'fakeAccurev.py')]
+    os.environ['ACCUREV_EXE'] = ' '.join(command) if os.name == 'nt' else ' '.join(shlex.quote(part) for part in command)
+    for variable in ('GIT_AUTHOR_NAME', 'GIT_COMMITTER_NAME'):
+        os.environ.setdefault(variable, 'Benchmark')
+    for variable in ('GIT_AUTHOR_EMAIL', 'GIT_COMMITTER_EMAIL'):
+        os.environ.setdefault(variable, 'benchmark@example.com')
+
+    recorder = BenchmarkRecorder(streamRoot, gitRepo)
+    recorder.install()
+    currentDir = os.getcwd()
+    os.chdir(workdir)
+    try:
+        runScript(recorder, 'masterScript', masterScript.main, 'benchmark', 'benchmark')
+        runScript(recorder, 'moveFiles', moveFiles.main, lastRelease, MOVED_STREAM, 'benchmark', 'benchmark',
+                  'Moving Files')
+        runScript(recorder, 'migrateSingleSnapshot', migrateSingleSnapshot.main, MOVED_STREAM, 'benchmark',
+                  'benchmark', 'Snapshot after moving files')
+    finally:
+        os.chdir(currentDir)
+
+    results = {'settings': generator.settings, 'config': config or {}, 'stages': recorder.stages,
+               'streamBytes': directorySize(os.path.join(streamRoot, 'streams')),
+               'repoBytes': directorySize(os.path.join(gitRepo, '.git'))}
+    print("Stream data %d bytes, git repo %d bytes" % (results['streamBytes'], results['repoBytes']))
+    regressions = []
+    if baseline:
+        with open(baseline, 'r') as baselineFile:
+            regressions = compareWithBaseline(results, json.load(baselineFile), tolerance)
+    else:
+        compareWithBaseline(results, {}, tolerance)
+    if save:
+        with open(save, 'w') as resultsFile:
+            json.dump(results, resultsFile, indent=4, sort_keys=True)
+        print("Saved results to %s" % save)
+    print("Finished runBenchmark.py: %s" % time.strftime("%I:%M:%S"))
+    if regressions:
+        print("Slower than the baseline: %s" % ', '.join(regressions))
+        sys.exit(ERR_REGRESSION)
+    return results
+
+
+if __name__ == '__main__':
+    arguments = parse_arguments(sys.argv[1:])
+    main(arguments['workdir'], arguments['settings'], arguments['config'], arguments['save'], arguments['baseline'],
+         arguments['tolerance'])
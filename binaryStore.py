@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+"""
+binaryStore.py:
+Move large binaries of a populated tree into a content-addressed store before the tree is committed and leave
+Git LFS pointer files in their place. The store uses the Git LFS layout (.git/lfs/objects), so a binary shared
+by several streams is stored once, "git lfs push --all" uploads the store and clones with Git LFS installed get
+the real files back. Files are selected by size and by the patterns written to .gitattributes.
+Python version 3.6
+"""
+
+import collections
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import populatePlanner
+
+__author__ = "Corey Birdsall"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+CHUNK_SIZE = 1024 * 1024
+DEFAULT_THRESHOLD_MB = 10
+DEFAULT_PATTERNS = ["*.dll", "*.exe", "*.lib", "*.msi", "*.pdf", "*.zip"]
+HASH_WORKERS = 8
+HISTOGRAM_LINES = 10
+POINTER_VERSION = "version https://git-lfs.github.com/spec/v1"
+ATTRIBUTES_BEGIN = "# accurev2git binary store begin"
+ATTRIBUTES_END = "# accurev2git binary store end"
+
+def storePath(localdir):
+    return os.path.join(localdir, '.git', 'lfs', 'objects')
+
+def objectPath(localdir, oid):
+    return os.path.join(storePath(localdir), oid[0:2], oid[2:4], oid)
+
+def pointerText(oid, size):
+    return "%s\noid sha256:%s\nsize %d\n" % (POINTER_VERSION, oid, size)
+
+def fileOid(fullpath):
+    digest = hashlib.sha256()
+    with open(fullpath, 'rb') as source:
+        while True:
+            chunk = source.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def isPointer(fullpath, size):
+    if size > 200:
+        return False
+    with open(fullpath, 'rb') as source:
+        return source.read(len(POINTER_VERSION)) == POINTER_VERSION.encode()
+
+def extensionHistogram(files):
+    # {extension: [file count, bytes]} of a {relative path: size} listing
+    histogram = collections.defaultdict(lambda: [0, 0])
+    for path, size in files.items():
+        extension = os.path.splitext(path)[1].lower() or '(none)'
+        histogram[extension][0] += 1
+        histogram[extension][1] += size
+    return histogram
+
+def ignoredPaths(localdir, paths):
+    # Paths the .gitignore files keep out of the commit, they are not worth storing
+    if not paths:
+        return set()
+    process = subprocess.run(["git", "-C", localdir, "check-ignore", "--stdin", "-z"],
+                             input='\0'.join(paths).encode('utf-8', 'surrogateescape'), stdout=subprocess.PIPE)
+    return set(path for path in process.stdout.decode('utf-8', 'surrogateescape').split('\0') if path)
+
+def attributePattern(path):
+    # .gitattributes patterns end at white space, git lfs track escapes it the same way
+    return '/' + path.replace(' ', '[[:space:]]')
+
+def writeAttributes(localdir, patterns, paths):
+    # Replace the block written for the previous stream, .gitattributes coming from AccuRev is kept
+    attributesFile = os.path.join(localdir, '.gitattributes')
+    lines = []
+    if os.path.exists(attributesFile):
+        with open(attributesFile, 'r') as existing:
+            lines = existing.read().splitlines()
+        if ATTRIBUTES_BEGIN in lines and ATTRIBUTES_END in lines:
+            del lines[lines.index(ATTRIBUTES_BEGIN):lines.index(ATTRIBUTES_END) + 1]
+    lines.append(ATTRIBUTES_BEGIN)
+    lines.extend("%s filter=lfs diff=lfs merge=lfs -text" % pattern for pattern in patterns)
+    lines.extend("%s filter=lfs diff=lfs merge=lfs -text" % attributePattern(path) for path in sorted(paths))
+    lines.append(ATTRIBUTES_END)
+    writeReplacing(attributesFile, ('\n'.join(lines) + '\n').encode('utf-8'))
+
+def writeReplacing(fullpath, content):
+    # Files of the working copy may be hard links to other trees, never write into them
+    handle, temporary = tempfile.mkstemp(dir=os.path.dirname(fullpath), prefix='.accurev2git')
+    with os.fdopen(handle, 'wb') as target:
+        target.write(content)
+    os.replace(temporary, fullpath)
+
+class BinaryStore:
+    def __init__(self, localdir, settings=None, storeDir=None):
+        settings = settings or {}
+        self.localdir = localdir
+        # repo holding the store, a worktree of the repo (maintWorktrees.py) uses the store of the main repo
+        self.storeDir = storeDir or localdir
+        self.threshold = settings.get('thresholdMB', DEFAULT_THRESHOLD_MB) * 1024 * 1024
+        self.patterns = settings.get('patterns', DEFAULT_PATTERNS)
+        self.workers = settings.get('workers', HASH_WORKERS)
+        # same matching as the blacklist entries
+        self.patternMatcher = populatePlanner.Blacklist(self.patterns)
+        self.lock = threading.Lock()
+        # bytes kept out of the git object database during this run
+        self.savedBytes = 0
+
+    def _matchesPattern(self, path):
+        return self.patternMatcher.matches(path)
+
+    def selectFiles(self, files):
+        # Relative paths of {relative path: size} to offload, selected by size or by pattern
+        return [path for path, size in files.items()
+                if path != '.gitattributes' and (size >= self.threshold or self._matchesPattern(path))]
+
+    def _offload(self, path):
+        # Returns (size, stored): stored is False when the content was already in the store
+        fullpath = os.path.join(self.localdir, *path.split('/'))
+        size = os.lstat(fullpath).st_size
+        if os.path.islink(fullpath) or isPointer(fullpath, size):
+            return 0, False
+        oid = fileOid(fullpath)
+        target = objectPath(self.storeDir, oid)
+        with self.lock:
+            # two copies of the same binary in one tree must not both be moved. An object of another size was
+            # left incomplete and is stored again.
+            stored = not os.path.isfile(target) or os.path.getsize(target) != size
+            if stored:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                # the content only shows up under the object name once it is complete. On the drive of the
+                # working copy it is moved rather than copied.
+                handle, temporary = tempfile.mkstemp(dir=os.path.dirname(target), prefix='.accurev2git')
+                os.close(handle)
+                try:
+                    os.replace(fullpath, temporary)
+                except OSError:
+                    # a worktree on another drive than the store
+                    shutil.copyfile(fullpath, temporary)
+                    os.remove(fullpath)
+                os.replace(temporary, target)
+        writeReplacing(fullpath, pointerText(oid, size).encode('ascii'))
+        return size, stored
+
+    def offload(self, files):
+        # files maps the relative paths of the populated tree to their size (treeScanner.TreeManifest.files)
+        histogram = extensionHistogram(files)
+        print("Largest file types: " + ", ".join("%s %d files %.1f MB" % (extension, count, size / 1024.0 / 1024.0)
+              for extension, (count, size) in sorted(histogram.items(), key=lambda item: -item[1][1])[:HISTOGRAM_LINES]))
+
+        candidates = self.selectFiles(files)
+        ignored = ignoredPaths(self.localdir, candidates)
+        candidates = [path for path in candidates if path not in ignored]
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = list(pool.map(self._offload, candidates))
+        writeAttributes(self.localdir, self.patterns,
+                        [path for path in candidates if not self._matchesPattern(path)])
+
+        offloaded = [size for size, stored in results if size]
+        storedBytes = sum(size for size, stored in results if stored)
+        savedBytes = sum(offloaded)
+        self.savedBytes += savedBytes
+        print("Moved %d binaries (%.1f MB) to the binary store, %.1f MB of it new, %.1f MB already stored"
+              % (len(offloaded), savedBytes / 1024.0 / 1024.0, storedBytes / 1024.0 / 1024.0,
+                 (savedBytes - storedBytes) / 1024.0 / 1024.0))
+        return savedBytes
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+"""
+contentManifest.py:
+Keep a manifest of every committed file (path, size, modification time, inode, AccuRev element version, git
+blob id) between streams. After a stream is populated, files still holding the stat data they were committed with,
+or populated again with the element version they were committed with, are known to be unchanged without reading
+them. The latter get their previous modification time back, so git add keeps their index entries instead of
+hashing and storing them again.
+Python version 3.6
+"""
+
+import hashlib
+import json
+import os
+import stat
+import subprocess
+import tempfile
+from xml.etree.ElementTree import ParseError
+import accurevParsers
+import populatePlanner
+
+__author__ = "James Newkirk"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+MANIFEST_NAME = 'accurev2git-manifest.json'
+CHUNK_SIZE = 1024 * 1024
+
+def manifestPath(localdir):
+    gitDir = os.path.join(localdir, '.git')
+    if os.path.isfile(gitDir):
+        # a worktree added with git worktree add, its .git file points to its own git directory
+        with open(gitDir, 'r') as gitFile:
+            gitDir = os.path.join(localdir, gitFile.read().split(':', 1)[1].strip())
+    return os.path.join(gitDir, MANIFEST_NAME)
+
+def loadManifest(localdir):
+    # Returns {relative path: [size, mtime in ns, blob id, inode, element version or None]}
+    try:
+        with open(manifestPath(localdir), 'r') as manifestFile:
+            return json.load(manifestFile)
+    except (OSError, ValueError):
+        return {}
+
+def saveManifest(localdir, blobs, versions=None):
+    # blobs maps relative paths ('/' separated) to the git blob id they were committed with, versions maps them
+    # to the element version of listVersions they were populated with
+    versions = versions or {}
+    manifest = {}
+    for path, blob in blobs.items():
+        try:
+            info = os.lstat(os.path.join(localdir, *path.split('/')))
+        except OSError:
+            continue
+        manifest[path] = [info.st_size, info.st_mtime_ns, blob, info.st_ino, versions.get(path)]
+    with open(manifestPath(localdir), 'w') as manifestFile:
+        json.dump(manifest, manifestFile)
+
+def recordFromIndex(localdir, versions=None):
+    # Save the manifest from the index after git add/commit
+    output = subprocess.check_output(["git", "-C", localdir, "ls-files", "-s", "-z"])
+    blobs = {}
+    for entry in output.decode('utf-8', 'surrogateescape').split('\0'):
+        if entry:
+            info, path = entry.split('\t', 1)
+            blobs[path] = info.split(' ')[1]
+    saveManifest(localdir, blobs, versions)
+
+def enableStatReuse(localdir):
+    # Restored modification times are only trusted if git ignores inode and ctime changes
+    subprocess.check_call(["git", "-C", localdir, "config", "core.checkStat", "minimal"])
+    subprocess.check_call(["git", "-C", localdir, "config", "core.trustctime", "false"])
+
+def blobId(fullpath):
+    # Same id "git hash-object" computes for the file
+    digest = hashlib.sha1(("blob %d\0" % os.path.getsize(fullpath)).encode('ascii'))
+    with open(fullpath, 'rb') as source:
+        while True:
+            chunk = source.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def listFiles(localdir):
+    files = []
+    for (path, dirs, names) in os.walk(localdir):
+        if path == localdir and '.git' in dirs:
+            dirs.remove('.git')
+        relative = os.path.relpath(path, localdir).replace(os.sep, '/')
+        for name in names:
+            files.append(name if relative == '.' else relative + '/' + name)
+    return files
+
+def listVersions(session, streamname, transaction):
+    # {relative path: element id and real version} of the files of the stream at the transaction. A file populated
+    # with the element version it was committed with has the content it was committed with. Elements stat reports
+    # no real version for are left out, reuseUnchanged compares their stat data instead.
+    with tempfile.TemporaryFile() as statstream:
+        result = session.run(["stat", "-a", "-fx", "-s", streamname, "-t", transaction], stdout=statstream)
+        if result.returncode != 0:
+            print("Failed to list the elements of stream %s, only files left in place are reused: %s"
+                  % (streamname, result.stderr))
+            return {}
+        statstream.seek(0)
+        try:
+            return dict((populatePlanner.relativePath(element.path), "%s:%s" % (element.eid, element.version))
+                        for element in accurevParsers.iterElements(statstream)
+                        if element.path and not element.isDir and element.version)
+        except ParseError as ex:
+            print("Could not parse the elements of stream %s, only files left in place are reused: %s"
+                  % (streamname, ex))
+            return {}
+
+def reuseUnchanged(localdir, manifest, files=None, versions=None):
+    # Find the unchanged files without reading them. Files with an element version on both sides are reused when the
+    # version is the same, those populated again get their recorded modification time back. Files without one fall
+    # back to the size, modification time and inode they were committed with, so only those left in place are reused.
+    # Returns ({path: blob id} of the reused files, number of files left to hash).
+    if files is None:
+        files = listFiles(localdir)
+    versions = versions or {}
+    reused = {}
+    repopulated = 0
+    for path in files:
+        entry = manifest.get(path)
+        if entry is None:
+            continue
+        fullpath = os.path.join(localdir, *path.split('/'))
+        try:
+            info = os.lstat(fullpath)
+        except OSError:
+            continue
+        size, mtime, blob = entry[0:3]
+        inode, version = (entry[3:5] + [None, None])[0:2]
+        if stat.S_ISLNK(info.st_mode) or info.st_size != size:
+            continue
+        leftInPlace = info.st_mtime_ns == mtime and info.st_ino == inode
+        current = versions.get(path)
+        if version and current:
+            # another element version was populated, even over the file with the same stat data
+            if current != version:
+                continue
+        elif not leftInPlace:
+            continue
+        if not leftInPlace:
+            os.utime(fullpath, ns=(mtime, mtime))
+            repopulated += 1
+        reused[path] = blob
+    rehashed = len(files) - len(reused)
+    print("Reused %d unchanged files (%d left in place, %d populated again), %d files to hash"
+          % (len(reused), len(reused) - repopulated, repopulated, rehashed))
+    return reused, rehashed
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+
+"""
+distributedMigration.py:
+Spread a masterScript.py migration over several hosts. The coordinator (masterScript.py with "distributed" in
+config.json) splits the releases into units, one per release with its Maint chain, and writes them to a queue
+folder every host can reach. Workers claim units from the queue, migrate each one into a repo of its own and
+hand back a git bundle. The coordinator then stitches the bundles into gitRepo: every release commit gets the
+previous release commit as parent, so master, the _Maint branches and the tags come out as a serial run
+creates them. Units completed by an earlier run are kept, running the coordinator again only queues the rest.
+Example args (worker):
+    --accurevuser name
+    --accurevpass pass
+Python version 3.6
+"""
+
+import getopt
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import sys
+import time
+import accurevSession
+import binaryStore
+import masterScript
+import materializer
+import migrationJournal
+import migrationMetrics
+import processRunner
+import snapshotCache
+import transactionCache
+
+__author__ = "Michael C Brown"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+ERR_PARSING_ARGS = 1    # Encounter an error parsing arguments
+ERR_UNKNOWN = 2         # Fail unknown reason
+ERR_GIT = 3             # Failure calling git command
+ERR_REPO = 4            # gitRepo already holds a migration
+ERR_WORKER = 6          # A unit could not be migrated
+
+DEFAULT_WORKERS = 2
+DEFAULT_POLL_SECONDS = 5
+UNIT_PREFIX = 'refs/units/'
+
+def git(args, localdir, input=None):
+    result = processRunner.getRunner().call(["git", "-C", localdir] + args, input=input)
+    if result.returncode != 0:
+        print("Failed to execute command: git " + " ".join(args))
+        print(result.stderr.decode(errors='replace'))
+        sys.exit(ERR_GIT)
+    return result.stdout.decode('utf-8', 'surrogateescape')
+
+def writeJson(path, content):
+    # Written under another name first, readers on other hosts never see half a file
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as jsonFile:
+        json.dump(content, jsonFile, indent=4)
+    os.replace(temporary, path)
+
+def planUnits(data, cache):
+    # One unit per release: the release stream followed by its maintenance streams. The last unit also makes the
+    # binary ignore commit of master.
+    units = []
+    for index, release in enumerate(data['releases']):
+        streams = [release['StreamName']] + [stream['name'] for stream in release['Maint']]
+        units.append({'id': "unit%03d" % index, 'release': release, 'last': index == len(data['releases']) - 1,
+                      'transactions': dict((stream, cache.entries[stream]) for stream in streams)})
+    return units
+
+class WorkQueue:
+    # Folder based queue: units move from pending/ to claimed/ with an atomic rename, so each is handed to a
+    # single worker, and their bundle and result land in done/
+    def __init__(self, path):
+        self.path = path
+        for state in ('pending', 'claimed', 'done'):
+            os.makedirs(os.path.join(self.path, state), exist_ok=True)
+
+    def unitPath(self, state, unitId, extension='.json'):
+        return os.path.join(self.path, state, unitId + extension)
+
+    def result(self, unitId):
+        # Result a worker wrote for the unit, None while it is not done
+        try:
+            with open(self.unitPath('done', unitId), 'r') as resultFile:
+                return json.load(resultFile)
+        except (OSError, ValueError):
+            return None
+
+    def reset(self, units):
+        # Queue every unit without a successful result, units claimed by an interrupted run are queued again
+        for state in ('pending', 'claimed'):
+            for name in os.listdir(os.path.join(self.path, state)):
+                os.remove(os.path.join(self.path, state, name))
+        queued = []
+        for unit in units:
+            result = self.result(unit['id'])
+            if result is not None and result['exitcode'] == 0:
+                print("Unit %s (release %s) was migrated by %s" % (unit['id'], unit['release']['Version'],
+                                                                    result['worker']))
+                continue
+            if result is not None:
+                os.remove(self.unitPath('done', unit['id']))
+            writeJson(self.unitPath('pending', unit['id']), unit)
+            queued.append(unit['id'])
+        return queued
+
+    def claim(self, worker):
+        # Next pending unit, None when there is none left
+        for name in sorted(os.listdir(os.path.join(self.path, 'pending'))):
+            if not name.endswith('.json'):
+                continue
+            claimed = os.path.join(self.path, 'claimed', name)
+            try:
+                os.rename(os.path.join(self.path, 'pending', name), claimed)
+            except OSError:
+                # taken by another worker
+                continue
+            with open(claimed, 'r') as unitFile:
+                unit = json.load(unitFile)
+            print("Worker %s claimed unit %s (release %s)" % (worker, unit['id'], unit['release']['Version']))
+            return unit
+        return None
+
+    def complete(self, unit, worker, exitcode, bundle=None, lfsObjects=None, journal=None):
+        # The bundle and binaries are in place before the result, which marks the unit as done
+        if bundle is not None:
+            shutil.move(bundle, self.unitPath('done', unit['id'], '.bundle'))
+        if lfsObjects is not None and os.path.isdir(lfsObjects):
+            target = self.unitPath('done', unit['id'], '.lfs')
+            if os.path.exists(target):
+                shutil.rmtree(target)
+            shutil.copytree(lfsObjects, target)
+        writeJson(self.unitPath('done', unit['id']), {'worker': worker, 'exitcode': exitcode,
+                                                      'journal': journal or []})
+        os.remove(self.unitPath('claimed', unit['id']))
+
+def buildUnit(accurevuser, accurevpass, data, unit, unitdir):
+    # Migrate the release of the unit and its Maint chain into unitdir, the way masterScript.main does
+    release = unit['release']
+    blacklist = data['blacklist']
+    context = masterScript.MigrationContext(dict(data, gitRepo=unitdir))
+    context.journal = migrationJournal.openJournal(unitdir, False)
+    try:
+        masterScript.startMigrate(accurevuser, accurevpass, unitdir, release['StreamName'], release['ReleaseTag'],
+                                  blacklist, context=context)
+        if release['Maint']:
+            masterScript.createBranch(release['Version'] + "_Maint", unitdir, context)
+            for stream in release['Maint']:
+                masterScript.startMigrate(accurevuser, accurevpass, unitdir, stream['name'], stream['tag'],
+                                          blacklist, context=context)
+            # prevent new binaries from being added to this maintenance branch in future commits
+            masterScript.finishBranch(unitdir, context)
+            masterScript.checkoutBranch("master", unitdir, context)
+        if unit['last']:
+            masterScript.finishBranch(unitdir, context)
+        journal = [list(stage[:6]) for stage in context.journal.entries()]
+    finally:
+        masterScript.finishMigrate(unitdir, context)
+    return journal
+
+def runUnit(accurevuser, accurevpass, data, queue, unit, worker, unitDir):
+    unitdir = os.path.join(unitDir, unit['id'])
+    for path in (unitdir, migrationJournal.journalPath(unitdir)):
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+    # the streams were resolved by the coordinator, they are not queried again
+    cache = transactionCache.getCache()
+    cache.entries.update(unit['transactions'])
+    cache.resolved.update(unit['transactions'])
+    migrationMetrics.start(unitdir)
+    try:
+        journal = buildUnit(accurevuser, accurevpass, data, unit, unitdir)
+        bundle = os.path.join(unitDir, unit['id'] + '.bundle')
+        git(["bundle", "create", bundle, "--all"], unitdir)
+    except SystemExit as exit:
+        print("Unit %s failed with exit code %s" % (unit['id'], exit.code))
+        queue.complete(unit, worker, exit.code or ERR_UNKNOWN)
+        return False
+    except Exception as ex:
+        print(ex)
+        queue.complete(unit, worker, ERR_UNKNOWN)
+        return False
+    finally:
+        migrationMetrics.close()
+    queue.complete(unit, worker, 0, bundle, binaryStore.storePath(unitdir), journal)
+    shutil.rmtree(unitdir, ignore_errors=True)
+    os.remove(migrationJournal.journalPath(unitdir))
+    print("Finished unit %s: %s" % (unit['id'], time.strftime("%I:%M:%S")))
+    return True
+
+def settingsOf(data):
+    settings = data['distributed']
+    return (settings['queueDir'], settings.get('unitDir', data['gitRepo'].rstrip('\\/') + "_units"),
+            settings.get('workers', DEFAULT_WORKERS), settings.get('pollSeconds', DEFAULT_POLL_SECONDS))
+
+def runWorker(accurevuser, accurevpass, data, worker=None):
+    # Migrate units until the queue is empty, returns the number of units which failed
+    accurevSession.DEFAULT_TIMEOUTS.update(data.get('accurevTimeouts', {}))
+    processRunner.LIMITS.update(data.get('processLimits', {}))
+    snapshotCache.configure(data['gitRepo'], data.get('snapshotCache'))
+    queueDir, unitDir, workers, pollSeconds = settingsOf(data)
+    worker = worker or "%s-%d" % (socket.gethostname(), os.getpid())
+    queue = WorkQueue(queueDir)
+    os.makedirs(unitDir, exist_ok=True)
+    failed = 0
+    while True:
+        unit = queue.claim(worker)
+        if unit is None:
+            break
+        if not runUnit(accurevuser, accurevpass, data, queue, unit, worker, unitDir):
+            failed += 1
+    print("Worker %s found no more units: %s" % (worker, time.strftime("%I:%M:%S")))
+    return failed
+
+def localWorker(accurevuser, accurevpass, data, index):
+    # Entry point of the worker processes started by the coordinator
+    runWorker(accurevuser, accurevpass, data, "%s-local%d" % (socket.gethostname(), index))
+
+def rewriteCommit(localdir, raw, parents):
+    # Write the commit again with other parents, the tree, author, committer and message are kept
+    header, message = raw.split(b'\n\n', 1)
+    lines = [line for line in header.split(b'\n') if not line.startswith(b'parent ')]
+    lines[1:1] = [b'parent ' + parent.encode('ascii') for parent in parents]
+    content = b'\n'.join(lines) + b'\n\n' + message
+    return git(["hash-object", "-t", "commit", "-w", "--stdin"], localdir, input=content).strip()
+
+def readCommits(localdir, shas):
+    # {sha: raw commit} of the commits, read with a single git cat-file
+    output = processRunner.getRunner().call(["git", "-C", localdir, "cat-file", "--batch"],
+                                            input=''.join(sha + '\n' for sha in shas).encode('ascii')).stdout
+    commits = {}
+    position = 0
+    while position < len(output):
+        end = output.index(b'\n', position)
+        sha, kind, size = output[position:end].decode('ascii').split(' ')
+        commits[sha] = output[end + 1:end + 1 + int(size)]
+        position = end + 1 + int(size) + 1
+    return commits
+
+def stitchUnit(localdir, unit, bundle, seed):
+    # Fetch the bundle of the unit and write its commits again on top of seed, the master commit of the previous
+    # unit. Branches and tags are moved to the new commits. Returns ({unit commit: commit in gitRepo}, master).
+    prefix = UNIT_PREFIX + unit['id'] + '/'
+    git(["fetch", "-q", bundle, "+refs/heads/*:%sheads/*" % prefix, "+refs/tags/*:%stags/*" % prefix], localdir)
+    order = git(["rev-list", "--reverse", "--topo-order", "--parents", "--glob=" + prefix + "heads/*"],
+                localdir).split('\n')
+    order = [line.split(' ') for line in order if line]
+    commits = readCommits(localdir, [line[0] for line in order])
+    rewritten = {}
+    for line in order:
+        parents = [rewritten[parent] for parent in line[1:]] or ([seed] if seed else [])
+        rewritten[line[0]] = rewriteCommit(localdir, commits[line[0]], parents)
+    refs = git(["for-each-ref", "--format=%(objectname) %(refname)", prefix], localdir).split('\n')
+    updates = []
+    master = None
+    for line in refs:
+        if not line:
+            continue
+        sha, ref = line.split(' ', 1)
+        name = ref[len(prefix):]
+        if name == 'heads/master':
+            # master only moves once every unit is stitched
+            master = rewritten[sha]
+        else:
+            updates.append("update refs/%s %s\n" % (name, rewritten[sha]))
+        updates.append("delete %s\n" % ref)
+    git(["update-ref", "--stdin"], localdir, input=''.join(updates).encode('utf-8'))
+    return rewritten, master
+
+def coordinate(accurevuser, accurevpass, data, refreshTransactions=False):
+    localdir = data['gitRepo']
+    queueDir, unitDir, workers, pollSeconds = settingsOf(data)
+    migrationMetrics.start(localdir)
+    cache = transactionCache.getCache()
+    if refreshTransactions:
+        cache.refresh()
+    with migrationMetrics.span('resolveTransactions'):
+        cache.resolve(accurevSession.getSession(accurevuser, accurevpass), masterScript.configStreams(data))
+    units = planUnits(data, cache)
+    queue = WorkQueue(queueDir)
+    queued = queue.reset(units)
+    print("Queued %d of %d units in %s" % (len(queued), len(units), queueDir))
+
+    processes = []
+    if queued:
+        spawn = multiprocessing.get_context('spawn')
+        for index in range(min(workers, len(queued))):
+            process = spawn.Process(target=localWorker, args=(accurevuser, accurevpass, data, index))
+            process.start()
+            processes.append(process)
+    with migrationMetrics.span('distributedUnits', units=len(queued), workers=len(processes)):
+        pending = set(unit['id'] for unit in units if queue.result(unit['id']) is None)
+        while pending:
+            for unitId in sorted(pending):
+                if queue.result(unitId) is not None:
+                    print("Unit %s done: %s" % (unitId, time.strftime("%I:%M:%S")))
+                    pending.discard(unitId)
+            if pending:
+                time.sleep(pollSeconds)
+        for process in processes:
+            process.join()
+    failed = [unit['id'] for unit in units if queue.result(unit['id'])['exitcode'] != 0]
+    if failed:
+        print("Units %s failed, run the migration again to retry them" % ", ".join(failed))
+        sys.exit(ERR_WORKER)
+    stitch(localdir, data, units, queue)
+
+def stitch(localdir, data, units, queue):
+    print("Stitching %d units into %s: %s" % (len(units), localdir, time.strftime("%I:%M:%S")))
+    os.makedirs(localdir, exist_ok=True)
+    git(["init", "-q"], localdir)
+    if git(["for-each-ref", "refs/heads/master"], localdir).strip():
+        print("%s already holds a master branch, the units are stitched into a new repo only" % localdir)
+        sys.exit(ERR_REPO)
+    journal = migrationJournal.openJournal(localdir, False)
+    seed = None
+    with migrationMetrics.span('stitch', units=len(units)):
+        for unit in units:
+            rewritten, seed = stitchUnit(localdir, unit, queue.unitPath('done', unit['id'], '.bundle'), seed)
+            # the journal of the unit, with the commits of gitRepo, lets verifyMigration.py and --resume use it
+            for step, stage, stream, transactionId, sha, branch in queue.result(unit['id'])['journal']:
+                journal.record(step, stage, stream, transactionId, rewritten.get(sha, sha), branch)
+            lfsObjects = queue.unitPath('done', unit['id'], '.lfs')
+            if os.path.isdir(lfsObjects):
+                mergeObjects(lfsObjects, binaryStore.storePath(localdir))
+        git(["update-ref", "refs/heads/master", seed], localdir)
+    journal.close()
+    masterScript.gitCallHandler(["reset", "--hard", "-q"], localdir)
+    if 'sharedObjectStore' in data:
+        settings = data['sharedObjectStore']
+        masterScript.sharedStore.SharedStore(settings['path'], settings.get('name')).publish(localdir)
+    print("Stitched master, %d _Maint branches and the tags: %s"
+          % (sum(1 for unit in units if unit['release']['Maint']), time.strftime("%I:%M:%S")))
+
+def mergeObjects(source, target):
+    # Copy the binaries of a unit into the store of gitRepo, binaries already stored are skipped
+    for path, dirs, names in os.walk(source):
+        for name in names:
+            destination = os.path.join(target, os.path.relpath(os.path.join(path, name), source))
+            if not os.path.exists(destination):
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                # stored binaries are never written to
+                materializer.getMaterializer().place(os.path.join(path, name), destination, linkable=True)
+
+def parse_arguments(argv):
+    try:
+        print("Importing arguments")
+        opts, args = getopt.getopt(argv, "", ["accurevuser=",
+                                              "accurevpass="])
+    except Exception as e:
+        print(e)
+        sys.exit(ERR_PARSING_ARGS)
+
+    for opt, arg in opts:
+        if opt == '--accurevuser':
+            accurevuser = arg
+        elif opt == '--accurevpass':
+            accurevpass = arg
+    try:
+        print("Finished importing arguments")
+        return {'username': accurevuser, 'password': accurevpass}
+    except UnboundLocalError as e:
+        print("Could not find necessary arguments. Exiting . . . ")
+        print(e)
+        sys.exit(ERR_PARSING_ARGS)
+
+def main(accurevuser, accurevpass):
+    # Worker: migrate the units queued by the coordinator, config.json must name the same queueDir
+    print("Starting distributedMigration.py: %s" % time.strftime("%I:%M:%S"))
+    failed = runWorker(accurevuser, accurevpass, masterScript.parseConfigFile())
+    print("Finished distributedMigration.py: %s" % time.strftime("%I:%M:%S"))
+    sys.exit(ERR_WORKER if failed else 0)
+
+
+if __name__ == '__main__':
+    arguments = parse_arguments(sys.argv[1:])
+    main(arguments['username'], arguments['password'])
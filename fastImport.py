@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+"""
+fastImport.py:
+Commit backend which streams populated trees into a long-lived "git fast-import" process instead of
+running "git add" and "git commit" on the working copy. Creates the same commits, tags and branches.
+Python version 3.6
+"""
+
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import migrationMetrics
+
+__author__ = "James Newkirk"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+ERR_GIT = 3                   # Encounter an error calling a git command
+
+AUTHOR = "GeneralUser <GeneralUser@ptc.com>"
+CHUNK_SIZE = 1024 * 1024
+
+def quotePath(path):
+    # fast-import requires C-style quoting for paths starting with a quote or containing a line feed
+    if path.startswith('"') or '\n' in path:
+        return '"' + path.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+    return path
+
+def listWorkingTree(dirname):
+    # Paths (relative, '/' separated) that "git add" would pick up, honoring the .gitignore files.
+    # An empty temporary index makes every non-ignored file show up as untracked without hashing anything.
+    indexDir = tempfile.mkdtemp()
+    try:
+        env = dict(os.environ, GIT_INDEX_FILE=os.path.join(indexDir, 'index'))
+        output = migrationMetrics.runProcess(subprocess.check_output,
+                                             ["git", "-C", dirname, "ls-files", "-z", "--others", "--exclude-standard"],
+                                             env=env)
+    finally:
+        os.rmdir(indexDir)
+    return [path for path in output.decode('utf-8', 'surrogateescape').split('\0') if path]
+
+def configValue(dirname, key):
+    with open(os.devnull, 'w') as silent:
+        try:
+            return subprocess.check_output(["git", "-C", dirname, "config", "--get", key],
+                                           stderr=silent).decode('utf-8').strip()
+        except subprocess.CalledProcessError:
+            return None
+
+def committerIdentity(dirname):
+    # The committer git commit records in the repo, AUTHOR when user.name or user.email is not configured
+    name = configValue(dirname, 'user.name')
+    email = configValue(dirname, 'user.email')
+    return "%s <%s>" % (name, email) if name and email else AUTHOR
+
+class FastImporter:
+    def __init__(self, dirname, branch="master"):
+        self.dirname = dirname
+        self.currentBranch = branch
+        self.committer = committerIdentity(dirname)
+        self.heads = {}
+        self.nextMark = 1
+        self.lastBlobs = {}
+        self.process = subprocess.Popen(["git", "-C", dirname, "fast-import", "--quiet", "--done"],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        migrationMetrics.processStarted()
+        print("Started git fast-import in %s" % dirname)
+
+    def _write(self, text):
+        self.process.stdin.write(text.encode('utf-8', 'surrogateescape'))
+
+    def _mark(self):
+        mark = self.nextMark
+        self.nextMark += 1
+        return mark
+
+    def _refExists(self, ref):
+        with open(os.devnull, 'w') as silent:
+            return subprocess.call(["git", "-C", self.dirname, "rev-parse", "--verify", "-q", ref],
+                                   stdout=silent, stderr=silent) == 0
+
+    def _fileMode(self, fullpath):
+        if os.path.islink(fullpath):
+            return "120000"
+        if os.name != 'nt' and os.access(fullpath, os.X_OK):
+            return "100755"
+        return "100644"
+
+    def _writeFile(self, path, knownBlob=None):
+        # Returns the git blob id of the file. A known blob id is referenced instead of sending the content again.
+        fullpath = os.path.join(self.dirname, *path.split('/'))
+        mode = self._fileMode(fullpath)
+        if knownBlob is not None:
+            self._write("M %s %s %s\n" % (mode, knownBlob, quotePath(path)))
+            return knownBlob
+        self._write("M %s inline %s\n" % (mode, quotePath(path)))
+        if mode == "120000":
+            target = os.readlink(fullpath).replace('\\', '/').encode('utf-8', 'surrogateescape')
+            self._write("data %d\n" % len(target))
+            self.process.stdin.write(target + b"\n")
+            return hashlib.sha1(b"blob %d\0" % len(target) + target).hexdigest()
+        size = os.path.getsize(fullpath)
+        digest = hashlib.sha1(b"blob %d\0" % size)
+        self._write("data %d\n" % size)
+        with open(fullpath, 'rb') as source:
+            while True:
+                chunk = source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                self.process.stdin.write(chunk)
+        self._write("\n")
+        return digest.hexdigest()
+
+    def _startCommit(self, message, author=None, timestamp=None):
+        mark = self._mark()
+        now = "%d %s" % (int(time.time()), time.strftime("%z") or "+0000")
+        stamp = "%d +0000" % int(timestamp) if timestamp is not None else now
+        encoded = message.encode('utf-8')
+        self._write("commit refs/heads/%s\nmark :%d\nauthor %s %s\ncommitter %s %s\ndata %d\n"
+                    % (self.currentBranch, mark, author or AUTHOR, stamp, self.committer, now, len(encoded)))
+        self.process.stdin.write(encoded + b"\n")
+        if self.currentBranch in self.heads:
+            self._write("from :%d\n" % self.heads[self.currentBranch])
+        elif self._refExists("refs/heads/" + self.currentBranch):
+            # continue a branch which was committed before this import started
+            self._write("from refs/heads/%s^0\n" % self.currentBranch)
+        self.heads[self.currentBranch] = mark
+        return mark
+
+    # Commit the whole working tree as the new content of the current branch.
+    # knownBlobs maps paths whose content is known to be unchanged to their blob id.
+    # The blob id of every committed path is kept in lastBlobs afterwards.
+    def commitTree(self, message, knownBlobs=None):
+        knownBlobs = knownBlobs or {}
+        paths = listWorkingTree(self.dirname)
+        mark = self._startCommit(message)
+        self._write("deleteall\n")
+        self.lastBlobs = {}
+        for path in paths:
+            self.lastBlobs[path] = self._writeFile(path, knownBlobs.get(path))
+        self._write("\n")
+        print("Committed %d files to %s" % (len(paths), self.currentBranch))
+        return mark
+
+    # Commit only the given relative paths on top of the current branch.
+    # author ("Name <email>") and timestamp (seconds since the epoch) default to GeneralUser and now.
+    def commitChanges(self, message, changed=(), removed=(), author=None, timestamp=None):
+        mark = self._startCommit(message, author, timestamp)
+        for path in removed:
+            self._write("D %s\n" % quotePath(path))
+        for path in changed:
+            self._writeFile(path)
+        self._write("\n")
+        return mark
+
+    def tag(self, tag):
+        self._write("reset refs/tags/%s\nfrom :%d\n\n" % (tag, self.heads[self.currentBranch]))
+
+    def createBranch(self, branch, base=None):
+        # equivalent of "git checkout -b branch base", base defaults to the current branch.
+        # The working tree is left untouched.
+        base = base or self.currentBranch
+        if base in self.heads:
+            self._write("reset refs/heads/%s\nfrom :%d\n\n" % (branch, self.heads[base]))
+            self.heads[branch] = self.heads[base]
+        else:
+            self._write("reset refs/heads/%s\nfrom refs/heads/%s^0\n\n" % (branch, base))
+        self.currentBranch = branch
+
+    def checkout(self, branch):
+        # only switches the branch new commits go to, the working tree is left untouched
+        self.currentBranch = branch
+
+    def checkpoint(self):
+        # Write out the pack and update the refs, returns once git fast-import has done so
+        self._write("checkpoint\nprogress checkpoint %d\n" % self.nextMark)
+        with migrationMetrics.waiting():
+            self.process.stdin.flush()
+            while True:
+                line = self.process.stdout.readline()
+                if not line:
+                    print("git fast-import failed in %s" % self.dirname)
+                    sys.exit(ERR_GIT)
+                if line.startswith(b"progress checkpoint"):
+                    return
+
+    def close(self):
+        self._write("done\n")
+        with migrationMetrics.waiting():
+            self.process.stdin.close()
+            returncode = self.process.wait()
+        if returncode != 0:
+            print("git fast-import failed in %s" % self.dirname)
+            sys.exit(ERR_GIT)
+        print("Finished git fast-import in %s" % self.dirname)
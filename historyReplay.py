@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+
+"""
+historyReplay.py:
+Replay the history of an AccuRev stream into the checked out git branch, one commit per transaction with the
+original author, time and comment. Each transaction only downloads the elements it changed. The last replayed
+transaction is kept in the .git folder, so a later run continues where the previous one stopped.
+Example args:
+    --accurevStreamName ExampleaccurevStreamName
+    --startTransaction 1200
+    --endTransaction 4500
+    --accurevuser name
+    --accurevpass pass
+Python version 3.6
+"""
+
+import bisect
+import getopt
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from xml.etree.ElementTree import ParseError
+import accurevParsers
+import accurevSession
+import fastImport
+import materializer
+import masterScript
+import populatePlanner
+import transactionCache
+
+__author__ = "James Newkirk"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+ERR_PARSING_ARGS = 1    # Encounter an error parsing arguments
+ERR_UNKNOWN = 2         # Fail unknown reason
+ERR_ACCUREV = 3         # Error communicating with Accurev
+ERR_GIT = 4             # Failure calling git command
+
+STATE_NAME = 'accurev2git-history.json'
+# transactions requested from accurev hist at once, only one window is held in memory
+HIST_WINDOW = 500
+# transactions committed between two git fast-import checkpoints
+CHECKPOINT_INTERVAL = 1000
+DEFAULT_AUTHOR_DOMAIN = 'ptc.com'
+
+def statePath(localdir):
+    return os.path.join(localdir, '.git', STATE_NAME)
+
+def loadState(localdir):
+    try:
+        with open(statePath(localdir), 'r') as stateFile:
+            return json.load(stateFile)
+    except (OSError, ValueError):
+        return {}
+
+def saveState(localdir, state):
+    with open(statePath(localdir), 'w') as stateFile:
+        json.dump(state, stateFile, indent=4, sort_keys=True)
+
+def currentBranch(localdir):
+    return subprocess.check_output(["git", "-C", localdir, "symbolic-ref", "--short", "HEAD"]).decode().strip()
+
+def restoreCheckpoint(localdir):
+    # Put the working copy back on the last commit of the branch. An interrupted replay leaves the transactions
+    # replayed after its last checkpoint in the working copy without committing them.
+    for command in (["reset", "--hard", "-q"], ["clean", "-fdxq"]):
+        if subprocess.call(["git", "-C", localdir] + command) != 0:
+            print("Failed to restore the working copy of %s to its last commit" % localdir)
+            sys.exit(ERR_GIT)
+
+def hasCommits(localdir):
+    with open(os.devnull, 'w') as silent:
+        return subprocess.call(["git", "-C", localdir, "rev-parse", "--verify", "-q", "HEAD"],
+                               stdout=silent, stderr=silent) == 0
+
+class IgnoreChecker:
+    # One "git check-ignore" process answering for every path of the replay, so the .gitignore files
+    # of the working copy apply the same way as to a snapshot commit
+    def __init__(self, localdir):
+        self.process = subprocess.Popen(["git", "-C", localdir, "check-ignore", "--stdin", "-z", "-v", "-n"],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def _field(self):
+        field = b""
+        while True:
+            char = self.process.stdout.read(1)
+            if char in (b"\0", b""):
+                return field
+            field += char
+
+    def isIgnored(self, path):
+        self.process.stdin.write(path.encode('utf-8', 'surrogateescape') + b"\0")
+        self.process.stdin.flush()
+        source, line, pattern, name = [self._field() for i in range(4)]
+        # negated patterns ("!name") match but keep the path
+        return source != b"" and not pattern.startswith(b"!")
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+class PathIndex:
+    # Relative path of each element id. The paths are also kept sorted, so the elements below a folder are found
+    # by bisection and a move or removal only visits the folder's own subtree.
+    def __init__(self, paths=None):
+        self.eids = dict((path, eid) for eid, path in dict(paths or {}).items())
+        self.paths = dict((eid, path) for path, eid in self.eids.items())
+        self.sorted = sorted(self.eids)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def get(self, eid):
+        return self.paths.get(eid)
+
+    def _below(self, path):
+        # slice of self.sorted holding the paths below path, '0' follows '/'
+        return slice(bisect.bisect_left(self.sorted, path + '/'), bisect.bisect_left(self.sorted, path + '0'))
+
+    def _drop(self, path):
+        del self.paths[self.eids.pop(path)]
+        del self.sorted[bisect.bisect_left(self.sorted, path)]
+
+    def __setitem__(self, eid, path):
+        if self.paths.get(eid) == path:
+            return
+        if eid in self.paths:
+            self._drop(self.paths[eid])
+        if path in self.eids:
+            # an element replacing another one at the same path
+            self._drop(path)
+        self.paths[eid] = path
+        self.eids[path] = eid
+        bisect.insort(self.sorted, path)
+
+    def move(self, oldPath, newPath):
+        # Give the elements below oldPath their path below newPath
+        below = self._below(oldPath)
+        moved = self.sorted[below]
+        del self.sorted[below]
+        renamed = [newPath + path[len(oldPath):] for path in moved]
+        for path, newName in zip(moved, renamed):
+            eid = self.eids.pop(path)
+            if newName in self.eids:
+                self._drop(newName)
+            self.paths[eid] = newName
+            self.eids[newName] = eid
+        # the renamed paths share a prefix and keep their order
+        position = bisect.bisect_left(self.sorted, newPath + '/')
+        self.sorted[position:position] = renamed
+
+    def forget(self, path):
+        # Drop the element at path and the elements below it
+        below = self._below(path)
+        for known in self.sorted[below]:
+            del self.paths[self.eids.pop(known)]
+        del self.sorted[below]
+        if path in self.eids:
+            self._drop(path)
+
+class HistoryReplay:
+    def __init__(self, session, streamname, localdir, blacklist, authorDomain=DEFAULT_AUTHOR_DOMAIN):
+        self.session = session
+        self.streamname = streamname
+        self.localdir = localdir
+        self.blacklist = populatePlanner.Blacklist(blacklist)
+        self.authorDomain = authorDomain
+        # PathIndex of the elements at the last replayed transaction
+        self.paths = PathIndex()
+        self.commits = 0
+        self.fetchedElements = 0
+
+    def _local(self, relative):
+        return os.path.join(self.localdir, *relative.split('/'))
+
+    def loadElements(self, transaction):
+        # Element ids and paths of the stream at the transaction the replay starts from
+        with tempfile.TemporaryFile() as statstream:
+            result = self.session.run(["stat", "-a", "-fx", "-s", self.streamname, "-t", transaction],
+                                      stdout=statstream)
+            if result.returncode != 0:
+                print("Failed to list the elements of stream %s: %s" % (self.streamname, result.stderr))
+                sys.exit(ERR_ACCUREV)
+            statstream.seek(0)
+            self.paths = PathIndex((element.eid, populatePlanner.relativePath(element.path))
+                                   for element in accurevParsers.iterElements(statstream) if element.path)
+        print("Stream %s has %d elements at transaction %s" % (self.streamname, len(self.paths), transaction))
+
+    def transactions(self, start, end):
+        # Transactions start to end (inclusive) in ascending order, requested window by window
+        for low in range(start, end + 1, HIST_WINDOW):
+            high = min(low + HIST_WINDOW - 1, end)
+            with tempfile.TemporaryFile() as histstream:
+                result = self.session.run(["hist", "-fx", "-s", self.streamname, "-t", "%d-%d" % (high, low)],
+                                          stdout=histstream)
+                if result.returncode != 0:
+                    print("Failed to read the history of stream %s: %s" % (self.streamname, result.stderr))
+                    sys.exit(ERR_ACCUREV)
+                histstream.seek(0)
+                try:
+                    window = [transaction for transaction in accurevParsers.iterTransactions(histstream)
+                              if transaction.versions]
+                except ParseError as ex:
+                    print("Could not parse the history of stream %s: %s" % (self.streamname, ex))
+                    sys.exit(ERR_ACCUREV)
+            for transaction in sorted(window, key=lambda t: int(t.id)):
+                yield transaction
+
+    def apply(self, transaction):
+        # Update the working copy with the elements of one transaction.
+        # Returns the (changed, removed) relative paths, changed paths may be directories.
+        download = []
+        changed = []
+        removed = []
+        for version in transaction.versions:
+            path = populatePlanner.relativePath(version.path)
+            previous = self.paths.get(version.eid)
+            if transaction.type == 'defunct':
+                removed.append(path)
+                masterScript.DownloadAccurevStream.removeLocalPath(self._local(path))
+                self.paths.forget(path)
+                continue
+            moved = previous is not None and previous != path
+            if moved:
+                removed.append(previous)
+            if version.isDir and moved:
+                self.paths.move(previous, path)
+                if os.path.isdir(self._local(previous)):
+                    # a moved directory keeps its content, its changed elements are part of the transaction
+                    os.makedirs(os.path.dirname(self._local(path)), exist_ok=True)
+                    os.rename(self._local(previous), self._local(path))
+                    changed.append(path)
+                else:
+                    # left out where it was, by the blacklist for instance
+                    download.append(path)
+            elif not version.isDir or previous is None:
+                if moved:
+                    masterScript.DownloadAccurevStream.removeLocalPath(self._local(previous))
+                download.append(path)
+            self.paths[version.eid] = path
+
+        download = [path for path in download if not self.blacklist.excludes(path)]
+        if download:
+            self._populate(transaction.id, download)
+        return changed + download, removed
+
+    def _populate(self, transactionId, paths):
+        materializer.detach([self._local(path) for path in paths])
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as populateList:
+            populateList.write('\n'.join('/./' + path for path in paths) + '\n')
+        try:
+            result = self.session.run(["pop", "-R", "-O", "-v" + self.streamname, "-L" + self.localdir,
+                                       "-t" + transactionId, "-l", populateList.name])
+        finally:
+            os.remove(populateList.name)
+        if result.returncode != 0:
+            print("Failed to download transaction %s of stream %s from AccuRev!" % (transactionId, self.streamname))
+            print(result.stderr)
+            sys.exit(ERR_ACCUREV)
+        self.fetchedElements += len(paths)
+
+    def changedFiles(self, changed, ignoreChecker):
+        # Files to commit for the changed paths, directories are expanded
+        files = []
+        for path in changed:
+            fullpath = self._local(path)
+            if os.path.isdir(fullpath) and not os.path.islink(fullpath):
+                for (dirpath, dirs, names) in os.walk(fullpath):
+                    relative = os.path.relpath(dirpath, self.localdir).replace(os.sep, '/')
+                    files.extend(relative + '/' + name for name in names)
+            elif os.path.lexists(fullpath):
+                files.append(path)
+        return [path for path in files if not self.blacklist.excludes(path) and not ignoreChecker.isIgnored(path)]
+
+    def author(self, user):
+        return "%s <%s@%s>" % (user, user, self.authorDomain)
+
+    def message(self, transaction):
+        comment = transaction.comment or "AccuRev %s transaction" % transaction.type
+        return comment + '\n\nTransaction Number: ' + transaction.id
+
+    def replay(self, importer, start, end, state, stateKey):
+        ignoreChecker = IgnoreChecker(self.localdir)
+        try:
+            for transaction in self.transactions(start, end):
+                changed, removed = self.apply(transaction)
+                importer.commitChanges(self.message(transaction), self.changedFiles(changed, ignoreChecker), removed,
+                                       self.author(transaction.user), int(transaction.time))
+                self.commits += 1
+                if self.commits % CHECKPOINT_INTERVAL == 0:
+                    importer.checkpoint()
+                    state[stateKey] = transaction.id
+                    saveState(self.localdir, state)
+                    print("Replayed transaction %s of stream %s: %s"
+                          % (transaction.id, self.streamname, time.strftime("%I:%M:%S")))
+        finally:
+            ignoreChecker.close()
+
+def parse_arguments(argv):
+    try:
+        print("Importing arguments")
+        opts, args = getopt.getopt(argv, "", ["accurevStreamName=",
+                                              "startTransaction=",
+                                              "endTransaction=",
+                                              "accurevuser=",
+                                              "accurevpass="])
+    except Exception as e:
+        print(e)
+        sys.exit(ERR_PARSING_ARGS)
+
+    startTransaction = None
+    endTransaction = None
+    for opt, arg in opts:
+        if opt == '--accurevStreamName':
+            accurevStreamName = arg
+        elif opt == '--startTransaction':
+            startTransaction = arg
+        elif opt == '--endTransaction':
+            endTransaction = arg
+        elif opt == '--accurevuser':
+            accurevuser = arg
+        elif opt == '--accurevpass':
+            accurevpass = arg
+
+    print("Finished importing arguments")
+    return {'accurevStreamName': accurevStreamName, 'startTransaction': startTransaction,
+            'endTransaction': endTransaction, 'username': accurevuser, 'password': accurevpass}
+
+def main(accurevStreamName, username, password, startTransaction=None, endTransaction=None):
+    # Without startTransaction the replay continues after the last transaction replayed on the branch.
+    # A branch without commits first gets the whole stream at startTransaction.
+    print("Starting historyReplay.py: %s" % time.strftime("%I:%M:%S"))
+    data = masterScript.parseConfigFile()
+    localdir = data['gitRepo']
+    session = accurevSession.getSession(username, password)
+    session.login()
+    branch = currentBranch(localdir) if os.path.isdir(localdir) else "master"
+    stateKey = branch + ':' + accurevStreamName
+    state = loadState(localdir) if os.path.isdir(localdir) else {}
+
+    if endTransaction is None:
+        endTransaction = transactionCache.queryTransaction(session, accurevStreamName)
+    if startTransaction is None:
+        if stateKey not in state:
+            print("No replayed history of stream %s on branch %s, give --startTransaction" % (accurevStreamName, branch))
+            sys.exit(ERR_PARSING_ARGS)
+        base = state[stateKey]
+    else:
+        base = startTransaction
+
+    if not os.path.isdir(localdir) or not hasCommits(localdir):
+        # the first commit holds the complete stream, the following ones one transaction each
+        masterScript.DownloadAccurevStream.create_directory(localdir)
+        result = session.run(["pop", "-R", "-v" + accurevStreamName, "-L" + localdir, "-t" + base, ".\\"])
+        if result.returncode != 0:
+            print("Failed to download stream %s at transaction %s: %s" % (accurevStreamName, base, result.stderr))
+            sys.exit(ERR_ACCUREV)
+        masterScript.CopyGitIgnore(localdir)
+        masterScript.postProcess(localdir, data['blacklist'])
+        importer = fastImport.FastImporter(localdir, branch)
+        importer.commitTree("Stream %s at transaction %s\n\nTransaction Number: %s" % (accurevStreamName, base, base))
+    else:
+        restoreCheckpoint(localdir)
+        importer = fastImport.FastImporter(localdir, branch)
+
+    replay = HistoryReplay(session, accurevStreamName, localdir, data['blacklist'],
+                           data.get('authorDomain', DEFAULT_AUTHOR_DOMAIN))
+    try:
+        replay.loadElements(base)
+        replay.replay(importer, int(base) + 1, int(endTransaction), state, stateKey)
+        importer.close()
+    except Exception as ex:
+        print(ex)
+        sys.exit(ERR_UNKNOWN)
+    state[stateKey] = str(endTransaction)
+    saveState(localdir, state)
+    if subprocess.call(["git", "-C", localdir, "reset", "--hard", "-q"]) != 0:
+        print("Failed to update the working copy of %s" % localdir)
+        sys.exit(ERR_GIT)
+    print("Replayed %d transactions of stream %s (%d elements downloaded) up to transaction %s"
+          % (replay.commits, accurevStreamName, replay.fetchedElements, endTransaction))
+    print("Finishing historyReplay.py: %s" % time.strftime("%I:%M:%S"))
+
+
+if __name__ == '__main__':
+    arguments = parse_arguments(sys.argv[1:])
+    main(arguments['accurevStreamName'], arguments['username'], arguments['password'],
+         arguments['startTransaction'], arguments['endTransaction'])
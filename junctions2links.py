@@ -9,10 +9,11 @@ Example args:
 """
 
 import os
-from subprocess import call
 import sys
 import time
 import getopt
+import reparsePoints
+import treeScanner
 
 __author__ = "Kiersten Marr"
 __copyright__ = "Copyright 2018, PTC, Inc."
@@ -20,53 +21,34 @@ __copyright__ = "Copyright 2018, PTC, Inc."
 ERR_PARSING_ARGS = 1    # Encounter an error parsing arguments
 ERR_UNKNOWN = 2         # Fail unknown reason
 
-def findJunctions(rpath):
-    for (path, dirs, files) in os.walk(rpath, topdown = True, followlinks = False):
-        nonJunctionDirs=[]
-        for d in dirs:
-            # if filestream.txt already exists
-            try:
-                os.remove('filestream.txt')
-            except OSError:
-                pass
-            # ran into issues with String.IO, had to use text file
-            with open('filestream.txt', 'w+') as filestream:
-                with open(os.devnull, 'w') as silent:
-                    fullpath = os.path.join(path, d)
-                    if call(["fsutil", "reparsepoint", "query", fullpath], stdout=filestream, stderr=silent) == 0:
-                        target = str(getTarget(fullpath))
-                        # if already symbolic link, target may return None
-                        if target != "None":
-                            symlinkCreate(fullpath, target, path)
-                    else:
-                        nonJunctionDirs.append(d)
-                # Erase previous file contents so that new output of fsutil reparsepoint can
-                # write in new output for next path checked.
-                filestream.seek(0)
-                filestream.truncate()
-
-        dirs[:] = nonJunctionDirs
-
-def getTarget(path):
-    with open('filestream.txt', 'r') as file:
-        for line in file.readlines():
-            searchString = "\\??\\"
-            if "Substitute" in line and searchString in line:
-                stringPlace = line.find(searchString)
-                start = stringPlace + len(searchString)
-                target = line[start:].strip()
-                return target
-
-def symlinkCreate(fullpath, target, path):
-    with open(os.devnull, 'w') as silent:
-        # delete junction w/o removing destination
-        call(["fsutil", "reparsepoint", "delete", fullpath], stdout=silent, stderr=silent)
-        os.rmdir(fullpath)
-
-        relativePath = os.path.relpath(target, path)
-
-        call(["mklink", "/d", fullpath, relativePath], stdout=silent, stderr=silent, shell=True)
-        print("Success: A link was created from " + fullpath + " to " + target)
+class JunctionHandler(treeScanner.ScanHandler):
+    # Converts the junctions met by a treeScanner.TreeScanner into symbolic links once the scan is done,
+    # so a detector starting processes can look up and convert all of them at the same time
+    stage = 'junctions'
+
+    def __init__(self, detector):
+        self.detector = detector
+        self.reparsePoints = []
+
+    def reparsePoint(self, scanner, path, relative):
+        self.reparsePoints.append((path, relative))
+
+    def finish(self, scanner):
+        targets = self.detector.junctionTargets([path for path, relative in self.reparsePoints])
+        # if already symbolic link, there is no junction target
+        junctions = [(path, relative, target) for (path, relative), target in zip(self.reparsePoints, targets)
+                     if target is not None]
+        self.reparsePoints = []
+        self.detector.convertJunctions([(path, os.path.relpath(target, os.path.dirname(path)))
+                                        for path, relative, target in junctions])
+        for path, relative, target in junctions:
+            print("Success: A link was created from " + path + " to " + target)
+            if os.path.islink(path):
+                scanner.manifest.links[relative] = os.readlink(path)
+
+def findJunctions(rpath, detector=None):
+    detector = detector or reparsePoints.getDetector()
+    treeScanner.scanTree(rpath, [JunctionHandler(detector)], detector)
 
 def parse_arguments(argv):
     try:
@@ -84,18 +66,17 @@ def parse_arguments(argv):
     print("Finished importing arguments")
     return dirname
 
-def main(rpath):
+def main(rpath, detector=None):
     try:
         print("Starting junctions2links.py: %s" % time.strftime("%I:%M:%S"))
-        findJunctions(rpath)
+        detector = detector or reparsePoints.getDetector()
+        findJunctions(rpath, detector)
+        if detector.subprocessCalls:
+            print("Started %d processes to inspect reparse points" % detector.subprocessCalls)
     except Exception as ex:
         print(ex)
         sys.exit(ERR_UNKNOWN)
     finally:
-        try:
-            os.remove('filestream.txt')
-        except OSError:
-            pass
         print("Finished junctions2links.py: %s" % time.strftime("%I:%M:%S"))
 
 
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+"""
+maintWorktrees.py:
+Build the _Maint branches of masterScript.py in parallel. Once a release is committed on master its maintenance
+branch no longer depends on the rest of the migration, so the branch is created at the release commit and its
+maintenance streams are migrated in a git worktree of its own by a worker process while master carries on with
+the next release in the main working copy.
+Python version 3.6
+"""
+
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+import accurevSession
+import binaryStore
+import masterScript
+import migrationJournal
+import migrationMetrics
+import processRunner
+import snapshotCache
+import transactionCache
+
+__author__ = "Kiersten Marr"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+ERR_WORKER = 6          # A maintenance branch could not be built
+
+DEFAULT_WORKERS = 2
+
+def worktreePath(worktreeDir, branchName):
+    return os.path.join(worktreeDir, branchName)
+
+def buildMaintBranch(accurevuser, accurevpass, data, release, worktree, transactions, resume):
+    # Runs in a worker process: migrate the maintenance streams of the release into the worktree holding its
+    # _Maint branch. Returns (branch, exit code), the pool would never hear of a worker ended by sys.exit.
+    branchName = release['Version'] + "_Maint"
+    print("Building branch %s in %s: %s" % (branchName, worktree, time.strftime("%I:%M:%S")))
+    migrationMetrics.start(worktree)
+    try:
+        accurevSession.DEFAULT_TIMEOUTS.update(data.get('accurevTimeouts', {}))
+        processRunner.LIMITS.update(data.get('processLimits', {}))
+        snapshotCache.configure(data['gitRepo'], data.get('snapshotCache'))
+        # the streams were resolved by the main process, they are not queried again
+        cache = transactionCache.getCache()
+        cache.entries.update(transactions)
+        cache.resolved.update(transactions)
+
+        context = masterScript.MigrationContext(data)
+        if context.binaryStore is not None:
+            # the binaries go to the store of the main repo, shared by every worktree
+            context.binaryStore = binaryStore.BinaryStore(worktree, data['binaryStore'], data['gitRepo'])
+        context.currentBranch = branchName
+        context.journal = migrationJournal.MigrationJournal(migrationJournal.journalPath(data['gitRepo']))
+        context.resuming = resume
+
+        for stream in release['Maint']:
+            masterScript.startMigrate(accurevuser, accurevpass, worktree, stream['name'], stream['tag'],
+                                      data['blacklist'], context=context)
+        # prevent new binaries from being added to this maintenance branch in future commits
+        masterScript.finishBranch(worktree, context)
+        masterScript.finishMigrate(worktree, context)
+    except SystemExit as exit:
+        return branchName, exit.code
+    except Exception as ex:
+        print(ex)
+        return branchName, masterScript.ERR_UNKNOWN
+    finally:
+        migrationMetrics.close()
+    print("Finished branch %s: %s" % (branchName, time.strftime("%I:%M:%S")))
+    return branchName, 0
+
+class MaintScheduler:
+    def __init__(self, accurevuser, accurevpass, data, resume, settings=None):
+        settings = settings or {}
+        self.accurevuser = accurevuser
+        self.accurevpass = accurevpass
+        self.data = data
+        self.resume = resume
+        self.localdir = data['gitRepo']
+        self.worktreeDir = settings.get('worktreeDir', self.localdir.rstrip('\\/') + "_worktrees")
+        self.workers = settings.get('workers', DEFAULT_WORKERS)
+        # spawned rather than forked: the workers must not share the fast-import process, the journal connection
+        # or the metrics file of the main process
+        self.pool = multiprocessing.get_context('spawn').Pool(processes=self.workers)
+        self.pending = []
+        self.worktrees = []
+        print("Building maintenance branches in %d worker processes under %s" % (self.workers, self.worktreeDir))
+
+    def maintStreams(self):
+        return set(stream['name'] for release in self.data['releases'] for stream in release['Maint'])
+
+    def _createBranch(self, branchName, context):
+        # Create the branch at the release commit, master moves on while the worker builds it
+        step = 'branch:' + branchName
+        if context.isDone(step, migrationJournal.BRANCHED):
+            return
+        with migrationMetrics.span('branch', branch=branchName):
+            sha = masterScript.headCommit(self.localdir, context)
+            masterScript.gitCallHandler(["branch", "-f", branchName, sha], self.localdir)
+        if context.journal is not None:
+            context.journal.record(step, migrationJournal.BRANCHED, sha=sha, branch=branchName)
+
+    def _addWorktree(self, branchName):
+        worktree = worktreePath(self.worktreeDir, branchName)
+        if os.path.exists(os.path.join(worktree, '.git')):
+            # left by an interrupted run, the worker puts it back on its branch when resuming
+            print("Reusing worktree %s" % worktree)
+            return worktree
+        if os.path.exists(worktree):
+            shutil.rmtree(worktree)
+        masterScript.gitCallHandler(["worktree", "prune"], self.localdir)
+        masterScript.gitCallHandler(["worktree", "add", "--no-checkout", worktree, branchName], self.localdir)
+        # the index of the new worktree matches its branch, the files are populated by the worker
+        masterScript.gitCallHandler(["reset", "-q"], worktree)
+        return worktree
+
+    def submit(self, release, context):
+        # Called once the release is committed on master
+        if not release['Maint']:
+            return
+        branchName = release['Version'] + "_Maint"
+        if context.isDone(branchName + ':ignoreBinaries', migrationJournal.COMMITTED):
+            print("Branch %s is already migrated, skipping it" % branchName)
+            return
+        self._createBranch(branchName, context)
+        worktree = self._addWorktree(branchName)
+        self.worktrees.append(worktree)
+        cache = transactionCache.getCache()
+        transactions = dict((stream['name'], cache.entries[stream['name']]) for stream in release['Maint']
+                            if stream['name'] in cache.entries)
+        self.pending.append(self.pool.apply_async(buildMaintBranch, (self.accurevuser, self.accurevpass, self.data,
+                                                                     release, worktree, transactions, self.resume)))
+
+    def wait(self):
+        # Wait for every maintenance branch, then remove the worktrees. The branches stay in the repo.
+        print("Waiting for %d maintenance branches: %s" % (len(self.pending), time.strftime("%I:%M:%S")))
+        with migrationMetrics.span('maintWorkers', workers=self.workers):
+            failed = []
+            for result in self.pending:
+                branchName, code = result.get()
+                if code not in (0, None):
+                    print("Building branch %s failed with exit code %s" % (branchName, code))
+                    failed.append(branchName)
+            self.pending = []
+            self.close()
+        if failed:
+            print("Worktrees of the failed branches are kept in %s, run again with --resume" % self.worktreeDir)
+            sys.exit(ERR_WORKER)
+        for worktree in self.worktrees:
+            masterScript.gitCallHandler(["worktree", "remove", "--force", worktree], self.localdir)
+        self.worktrees = []
+
+    def close(self):
+        # Branches still being built are abandoned, the journal lets --resume pick them up
+        if self.pool is None:
+            return
+        if self.pending:
+            self.pool.terminate()
+        else:
+            self.pool.close()
+        self.pool.join()
+        self.pool = None
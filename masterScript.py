@@ -7,6 +7,9 @@ Python version 3.6
 Example args:
     --accurevuser name
     --accurevpass pass
+    --refreshtransactions (optional, query the transactions of cached snapshots again)
+    --resume (optional, continue an interrupted run from its journal)
+    --plan (optional, only estimate the run with migrationPlanner.py, nothing is populated)
 """
 
 import getopt
@@ -15,11 +18,29 @@ import sys
 import time
 from datetime import datetime
 from shutil import copy
-from subprocess import call
+from subprocess import call, check_output
 import json
+import accurevSession
+import binaryStore
 import junctions2links
+import materializer
+import maintWorktrees
 import DownloadAccurevStream
+import distributedMigration
+import contentManifest
+import fastImport
 import MigrateEmptyDirs
+import migrationJournal
+import migrationMetrics
+import migrationPlanner
+import prefetch
+import processRunner
+import snapshotCache
+import streamGraph
+import transactionCache
+import reparsePoints
+import sharedStore
+import treeScanner
 import workspace2repo
 
 __author__ = "Kiersten Marr"
@@ -29,42 +50,304 @@ ERR_PARSING_ARGS = 1    # Encounter an error parsing arguments
 ERR_UNKNOWN = 2         # Fail unknown reason
 ERR_GIT = 3             # Failure calling git command
 ERR_JSON = 4            # Failure loading json file
+ERR_JOURNAL = 5         # The repo does not match the migration journal
+
+class MigrationContext:
+    # State carried from one stream to the next during a single migration run
+    def __init__(self, config=None):
+        config = config or {}
+        self.deltaPopulate = config.get('deltaPopulate', False)
+        # "git" runs git add/commit on the working copy, "fast-import" streams the trees into git fast-import
+        self.commitBackend = config.get('commitBackend', 'git')
+        self.importer = None
+        # restore the stat data of unchanged files so git only hashes what changed
+        self.statManifest = config.get('statManifest', False)
+        self.statReuseEnabled = False
+        # binaryStore.BinaryStore moving large binaries out of the commits when "binaryStore" is configured
+        self.binaryStore = None
+        if 'binaryStore' in config:
+            self.binaryStore = binaryStore.BinaryStore(config['gitRepo'], config['binaryStore'])
+        # sharedStore.SharedStore the repo borrows objects from when "sharedObjectStore" is configured
+        self.sharedStore = None
+        if 'sharedObjectStore' in config:
+            settings = config['sharedObjectStore']
+            self.sharedStore = sharedStore.SharedStore(settings['path'], settings.get('name'))
+        # downloads the next streams in the background when "prefetch" is configured
+        self.prefetcher = None
+        # stream and transaction currently populated in the working copy
+        self.populatedStream = None
+        self.populatedTransaction = None
+        # migrationJournal.MigrationJournal of the run, resuming stays set until the first step not yet done
+        self.journal = None
+        self.resuming = False
+        self.currentBranch = "master"
+
+    def setPopulated(self, streamname, transaction):
+        self.populatedStream = streamname
+        self.populatedTransaction = transaction
+
+    def record(self, step, stage, localdir, stream=None, transaction=None, commit=False):
+        # Journal a completed stage, with the commit the current branch points to when commit is set
+        if self.journal is None:
+            return
+        sha = headCommit(localdir, self) if commit else None
+        self.journal.record(step, stage, stream, transaction, sha, self.currentBranch)
+
+    def isDone(self, step, stage):
+        # True when resuming and the journal records the stage as done
+        return self.resuming and stage in self.journal.stages(step)
+
+    def resumeAt(self, localdir, restoreTree=True):
+        # Called on the first step the journal doesn't record as done: check the current branch still points to
+        # the last commit the journal knows of and, unless the working copy holds a tree ready to be committed,
+        # put the working copy back on that commit
+        self.resuming = False
+        last = self.journal.lastCommit(self.currentBranch)
+        if last is None:
+            print("Nothing committed on branch %s yet, resuming from the start of it" % self.currentBranch)
+            return
+        print("Resuming on branch %s after %s" % (self.currentBranch, last.step))
+        if restoreTree:
+            gitCallHandler(["checkout", "-f", "-q", self.currentBranch], localdir)
+            gitCallHandler(["clean", "-fdq"], localdir)
+        head = headCommit(localdir, self)
+        if head != last.sha:
+            print("Branch %s is at %s but the journal recorded %s, cannot resume" % (self.currentBranch, head, last.sha))
+            sys.exit(ERR_JOURNAL)
+        if restoreTree and last.stream is not None:
+            self.setPopulated(last.stream, last.transactionId)
+
+    def startImporter(self, localdir):
+        if self.commitBackend == 'fast-import' and self.importer is None:
+            self.importer = fastImport.FastImporter(localdir, self.currentBranch)
+        return self.importer
+
+    def startPrefetch(self, accurevuser, accurevpass, streams, blacklist, localdir, settings):
+        if self.deltaPopulate:
+            print("Prefetching populates every stream in full, deltaPopulate is ignored")
+            self.deltaPopulate = False
+        diskBudget = settings.get('diskBudgetGB')
+        self.prefetcher = prefetch.StreamPrefetcher(accurevuser, accurevpass, streams, blacklist,
+                                                    settings.get('stagingDir', localdir.rstrip('\\/') + "_staging"),
+                                                    settings.get('depth', 1),
+                                                    diskBudget * 1024 ** 3 if diskBudget else None)
+        self.prefetcher.start()
 
 def CopyGitIgnore(localdir):
-    copy(os.path.join(os.getcwd(), "gitignoreForMigration"), os.path.join(localdir, ".gitignore"))
+    # the .gitignore populated from AccuRev may be a hard link into the snapshot cache, it is replaced
+    target = os.path.join(localdir, ".gitignore")
+    if os.path.lexists(target):
+        os.remove(target)
+    copy(os.path.join(os.getcwd(), "gitignoreForMigration"), target)
 
-def startMigrate(accurevuser, accurevpass, localdir, streamname, tag, blacklist, message = None):
-    # delete everything in local git repo except .git
-    if os.path.exists(localdir):
-        gitCallHandler(["rm", "-rf", "."], localdir)
-    else:
-        print("localdir not created yet. Continuing . . . ")
+def postProcess(localdir, blacklist):
+    # Single pass over the populated tree removing blacklisted paths, converting junctions into symbolic links
+    # and marking empty directories. Returns the treeScanner.TreeManifest of what is left.
+    print("Starting post-processing: %s" % time.strftime("%I:%M:%S"))
+    with migrationMetrics.span('postProcess') as postProcessSpan:
+        detector = reparsePoints.getDetector()
+        handlers = [DownloadAccurevStream.BlacklistHandler(blacklist),
+                    junctions2links.JunctionHandler(detector),
+                    MigrateEmptyDirs.EmptyDirectoryHandler()]
+        scanner = treeScanner.TreeScanner(localdir, handlers, detector)
+        handlerStart = time.time()
+        manifest = scanner.scan()
+        # the handlers share one pass, their spans are laid out one after the other
+        for stage, seconds in scanner.handlerSeconds.items():
+            migrationMetrics.recordSpan(stage, handlerStart, seconds)
+            handlerStart += seconds
+        postProcessSpan.add(files=len(manifest.files), bytes=manifest.totalBytes())
+    print("Finished post-processing: %s" % time.strftime("%I:%M:%S"))
+    return manifest
+
+def headCommit(localdir, context):
+    if context.importer is not None:
+        # git fast-import only updates the refs at a checkpoint
+        context.importer.checkpoint()
+    return migrationMetrics.runProcess(check_output, ["git", "-C", localdir, "rev-parse",
+                                                      "refs/heads/" + context.currentBranch]).decode().strip()
+
+def startMigrate(accurevuser, accurevpass, localdir, streamname, tag, blacklist, message = None, context = None):
+    context = context or MigrationContext()
+    with migrationMetrics.span('stream', streamname, branch=context.currentBranch, tag=tag):
+        return migrateStream(accurevuser, accurevpass, localdir, streamname, tag, blacklist, message, context)
 
-    transaction = DownloadAccurevStream.main(streamname, localdir, accurevuser, accurevpass, blacklist)
+def migrateStream(accurevuser, accurevpass, localdir, streamname, tag, blacklist, message, context):
+    step = context.currentBranch + ':' + streamname
+    stages = {}
+    if context.resuming:
+        stages = context.journal.stages(step)
+        if migrationJournal.COMMITTED in stages and (migrationJournal.TAGGED in stages or tag in ["", None]):
+            print("Stream %s is already migrated, skipping it" % streamname)
+            return stages[migrationJournal.DOWNLOADED].transactionId
+        context.resumeAt(localdir, restoreTree=migrationJournal.POSTPROCESSED not in stages)
+
+    if migrationJournal.COMMITTED in stages:
+        # only the tag is missing
+        workspace2repo.addTag(tag, localdir, context.startImporter(localdir))
+        context.record(step, migrationJournal.TAGGED, localdir, streamname, commit=True)
+        return stages[migrationJournal.DOWNLOADED].transactionId
+
+    if migrationJournal.POSTPROCESSED in stages:
+        # the working copy was left ready to commit
+        transaction = stages[migrationJournal.DOWNLOADED].transactionId
+        context.setPopulated(streamname, transaction)
+        treeFiles = None
+    else:
+        with migrationMetrics.span('download'):
+            transaction = populate(accurevuser, accurevpass, localdir, streamname, context, blacklist)
+        context.record(step, migrationJournal.DOWNLOADED, localdir, streamname, transaction)
+        CopyGitIgnore(localdir)
+        manifest = postProcess(localdir, blacklist)
+        if context.binaryStore is not None:
+            with migrationMetrics.span('binaryStore') as storeSpan:
+                storeSpan.add(bytes=context.binaryStore.offload(manifest.files))
+        treeFiles = list(manifest.files)
+        migrationMetrics.current().add(files=len(manifest.files), bytes=manifest.totalBytes())
+        context.record(step, migrationJournal.POSTPROCESSED, localdir, streamname, transaction)
 
     # Append transaction number which was migrated
     if message != None:
         message += '\n\nTransaction Number: ' + transaction
 
-    CopyGitIgnore(localdir)
-    junctions2links.main(localdir)
-    MigrateEmptyDirs.main(localdir)
-    workspace2repo.main(localdir, tag, message)
+    if context.sharedStore is not None:
+        # the repo exists once the first stream is downloaded
+        context.sharedStore.attach(localdir)
+    importer = context.startImporter(localdir)
+    reusedBlobs = None
+    versions = None
+    if context.statManifest:
+        if not context.statReuseEnabled:
+            contentManifest.enableStatReuse(localdir)
+            context.statReuseEnabled = True
+        with migrationMetrics.span('statReuse') as reuseSpan:
+            versions = contentManifest.listVersions(accurevSession.getSession(accurevuser, accurevpass), streamname,
+                                                    transaction)
+            # the root .gitignore is replaced by CopyGitIgnore, its content is not the one of its element version
+            versions.pop('.gitignore', None)
+            reusedBlobs, rehashed = contentManifest.reuseUnchanged(localdir, contentManifest.loadManifest(localdir),
+                                                                   treeFiles, versions)
+            reuseSpan.add(files=len(reusedBlobs), rehashed=rehashed)
+
+    workspace2repo.main(localdir, tag, message, importer, reusedBlobs)
+    context.record(step, migrationJournal.COMMITTED, localdir, streamname, transaction, commit=True)
+    if tag not in ["", None]:
+        context.record(step, migrationJournal.TAGGED, localdir, streamname, transaction)
+
+    if context.statManifest:
+        if importer is not None:
+            contentManifest.saveManifest(localdir, importer.lastBlobs, versions)
+        else:
+            contentManifest.recordFromIndex(localdir, versions)
+    return transaction
 
-def ignoreBinaries(localdir):
-    with open(os.path.join(localdir, '.gitignore'), 'a+') as gitignoreFile:
+def populate(accurevuser, accurevpass, localdir, streamname, context, blacklist=()):
+    # Bring the working copy to the content of the stream, returns the transaction it was populated at
+    previousStream = None
+    if context.deltaPopulate and context.populatedStream is not None and os.path.exists(localdir):
+        # keep the tree of the previous stream, only its differences to this stream are downloaded
+        previousStream = context.populatedStream
+        migrationMetrics.current().add(mode='delta')
+    elif os.path.exists(localdir) and (context.commitBackend == 'fast-import' or context.prefetcher is not None
+                                       or context.statManifest):
+        # the index is not used by git fast-import and git add picks up the deletions, only the files need to go.
+        # Keeping the index also lets git add skip files whose stat data was restored.
+        DownloadAccurevStream.clearDirectory(localdir)
+    elif os.path.exists(localdir):
+        # delete everything in local git repo except .git, a new branch of streamGraph.py has nothing to delete
+        gitCallHandler(["rm", "-rf", "--ignore-unmatch", "."], localdir)
+    else:
+        print("localdir not created yet. Continuing . . . ")
+
+    if context.prefetcher is not None:
+        migrationMetrics.current().add(mode='prefetch')
+        transaction = context.prefetcher.swapInto(streamname, localdir)
+    else:
+        # blacklisted paths are not downloaded, postProcess removes whatever else matches the blacklist
+        transaction = DownloadAccurevStream.main(streamname, localdir, accurevuser, accurevpass, [],
+                                                 previousStream, context.populatedTransaction, blacklist)
+    context.setPopulated(streamname, transaction)
+    return transaction
+
+def createBranch(branchName, localdir, context):
+    with migrationMetrics.span('branch', branch=branchName):
+        step = 'branch:' + branchName
+        if context.isDone(step, migrationJournal.BRANCHED):
+            context.currentBranch = branchName
+            return
+        if context.resuming:
+            context.resumeAt(localdir)
+        if context.importer is not None:
+            context.importer.createBranch(branchName)
+        else:
+            # Note: gitCallHandler will catch a fatal error if this branch already exists.
+            #       This should not happen since this script first creates our current repo.
+            gitCallHandler(["checkout", "-b", branchName], localdir)
+        context.currentBranch = branchName
+        context.record(step, migrationJournal.BRANCHED, localdir, commit=True)
+
+def checkoutBranch(branchName, localdir, context):
+    if context.resuming:
+        # nothing is done in the repo until the first step left to do
+        context.currentBranch = branchName
+        return
+    context.currentBranch = branchName
+    with migrationMetrics.span('checkout', branch=branchName):
+        if context.importer is not None:
+            # the working copy keeps the last populated tree, only the .gitignore has to match the branch again
+            context.importer.checkout(branchName)
+            CopyGitIgnore(localdir)
+        else:
+            gitCallHandler(["checkout", branchName], localdir)
+            if context.statManifest:
+                # the checkout rewrote the files which differ between the branches
+                contentManifest.recordFromIndex(localdir)
+
+def finishBranch(localdir, context):
+    # prevent new binaries from being added to the current branch in future commits
+    step = context.currentBranch + ':ignoreBinaries'
+    if context.isDone(step, migrationJournal.COMMITTED):
+        return
+    if context.resuming:
+        context.resumeAt(localdir)
+    with migrationMetrics.span('ignoreBinaries', branch=context.currentBranch):
+        ignoreBinaries(localdir, context.importer)
+    context.record(step, migrationJournal.COMMITTED, localdir, commit=True)
+
+def finishMigrate(localdir, context):
+    materializer.getMaterializer().report()
+    if context.binaryStore is not None:
+        print("Binary store kept %.1f MB out of the commits" % (context.binaryStore.savedBytes / 1024.0 / 1024.0))
+    if context.journal is not None:
+        context.journal.close()
+    if context.importer is not None:
+        context.importer.close()
+        context.importer = None
+        # bring the index and working copy in line with the imported master branch
+        gitCallHandler(["reset", "--hard", "-q"], localdir)
+
+def ignoreBinaries(localdir, importer=None):
+    gitignorePath = os.path.join(localdir, '.gitignore')
+    if os.path.isfile(gitignorePath):
+        # the .gitignore may be a hard link into the snapshot cache, a copy of its own is appended to
+        copy(gitignorePath, gitignorePath + '.tmp')
+        os.replace(gitignorePath + '.tmp', gitignorePath)
+    with open(gitignorePath, 'a+') as gitignoreFile:
         gitignoreFile.write('\n'.join(["\n", "# Java build output", ".gradle/", ".idea/"]))
         gitignoreFile.write('\n'.join(["\n", "# Binary extensions", "*.bin", "*.bmp", "*.cfx", "*.dat", "*.der",
                                        "*.dll", "*.docx", "*.exe", "*.gif", "*.ico", "*.jpg", "*.lib", "*.mdb",
                                        "*.msi", "*.opf", "*.png", "*.pdf", "*.pptx", "*.xlsx", "*.zip"]))
     
     # add and commit the update gitignore file
+    if importer is not None:
+        importer.commitChanges('Ignore future binary files', changed=['.gitignore'])
+        return
     gitCallHandler(["add", localdir], localdir)
     gitCallHandler(["commit", "-m", 'Ignore future binary files', '--author="GeneralUser <GeneralUser@ptc.com>"'], localdir)
 
 def gitCallHandler(cmd, localdir):
     try:
-        returnCode = call(["git", "-C", localdir] + cmd)
+        returnCode = migrationMetrics.runProcess(call, ["git", "-C", localdir] + cmd)
         if returnCode == 0:
             print("Successfully executed command: git " + " ".join(cmd))
         else:
@@ -78,19 +361,32 @@ def parse_arguments(argv):
     try:
         print("Importing arguments")
         opts, args = getopt.getopt(argv, "", ["accurevuser=",
-                                              "accurevpass="])
+                                              "accurevpass=",
+                                              "refreshtransactions",
+                                              "resume",
+                                              "plan"])
     except Exception as e:
         print(e)
         sys.exit(ERR_PARSING_ARGS)
 
+    refreshTransactions = False
+    resume = False
+    plan = False
     for opt, arg in opts:
         if opt == '--accurevuser':
             accurevuser = arg
         elif opt == '--accurevpass':
             accurevpass = arg
+        elif opt == '--refreshtransactions':
+            refreshTransactions = True
+        elif opt == '--resume':
+            resume = True
+        elif opt == '--plan':
+            plan = True
     try: 
         print("Finished importing arguments")
-        return {'username': accurevuser, 'password': accurevpass}
+        return {'username': accurevuser, 'password': accurevpass, 'refreshTransactions': refreshTransactions,
+                'resume': resume, 'plan': plan}
     except UnboundLocalError as e:
         print("Could not find necessary arguments. Exiting . . . ")
         print(e)
@@ -104,51 +400,126 @@ def parseConfigFile():
                 print("Error loading JSON.")
                 sys.exit(ERR_JSON)
 
-def main(accurevuser, accurevpass):
+def configStreams(data):
+    # Every stream of config.json in the order it is migrated
+    streams = []
+    for release in data['releases']:
+        streams.append(release['StreamName'])
+        streams.extend(stream['name'] for stream in release['Maint'])
+    return streams
+
+def pendingDownloads(data, journal):
+    # Streams of config.json which still have to be downloaded when resuming from the journal
+    streams = []
+    for release in data['releases']:
+        steps = [("master", release['StreamName'])]
+        steps.extend((release['Version'] + "_Maint", stream['name']) for stream in release['Maint'])
+        for branch, stream in steps:
+            stages = journal.stages(branch + ':' + stream)
+            if migrationJournal.POSTPROCESSED not in stages and migrationJournal.COMMITTED not in stages:
+                streams.append(stream)
+    return streams
+
+def main(accurevuser, accurevpass, refreshTransactions=False, resume=False, plan=False):
     try:
         print("Starting masterScript.py: %s" % time.strftime("%I:%M:%S"))
         startTime = datetime.now()
+        scheduler = None
         data = parseConfigFile()
 
         localdir = data['gitRepo']
         blacklist = data['blacklist']
+        accurevSession.DEFAULT_TIMEOUTS.update(data.get('accurevTimeouts', {}))
+        processRunner.LIMITS.update(data.get('processLimits', {}))
+        snapshotCache.configure(localdir, data.get('snapshotCache'))
+        if plan:
+            # dry run: only the metadata is queried, the repo, journal and metrics are left alone
+            if refreshTransactions:
+                transactionCache.getCache().refresh()
+            migrationPlanner.main(accurevuser, accurevpass, data)
+            sys.exit(0)
+        if 'distributed' in data:
+            # the releases are migrated by workers and stitched together by distributedMigration.py
+            distributedMigration.coordinate(accurevuser, accurevpass, data, refreshTransactions)
+            sys.exit(0)
+        context = MigrationContext(data)
+        migrationMetrics.start(localdir)
+        context.journal = migrationJournal.openJournal(localdir, resume)
+        context.resuming = resume
+
+        # resolve the transaction of every stream up front, snapshots come from the cache of earlier runs
+        cache = transactionCache.getCache()
+        if refreshTransactions:
+            cache.refresh()
+        if 'streamGraph' in data:
+            # the streams and the parents of their commits come from the AccuRev stream hierarchy
+            streamGraph.migrate(accurevuser, accurevpass, data, context)
+            sys.exit(0)
+        with migrationMetrics.span('resolveTransactions'):
+            cache.resolve(accurevSession.getSession(accurevuser, accurevpass), configStreams(data))
+
+        if 'parallelMaint' in data:
+            scheduler = maintWorktrees.MaintScheduler(accurevuser, accurevpass, data, resume, data['parallelMaint'])
+
+        if 'prefetch' in data:
+            streams = pendingDownloads(data, context.journal) if resume else configStreams(data)
+            if scheduler is not None:
+                # the maintenance streams are downloaded by the worktree workers
+                streams = [stream for stream in streams if stream not in scheduler.maintStreams()]
+            context.startPrefetch(accurevuser, accurevpass, streams, blacklist, localdir, data['prefetch'])
 
         for release in data['releases']:
             version = release['Version']
             releaseStream = release['StreamName']
             relTag = release['ReleaseTag']
-            startMigrate(accurevuser, accurevpass, localdir, releaseStream, relTag, blacklist)
+            releaseTransaction = startMigrate(accurevuser, accurevpass, localdir, releaseStream, relTag, blacklist,
+                                              context=context)
+
+            if scheduler is not None:
+                # the maintenance branch is built in a worktree while master carries on
+                scheduler.submit(release, context)
+                continue
 
             # create maintenance branch and fill it
             branchName = version + "_Maint"
-
-            # Note: gitCallHandler will catch a fatal error if this branch already exists.
-            #       This should not happen since this script first creates our current repo.
-            gitCallHandler(["checkout", "-b", branchName], localdir)
+            createBranch(branchName, localdir, context)
 
             for stream in release['Maint']:
                 maint = stream['name']
                 tag = stream['tag']
-                startMigrate(accurevuser, accurevpass, localdir, maint, tag, blacklist)
+                startMigrate(accurevuser, accurevpass, localdir, maint, tag, blacklist, context=context)
 
             # prevent new binaries from being added to this maintenance branch in future commits
-            ignoreBinaries(localdir);
+            finishBranch(localdir, context)
 
             # return to master
-            gitCallHandler(["checkout", "master"], localdir)
+            checkoutBranch("master", localdir, context)
+            if context.importer is None:
+                # the checkout restored the release tree, the next release is a delta against it
+                context.setPopulated(releaseStream, releaseTransaction)
 
         # prevent new binaries from being added to the master branch in future commits
         # this will also block all binaries on any branch created off of master from this point forward
-        ignoreBinaries(localdir);
+        finishBranch(localdir, context)
+        if scheduler is not None:
+            scheduler.wait()
+        finishMigrate(localdir, context)
+        if context.sharedStore is not None:
+            context.sharedStore.publish(localdir)
         
     except Exception as ex:
         print(ex)
         sys.exit(ERR_UNKNOWN)
     finally:
+        if scheduler is not None:
+            scheduler.close()
         print("Finished masterScript.py: %s" % time.strftime("%I:%M:%S"))
         print("Operations took %s" % (datetime.now() - startTime))
+        migrationMetrics.recordSpan('migration', startTime.timestamp(), (datetime.now() - startTime).total_seconds())
+        migrationMetrics.close()
     sys.exit(0)
 
 if __name__ == '__main__':
     arguments = parse_arguments(sys.argv[1:])
-    main(arguments['username'], arguments['password'])
\ No newline at end of file
+    main(arguments['username'], arguments['password'], arguments['refreshTransactions'], arguments['resume'],
+         arguments['plan'])
\ No newline at end of file
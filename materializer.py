@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+"""
+materializer.py:
+Place files into a working copy without writing their content again where the filesystem allows it: a reflink
+(copy-on-write clone) on filesystems which support them, a hard link when the source is never written to, or a
+kernel side copy (copy_file_range, sendfile) otherwise. What a pair of filesystems supports is found out by the
+first file placed between them and kept for the rest of the run. The bytes cloned, linked and copied are counted.
+Files placed by hard link share their content with the source, so every script replaces files of the working
+copy rather than writing into them.
+Python version 3.6
+"""
+
+import collections
+import errno
+import os
+import shutil
+import sys
+import threading
+
+__author__ = "Corey Birdsall"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+REFLINK = 'reflink'
+HARDLINK = 'hardlink'
+COPY = 'copy'
+# ioctl cloning a whole file on Linux (btrfs, XFS with reflink, OCFS2)
+FICLONE = 0x40049409
+CHUNK_SIZE = 1024 * 1024
+# errors telling a method is not supported between two filesystems, any other error is reported
+UNSUPPORTED_ERRORS = (errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.ENOSYS, errno.EPERM,
+                      errno.EACCES, errno.EBADF)
+
+def _clone(source, target):
+    import fcntl
+    with open(source, 'rb') as sourceFile, open(target, 'wb') as targetFile:
+        fcntl.ioctl(targetFile.fileno(), FICLONE, sourceFile.fileno())
+
+def _copy(source, target):
+    # copy_file_range (Python 3.8) and sendfile copy in the kernel, the content is not read into the process
+    with open(source, 'rb') as sourceFile, open(target, 'wb') as targetFile:
+        size = os.fstat(sourceFile.fileno()).st_size
+        copied = 0
+        for name in ('copy_file_range', 'sendfile'):
+            if not hasattr(os, name) or sys.platform == 'win32':
+                continue
+            try:
+                while copied < size:
+                    if name == 'sendfile':
+                        sent = os.sendfile(targetFile.fileno(), sourceFile.fileno(), copied, size - copied)
+                    else:
+                        sent = os.copy_file_range(sourceFile.fileno(), targetFile.fileno(), size - copied, copied,
+                                                  copied)
+                    if sent == 0:
+                        break
+                    copied += sent
+                if copied == size:
+                    return
+            except OSError:
+                pass
+            # start over with the next way of copying
+            copied = 0
+            targetFile.seek(0)
+            targetFile.truncate()
+        sourceFile.seek(0)
+        shutil.copyfileobj(sourceFile, targetFile, CHUNK_SIZE)
+
+def detach(paths):
+    # Remove the files among paths so the commands updating them write new files instead of writing into files
+    # which may be hard links to a cache. Folders are left alone.
+    for path in paths:
+        if os.path.islink(path) or os.path.isfile(path):
+            os.remove(path)
+
+class Materializer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (source device, target device) -> methods not found to be unsupported yet
+        self.capabilities = {}
+        self.files = collections.Counter()
+        self.bytes = collections.Counter()
+
+    def _methods(self, key, linkable):
+        with self.lock:
+            methods = self.capabilities.setdefault(key, [REFLINK, HARDLINK] if sys.platform != 'win32'
+                                                   else [HARDLINK])
+            return [method for method in methods if method != HARDLINK or linkable] + [COPY]
+
+    def _unsupported(self, key, method, error):
+        with self.lock:
+            if method in self.capabilities[key]:
+                self.capabilities[key].remove(method)
+                print("No %s between devices %s and %s (%s), falling back" % (method, key[0], key[1], error))
+
+    def place(self, source, target, linkable=False):
+        # Create target with the content of source, replacing a file already at target. Hard links are only
+        # made when linkable is set, the source must then never be written to. Returns the method used.
+        if os.path.lexists(target):
+            os.remove(target)
+        size = os.path.getsize(source)
+        key = (os.stat(source).st_dev, os.stat(os.path.dirname(target) or '.').st_dev)
+        for method in self._methods(key, linkable):
+            try:
+                if method == REFLINK:
+                    _clone(source, target)
+                elif method == HARDLINK:
+                    os.link(source, target)
+                else:
+                    _copy(source, target)
+            except OSError as ex:
+                if method == COPY:
+                    raise
+                if os.path.lexists(target):
+                    os.remove(target)
+                # a file with too many links says nothing about the filesystem
+                if ex.errno in UNSUPPORTED_ERRORS:
+                    self._unsupported(key, method, ex.strerror)
+                continue
+            with self.lock:
+                self.files[method] += 1
+                self.bytes[method] += size
+            return method
+
+    def report(self):
+        # Print the bytes placed by each method during the run
+        if not self.files:
+            return
+        print("Placed %d files: %.1f MB cloned, %.1f MB hard linked, %.1f MB copied"
+              % (sum(self.files.values()), self.bytes[REFLINK] / 1024.0 / 1024.0,
+                 self.bytes[HARDLINK] / 1024.0 / 1024.0, self.bytes[COPY] / 1024.0 / 1024.0))
+
+_materializer = None
+_materializerLock = threading.Lock()
+
+def getMaterializer():
+    # One materializer per process, the capabilities found out are shared by every thread
+    global _materializer
+    with _materializerLock:
+        if _materializer is None:
+            _materializer = Materializer()
+        return _materializer
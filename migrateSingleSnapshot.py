@@ -20,6 +20,7 @@ import DownloadAccurevStream
 import MigrateEmptyDirs
 import workspace2repo
 import masterScript
+import snapshotCache
 from subprocess import call
 
 __author__ = "Michael C Brown"
@@ -57,6 +58,7 @@ def main(accurevStreamName, username, password, message):
 
     try:
         data = masterScript.parseConfigFile()
+        snapshotCache.configure(data['gitRepo'], data.get('snapshotCache'))
         masterScript.startMigrate(username, password, data['gitRepo'], accurevStreamName, None, data['blacklist'], message)
         masterScript.ignoreBinaries(data['gitRepo'])
 
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+"""
+migrationJournal.py:
+Durable record of the stages masterScript.py completed for each stream (downloaded, post-processed,
+committed, tagged) and each branch operation, kept in an SQLite file next to the git repo.
+A run started with --resume skips everything the journal records as done.
+Python version 3.6
+"""
+
+import os
+import sqlite3
+import time
+from collections import namedtuple
+
+__author__ = "Kiersten Marr"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+DOWNLOADED = 'downloaded'
+POSTPROCESSED = 'postprocessed'
+COMMITTED = 'committed'
+TAGGED = 'tagged'
+BRANCHED = 'branched'
+
+Stage = namedtuple('Stage', ['step', 'stage', 'stream', 'transactionId', 'sha', 'branch', 'recorded'])
+
+def journalPath(localdir):
+    return localdir.rstrip('\\/') + '_journal.sqlite'
+
+class MigrationJournal:
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS stages (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                                "step TEXT NOT NULL, stage TEXT NOT NULL, stream TEXT, transactionId TEXT, "
+                                "sha TEXT, branch TEXT, recorded REAL NOT NULL)")
+        self.connection.commit()
+
+    def record(self, step, stage, stream=None, transactionId=None, sha=None, branch=None):
+        # Every record is committed right away so it survives a crash of the migration
+        self.connection.execute("INSERT INTO stages (step, stage, stream, transactionId, sha, branch, recorded) "
+                                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                (step, stage, stream, transactionId, sha, branch, time.time()))
+        self.connection.commit()
+
+    def stages(self, step):
+        # {stage: Stage} recorded for a step, the latest record wins
+        rows = self.connection.execute("SELECT step, stage, stream, transactionId, sha, branch, recorded "
+                                       "FROM stages WHERE step = ? ORDER BY id", (step,)).fetchall()
+        return dict((row[1], Stage(*row)) for row in rows)
+
+    def lastCommit(self, branch):
+        # Latest Stage which committed to or created the branch, None if there is none
+        row = self.connection.execute("SELECT step, stage, stream, transactionId, sha, branch, recorded "
+                                      "FROM stages WHERE branch = ? AND stage IN (?, ?) ORDER BY id DESC LIMIT 1",
+                                      (branch, COMMITTED, BRANCHED)).fetchone()
+        return Stage(*row) if row else None
+
+    def entries(self):
+        # Every Stage recorded, oldest first
+        rows = self.connection.execute("SELECT step, stage, stream, transactionId, sha, branch, recorded "
+                                       "FROM stages ORDER BY id").fetchall()
+        return [Stage(*row) for row in rows]
+
+    def clear(self):
+        self.connection.execute("DELETE FROM stages")
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+def openJournal(localdir, resume):
+    # A run without resume starts a new journal
+    journal = MigrationJournal(journalPath(localdir))
+    if not resume:
+        journal.clear()
+    print("%s migration journal %s" % ("Resuming from" if resume else "Recording to", journal.path))
+    return journal
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+"""
+migrationMetrics.py:
+Time the stages of a migration run as nested spans (per stream: download, post-processing, commit, tag, ...).
+Every span records its files, bytes, the processes started while it was open and the time spent waiting on
+them. Spans are appended to a JSON lines file as they end and written as a Chrome trace (chrome://tracing,
+Perfetto) when the run finishes. Nothing is recorded until start() is called.
+Python version 3.6
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+__author__ = "Kiersten Marr"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+SUMMARY_LINES = 10
+
+def metricsPaths(localdir):
+    base = localdir.rstrip('\\/')
+    return base + '_metrics.jsonl', base + '_trace.json'
+
+class Span:
+    def __init__(self, recorder, name, stream, attributes):
+        self.recorder = recorder
+        self.name = name
+        self.stream = stream
+        self.attributes = attributes
+        self.files = None
+        self.bytes = None
+        self.processes = 0
+        self.processSeconds = 0.0
+        self.start = None
+        self.seconds = None
+
+    def add(self, files=None, bytes=None, **attributes):
+        if files is not None:
+            self.files = files
+        if bytes is not None:
+            self.bytes = bytes
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        stack = self.recorder.stack()
+        if self.stream is None and stack:
+            # nested spans belong to the stream of the span they are part of
+            self.stream = stack[-1].stream
+        stack.append(self)
+        self.start = time.time()
+        self.perfStart = time.perf_counter()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.seconds = time.perf_counter() - self.perfStart
+        self.recorder.stack().remove(self)
+        if excType is not None:
+            self.attributes['failed'] = excType.__name__
+        self.recorder.write(self)
+        return False
+
+class NullSpan:
+    # Returned while no run is being recorded
+    stream = None
+
+    def add(self, files=None, bytes=None, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        return False
+
+class MetricsRecorder:
+    def __init__(self, localdir):
+        self.metricsPath, self.tracePath = metricsPaths(localdir)
+        self.runStart = time.time()
+        self.events = []
+        self.totals = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.output = open(self.metricsPath, 'a')
+        print("Recording metrics to %s" % self.metricsPath)
+
+    def stack(self):
+        if not hasattr(self.local, 'spans'):
+            self.local.spans = []
+        return self.local.spans
+
+    def process(self, seconds, started=True):
+        # Account a process (or a wait on an already running one) to every open span of this thread
+        for span in self.stack():
+            span.processes += 1 if started else 0
+            span.processSeconds += seconds
+
+    def write(self, span):
+        entry = {'run': self.runStart, 'stage': span.name, 'stream': span.stream, 'start': span.start,
+                 'seconds': round(span.seconds, 6), 'files': span.files, 'bytes': span.bytes,
+                 'processes': span.processes, 'processSeconds': round(span.processSeconds, 6),
+                 'depth': len(self.stack()), 'thread': threading.current_thread().name}
+        entry.update(span.attributes)
+        args = dict((key, value) for key, value in entry.items() if key not in ('run', 'start', 'seconds', 'thread'))
+        event = {'name': span.name if span.stream is None else "%s %s" % (span.name, span.stream),
+                 'cat': span.name, 'ph': 'X', 'ts': int((span.start - self.runStart) * 1000000),
+                 'dur': int(span.seconds * 1000000), 'pid': os.getpid(), 'tid': threading.current_thread().ident,
+                 'args': args}
+        with self.lock:
+            self.output.write(json.dumps(entry) + '\n')
+            self.output.flush()
+            self.events.append(event)
+            total = self.totals.setdefault(span.name, [0, 0.0, 0, 0.0])
+            total[0] += 1
+            total[1] += span.seconds
+            total[2] += span.processes
+            total[3] += span.processSeconds
+
+    def close(self):
+        with self.lock:
+            self.output.close()
+            with open(self.tracePath, 'w') as traceFile:
+                json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, traceFile)
+        print("Wrote Chrome trace to %s" % self.tracePath)
+        for name, (count, seconds, processes, processSeconds) in sorted(self.totals.items(),
+                                                                        key=lambda item: -item[1][1])[:SUMMARY_LINES]:
+            print("%-16s %5d spans %10.1fs, %6d processes, %10.1fs waiting on processes"
+                  % (name, count, seconds, processes, processSeconds))
+
+_recorder = None
+
+def start(localdir):
+    global _recorder
+    if _recorder is None:
+        _recorder = MetricsRecorder(localdir)
+    return _recorder
+
+def close():
+    global _recorder
+    if _recorder is not None:
+        _recorder.close()
+        _recorder = None
+
+def span(name, stream=None, **attributes):
+    # with migrationMetrics.span('download', streamname) as current: ... current.add(files=..., bytes=...)
+    if _recorder is None:
+        return NullSpan()
+    return Span(_recorder, name, stream, attributes)
+
+def current():
+    # The innermost open span of this thread
+    if _recorder is None or not _recorder.stack():
+        return NullSpan()
+    return _recorder.stack()[-1]
+
+def recordSpan(name, start, seconds, stream=None, **attributes):
+    # A span measured elsewhere, for instance the share of a single pass taken by one of its handlers
+    if _recorder is None:
+        return
+    finished = Span(_recorder, name, stream if stream is not None else current().stream, attributes)
+    finished.start = start
+    finished.seconds = seconds
+    _recorder.write(finished)
+
+def runProcess(function, *args, **kwargs):
+    # Run a subprocess function (call, check_output, run, ...) and account for it
+    started = time.perf_counter()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        if _recorder is not None:
+            _recorder.process(time.perf_counter() - started)
+
+def processStarted():
+    # A long-lived process was started, its waits are accounted with waiting()
+    if _recorder is not None:
+        _recorder.process(0.0)
+
+@contextlib.contextmanager
+def waiting():
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if _recorder is not None:
+            _recorder.process(time.perf_counter() - started, started=False)
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+
+"""
+migrationPlanner.py:
+Estimate a masterScript.py run without populating anything (masterScript.py --plan). Resolves the transaction
+of every stream of config.json, lists its elements to count the files and bytes left after the blacklist,
+compares each stream with the one the migration puts before it and prints the schedule with the predicted
+download volume, repo growth and time per stream. Rates come from the metrics of previous runs into the same
+gitRepo (migrationMetrics.py) when there are any. The plan is also written to the gitRepo path followed by
+"_plan.json".
+Python version 3.6
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from xml.etree.ElementTree import ParseError
+import accurevParsers
+import accurevSession
+import migrationMetrics
+import populatePlanner
+import transactionCache
+
+__author__ = "Kiersten Marr"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+ERR_ACCUREV = 3         # Error communicating with Accurev
+
+# rates used when no previous run was measured
+DEFAULT_BYTES_PER_SECOND = 10 * 1024 * 1024
+DEFAULT_DELTA_ELEMENT_SECONDS = 0.01
+DEFAULT_FILE_SECONDS = 0.001
+MB = 1024.0 * 1024.0
+
+# predecessor is the stream already in the working copy when the stream is migrated, None for the first one
+StreamPlan = namedtuple('StreamPlan', ['stream', 'branch', 'predecessor', 'transaction', 'files', 'bytes',
+                                       'skippedFiles', 'skippedBytes', 'changedFiles', 'movedFiles',
+                                       'removedFiles', 'downloadBytes', 'growthBytes', 'seconds'])
+
+def planPath(localdir):
+    return localdir.rstrip('\\/') + '_plan.json'
+
+def migrationOrder(data):
+    # [(branch, stream, predecessor)] in the order masterScript.py migrates the streams. After a maintenance
+    # branch the working copy goes back to the release, which is what the next release is compared with.
+    order = []
+    previousRelease = None
+    for release in data['releases']:
+        order.append(("master", release['StreamName'], previousRelease))
+        previous = release['StreamName']
+        for stream in release['Maint']:
+            order.append((release['Version'] + "_Maint", stream['name'], previous))
+            previous = stream['name']
+        previousRelease = release['StreamName']
+    return order
+
+class Calibration:
+    # Rates measured by the previous runs into the same gitRepo
+    def __init__(self):
+        self.bytesPerSecond = DEFAULT_BYTES_PER_SECOND
+        self.deltaElementSeconds = DEFAULT_DELTA_ELEMENT_SECONDS
+        self.fileSeconds = DEFAULT_FILE_SECONDS
+        self.measuredStreams = 0
+
+    def load(self, localdir):
+        metricsPath = migrationMetrics.metricsPaths(localdir)[0]
+        if not os.path.exists(metricsPath):
+            print("No metrics of previous runs in %s, using the default rates" % metricsPath)
+            return self
+        # (run, stream) -> {stage: entry}, only the spans directly below a stream span are used
+        streams = {}
+        with open(metricsPath, 'r') as metricsFile:
+            for line in metricsFile:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get('stream') is not None and entry['stage'] in ('stream', 'download'):
+                    streams.setdefault((entry['run'], entry['stream']), {})[entry['stage']] = entry
+        fullBytes = fullSeconds = deltaElements = deltaSeconds = files = fileSeconds = 0
+        for stages in streams.values():
+            stream = stages.get('stream')
+            download = stages.get('download')
+            if stream is None or download is None or not stream.get('files') or stream.get('failed'):
+                continue
+            if download.get('mode') == 'delta':
+                deltaElements += download.get('elements') or 0
+                deltaSeconds += download['seconds']
+            elif download.get('mode') is None:
+                # a prefetched download happened in the background, its time is unknown
+                fullBytes += stream.get('bytes') or 0
+                fullSeconds += download['seconds']
+            files += stream['files']
+            fileSeconds += stream['seconds'] - download['seconds']
+            self.measuredStreams += 1
+        if fullBytes and fullSeconds:
+            self.bytesPerSecond = fullBytes / fullSeconds
+        if deltaElements:
+            self.deltaElementSeconds = deltaSeconds / deltaElements
+        if files and fileSeconds > 0:
+            self.fileSeconds = fileSeconds / files
+        print("Calibrated from %d migrated streams: %.1f MB/s populated, %.4fs per delta element, %.5fs per file"
+              % (self.measuredStreams, self.bytesPerSecond / MB, self.deltaElementSeconds, self.fileSeconds))
+        return self
+
+def listElements(session, stream, transaction, blacklist):
+    # ({element id: (relative path, size, version)} of the files left after the blacklist, skipped files, bytes)
+    elements = {}
+    skippedFiles = 0
+    skippedBytes = 0
+    with tempfile.TemporaryFile() as statstream:
+        result = session.run(["stat", "-a", "-fx", "-s", stream, "-t", transaction], stdout=statstream)
+        if result.returncode != 0:
+            print("Failed to list the elements of stream %s: %s" % (stream, result.stderr))
+            sys.exit(ERR_ACCUREV)
+        statstream.seek(0)
+        try:
+            for element in accurevParsers.iterElements(statstream):
+                relative = populatePlanner.relativePath(element.path)
+                if not relative or element.isDir:
+                    continue
+                if blacklist.excludes(relative):
+                    skippedFiles += 1
+                    skippedBytes += element.size or 0
+                else:
+                    elements[element.eid] = (relative, element.size or 0, element.version)
+        except ParseError as ex:
+            print("Could not parse the elements of stream %s: %s" % (stream, ex))
+            sys.exit(ERR_ACCUREV)
+    return elements, skippedFiles, skippedBytes
+
+def compareElements(previous, current):
+    # (changed or added files, bytes of their content, moved files, bytes of moved files, removed files)
+    changedFiles = changedBytes = movedFiles = movedBytes = 0
+    for eid, (path, size, version) in current.items():
+        before = previous.get(eid)
+        if before is None or before[2] != version or (version is None and before[1] != size):
+            changedFiles += 1
+            changedBytes += size
+        elif before[0] != path:
+            movedFiles += 1
+            movedBytes += size
+    removedFiles = sum(1 for eid in previous if eid not in current)
+    return changedFiles, changedBytes, movedFiles, movedBytes, removedFiles
+
+def planMigration(accurevuser, accurevpass, data):
+    # Returns the StreamPlan of every stream in migration order
+    localdir = data['gitRepo']
+    session = accurevSession.getSession(accurevuser, accurevpass)
+    blacklist = populatePlanner.Blacklist(data['blacklist'])
+    order = migrationOrder(data)
+    cache = transactionCache.getCache()
+    cache.resolve(session, [stream for branch, stream, predecessor in order])
+    calibration = Calibration().load(localdir)
+    deltaPopulate = data.get('deltaPopulate', False) and 'prefetch' not in data
+
+    # a listing is kept until the last stream compared with it
+    lastUse = {}
+    for index, (branch, stream, predecessor) in enumerate(order):
+        lastUse[predecessor] = index
+    listings = {}
+    plans = []
+    for index, (branch, stream, predecessor) in enumerate(order):
+        print("Listing stream %s: %s" % (stream, time.strftime("%I:%M:%S")))
+        transaction = cache.entries[stream]['transaction']
+        elements, skippedFiles, skippedBytes = listElements(session, stream, transaction, blacklist)
+        files = len(elements)
+        size = sum(entry[1] for entry in elements.values())
+        if predecessor is None:
+            changedFiles, changedBytes, movedFiles, movedBytes, removedFiles = files, size, 0, 0, 0
+        else:
+            changedFiles, changedBytes, movedFiles, movedBytes, removedFiles = \
+                compareElements(listings[predecessor], elements)
+        if deltaPopulate and predecessor is not None:
+            downloadBytes = changedBytes + movedBytes
+            seconds = (changedFiles + movedFiles + removedFiles) * calibration.deltaElementSeconds
+        else:
+            downloadBytes = size
+            seconds = size / calibration.bytesPerSecond
+        seconds += files * calibration.fileSeconds
+        plans.append(StreamPlan(stream, branch, predecessor, transaction, files, size, skippedFiles, skippedBytes,
+                                changedFiles, movedFiles, removedFiles, downloadBytes, changedBytes, seconds))
+        if lastUse.get(stream, -1) > index:
+            listings[stream] = elements
+        for name in [name for name in listings if lastUse[name] <= index]:
+            del listings[name]
+    return plans
+
+def wallSeconds(plans, data):
+    # Serial run, or the longest path when the maintenance branches are built in parallel (parallelMaint):
+    # a _Maint branch starts once its release is committed and runs next to the following releases
+    if 'parallelMaint' not in data:
+        return sum(plan.seconds for plan in plans)
+    master = 0.0
+    branches = {}
+    for plan in plans:
+        if plan.branch == "master":
+            master += plan.seconds
+        else:
+            branches[plan.branch] = branches.get(plan.branch, master) + plan.seconds
+    return max([master] + list(branches.values()))
+
+def printSchedule(plans, data):
+    print("%-30s %-14s %9s %10s %9s %10s %10s %10s %10s" % ("Stream", "Branch", "Files", "MB", "Changed",
+          "Skipped MB", "Download", "Growth MB", "Minutes"))
+    for plan in plans:
+        print("%-30s %-14s %9d %10.1f %9d %10.1f %10.1f %10.1f %10.1f" % (plan.stream, plan.branch, plan.files,
+              plan.bytes / MB, plan.changedFiles, plan.skippedBytes / MB, plan.downloadBytes / MB,
+              plan.growthBytes / MB, plan.seconds / 60.0))
+    download = sum(plan.downloadBytes for plan in plans)
+    growth = sum(plan.growthBytes for plan in plans)
+    largest = max(plan.bytes for plan in plans) if plans else 0
+    # working copy, repo before compression and trees staged ahead by the prefetcher
+    disk = largest + growth + largest * data.get('prefetch', {}).get('depth', 1 if 'prefetch' in data else 0)
+    print("Download %.1f MB, repo growth up to %.1f MB before compression, peak disk %.1f MB"
+          % (download / MB, growth / MB, disk / MB))
+    print("Estimated time %.1f hours (%.1f hours of stream work)"
+          % (wallSeconds(plans, data) / 3600.0, sum(plan.seconds for plan in plans) / 3600.0))
+
+def main(accurevuser, accurevpass, data):
+    print("Planning the migration into %s: %s" % (data['gitRepo'], time.strftime("%I:%M:%S")))
+    plans = planMigration(accurevuser, accurevpass, data)
+    printSchedule(plans, data)
+    with open(planPath(data['gitRepo']), 'w') as planFile:
+        json.dump([plan._asdict() for plan in plans], planFile, indent=4)
+    print("Wrote the plan to %s" % planPath(data['gitRepo']))
+    return plans
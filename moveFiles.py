@@ -11,13 +11,14 @@ Example args:
     --message "Moving Files"
 """
 
-import os
 import getopt
 import sys
 import time
+from xml.etree.ElementTree import ParseError
+import accurevParsers
 import DownloadAccurevStream
 import masterScript
-from subprocess import call
+import renameReplay
 
 __author__ = "Corey Birdsall"
 __copyright__ = "Copyright 2018, PTC, Inc."
@@ -52,30 +53,14 @@ def parse_arguments(argv):
     print("Finished importing arguments")
     return {'accurevStreamName1': accurevStreamName1, 'accurevStreamName2': accurevStreamName2, 'username': accurevuser, 'password': accurevpass, 'message': message}
 
-def getFilesToMove():
-    filesToMove = []
-    with open('filestream.txt', 'r') as file:
-        for line in file.readlines():
-            searchString = "moved to"
-            if searchString in line:
-                searchStringPlace = line.find(searchString)
-                searchStringLength = len(searchString)
-                source = line[:searchStringPlace].strip()
-                target = line[searchStringPlace + searchStringLength:].strip()
-                filesToMove.append([source.strip("/./"),target.strip("/./")])
-    return filesToMove
+def getFilesToMove(changes):
+    return renameReplay.parseMoves(changes)
 
 def moveFiles(filesToMove, message, gitRepo):
-    for source, target in filesToMove:
-        # Verify that target is not a directory
-        # Renamed directories don't work with git mv and will be handled as part of moving the files inside
-        if "." not in os.path.basename(target):
-            continue
-        # Create the directories if needed
-        targetDirectory = os.path.join(gitRepo, os.path.dirname(target))
-        if not os.path.exists(targetDirectory):
-            os.makedirs(targetDirectory)
-        masterScript.gitCallHandler(["mv", "-v", source, target], gitRepo)
+    # Moved folders are renamed as a whole, every move is applied with a single index update
+    if renameReplay.replayRenames(gitRepo, filesToMove) == 0:
+        print("Nothing to move")
+        return
     masterScript.gitCallHandler(["commit", "-m", message, '--author="GeneralUser <GeneralUser@ptc.com>"'], gitRepo)
 
 def main(accurevStreamName1, accurevStreamName2, username, password, message):
@@ -87,33 +72,30 @@ def main(accurevStreamName1, accurevStreamName2, username, password, message):
         accurev = DownloadAccurevStream.Accurev(username, password)
         accurev.login()
 
-        # if filestream.txt already exists
-        try:
-            os.remove('filestream.txt')
-        except OSError:
-            pass
-
-        # ran into issues with String.IO, had to use text file
-        with open('filestream.txt', 'w+') as filestream:
-            # diff returns 0 for no differences, 1 for differences, 2 for error
-            returnCode = call(["accurev", "diff", "-v", accurevStreamName1, "-V", accurevStreamName2, "-a", "-i"], stdout=filestream)
-            if returnCode == 0:
-                return
-            elif returnCode == 1:
-                filesToMove = getFilesToMove()
-                moveFiles(filesToMove, message, data['gitRepo'])
-            else:
-                print("Failed diff streams in Accurev!")
+        # diff returns 0 for no differences, 1 for differences, 2 for error
+        # the XML is parsed line by line as accurev writes it, the diff output is never kept
+        filesToMove = []
+        diffFeed = accurevParsers.DiffFeed()
+        result = accurev.session.run(["diff", "-v", accurevStreamName1, "-V", accurevStreamName2, "-a", "-i", "-fx"],
+                                     okCodes=(0, 1),
+                                     onStdout=lambda line: filesToMove.extend(getFilesToMove(diffFeed.feed(line + '\n'))))
+        if result.returncode == 0:
+            return
+        elif result.returncode == 1:
+            try:
+                filesToMove.extend(getFilesToMove(diffFeed.close()))
+            except ParseError as ex:
+                print("Could not parse the diff of the streams: %s" % ex)
                 sys.exit(DownloadAccurevStream.ERR_ACCUREV)
+            moveFiles(filesToMove, message, data['gitRepo'])
+        else:
+            print("Failed diff streams in Accurev!")
+            sys.exit(DownloadAccurevStream.ERR_ACCUREV)
         
     except Exception as e:
         print(e)
         sys.exit(ERR_UNKNOWN)
     finally:
-        try:
-            os.remove('filestream.txt')
-        except OSError:
-            pass
         print("Finishing moveFiles.py: %s" % time.strftime("%I:%M:%S"))
 
 
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+"""
+populatePlanner.py:
+Plan the population of an AccuRev stream so blacklisted paths are never downloaded. Lists the elements of the
+stream and computes the smallest set of include roots which leaves out every blacklisted subtree.
+Blacklist entries are paths relative to the stream root ("\\Tests\\Data") or glob patterns ("*.pdb",
+"Vendor/*/docs"). Patterns without a slash match the name of a file or folder at any depth.
+Python version 3.6
+"""
+
+import fnmatch
+import os
+import sys
+import tempfile
+from collections import namedtuple
+from xml.etree.ElementTree import ParseError
+import accurevParsers
+
+__author__ = "Samuel M Gile"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+ERR_ACCUREV = 3         # Error communicating with Accurev
+
+# roots are the relative paths to populate recursively, None to populate the whole stream.
+# directories are the folders which are only partially populated and have to be created locally.
+PopulatePlan = namedtuple('PopulatePlan', ['roots', 'directories', 'skippedFiles', 'skippedBytes'])
+
+class Blacklist:
+    def __init__(self, entries):
+        self.paths = set()
+        self.patterns = []
+        # normalized entries, a blacklist leaving out at least the paths of another one contains its entries
+        self.entries = []
+        for entry in entries:
+            relative = self._key(entry.replace('\\', '/').strip('/'))
+            if any(char in relative for char in '*?['):
+                self.patterns.append(relative)
+            elif relative:
+                self.paths.add(relative)
+            if relative:
+                self.entries.append(relative)
+
+    def __bool__(self):
+        return bool(self.paths or self.patterns)
+
+    def _key(self, relative):
+        # paths are case insensitive on Windows
+        return relative.lower() if os.name == 'nt' else relative
+
+    def matches(self, relative):
+        # relative ('/' separated) is blacklisted itself
+        key = self._key(relative)
+        if key in self.paths:
+            return True
+        name = key.rsplit('/', 1)[-1]
+        return any(fnmatch.fnmatchcase(key if '/' in pattern else name, pattern) for pattern in self.patterns)
+
+    def excludes(self, relative):
+        # relative or one of its parent folders is blacklisted
+        parts = relative.split('/')
+        return any(self.matches('/'.join(parts[:index])) for index in range(1, len(parts) + 1))
+
+def relativePath(depotPath):
+    # "/./dir/file" -> "dir/file"
+    return '/'.join(part for part in depotPath.replace('\\', '/').split('/') if part not in ('', '.'))
+
+def _parent(relative):
+    return relative.rsplit('/', 1)[0] if '/' in relative else ''
+
+def planPopulate(session, streamname, transaction, blacklist):
+    # Two passes over the element listing, kept in a temporary file: the first one finds the blacklisted
+    # subtrees and the folders above them, the second one picks the siblings of those which are kept whole.
+    with tempfile.TemporaryFile() as statstream:
+        result = session.run(["stat", "-a", "-fx", "-s", streamname, "-t", transaction], stdout=statstream)
+        if result.returncode != 0:
+            print("Failed to list the elements of stream %s: %s" % (streamname, result.stderr))
+            sys.exit(ERR_ACCUREV)
+        skippedFiles = 0
+        skippedBytes = 0
+        partial = set()
+        try:
+            statstream.seek(0)
+            for element in accurevParsers.iterElements(statstream):
+                relative = relativePath(element.path)
+                if not relative or not blacklist.excludes(relative):
+                    continue
+                if not element.isDir:
+                    skippedFiles += 1
+                    skippedBytes += element.size or 0
+                parent = _parent(relative)
+                if not parent or not blacklist.excludes(parent):
+                    while parent:
+                        partial.add(parent)
+                        parent = _parent(parent)
+                    partial.add('')
+            if not partial:
+                return PopulatePlan(None, [], 0, 0)
+
+            roots = []
+            statstream.seek(0)
+            for element in accurevParsers.iterElements(statstream):
+                relative = relativePath(element.path)
+                if relative and _parent(relative) in partial and relative not in partial \
+                        and not blacklist.excludes(relative):
+                    roots.append(relative)
+        except ParseError as ex:
+            print("Could not parse the elements of stream %s: %s" % (streamname, ex))
+            sys.exit(ERR_ACCUREV)
+    return PopulatePlan(roots, sorted(partial - set([''])), skippedFiles, skippedBytes)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+"""
+prefetch.py:
+Download the next AccuRev streams of a migration into a staging directory while the current stream is
+post-processed and committed, then move the staged tree into the git working copy.
+Python version 3.6
+"""
+
+import os
+import shutil
+import threading
+import time
+import DownloadAccurevStream
+import populatePlanner
+import reparsePoints
+
+__author__ = "Samuel M Gile"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+def treeSize(path):
+    total = 0
+    for (dirpath, dirs, files) in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+    return total
+
+def retargetJunctions(dirname, stagedPath, detector):
+    # Junctions are populated with an absolute target, those of a tree moved out of stagedPath into dirname
+    # still point into stagedPath. They are created again pointing to the same place in dirname.
+    staged = os.path.normcase(os.path.abspath(stagedPath))
+    retargeted = 0
+    pending = [dirname]
+    while pending:
+        current = pending.pop()
+        for entry in os.scandir(current):
+            if current == dirname and entry.name == '.git':
+                continue
+            if detector.isReparseEntry(entry):
+                target = detector.junctionTarget(entry.path)
+                if target is None:
+                    continue
+                absolute = os.path.abspath(target)
+                if os.path.normcase(absolute) != staged and not os.path.normcase(absolute).startswith(staged + os.sep):
+                    continue
+                detector.removeJunction(entry.path)
+                detector.createJunction(entry.path, os.path.normpath(
+                    os.path.join(os.path.abspath(dirname), os.path.relpath(absolute, os.path.abspath(stagedPath)))))
+                retargeted += 1
+            elif entry.is_dir(follow_symlinks=False):
+                pending.append(entry.path)
+    return retargeted
+
+class StreamPrefetcher:
+    # streams must be given in the order the migration consumes them.
+    # depth is the number of streams downloaded ahead of the one being committed, diskBudget (bytes, optional)
+    # caps the size of the staged trees waiting to be consumed.
+    def __init__(self, accurevuser, accurevpass, streams, blacklist, stagingDir, depth=1, diskBudget=None):
+        self.accurev = DownloadAccurevStream.Accurev(accurevuser, accurevpass)
+        self.streams = list(streams)
+        self.blacklist = populatePlanner.Blacklist(blacklist)
+        self.detector = reparsePoints.getDetector()
+        self.stagingDir = stagingDir
+        self.depth = max(1, depth)
+        self.diskBudget = diskBudget
+        self.condition = threading.Condition()
+        self.staged = {}
+        self.stagedBytes = 0
+        self.lastSize = 0
+        self.taken = 0
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name="StreamPrefetcher")
+        self.thread.daemon = True
+
+    def start(self):
+        if not os.path.exists(self.stagingDir):
+            os.makedirs(self.stagingDir)
+        self.thread.start()
+
+    def _waitForRoom(self, index):
+        with self.condition:
+            while index >= self.taken + self.depth or self._overBudget():
+                self.condition.wait()
+
+    def _overBudget(self):
+        # never block when nothing is staged, the next tree has to be downloaded at some point
+        if self.stagedBytes == 0:
+            return False
+        if self.diskBudget is not None and self.stagedBytes + self.lastSize > self.diskBudget:
+            return True
+        return shutil.disk_usage(self.stagingDir).free < self.lastSize
+
+    def _run(self):
+        try:
+            self.accurev.login()
+            for index, stream in enumerate(self.streams):
+                self._waitForRoom(index)
+                path = os.path.join(self.stagingDir, "%03d_%s" % (index, stream))
+                if os.path.exists(path):
+                    shutil.rmtree(path)
+                print("Prefetching stream %s into %s: %s" % (stream, path, time.strftime("%I:%M:%S")))
+                self.accurev.download(stream, path, initRepo=False, blacklist=self.blacklist)
+                size = treeSize(path)
+                with self.condition:
+                    self.staged[index] = (path, self.accurev.transaction, size)
+                    self.stagedBytes += size
+                    self.lastSize = size
+                    self.condition.notify_all()
+        except BaseException as ex:
+            # sys.exit() in the download code only ends this thread, hand the failure to the consumer
+            with self.condition:
+                self.error = ex
+                self.condition.notify_all()
+
+    def swapInto(self, streamname, localdir):
+        # Wait for streamname to be staged and move its tree into localdir, which must already be emptied.
+        # Returns the transaction the stream was populated at.
+        index = self.taken
+        if index >= len(self.streams) or self.streams[index] != streamname:
+            raise ValueError("Stream %s was not prefetched in this order" % streamname)
+        waitStart = time.time()
+        with self.condition:
+            while index not in self.staged and self.error is None:
+                self.condition.wait()
+            if index not in self.staged:
+                raise self.error
+            path, transaction, size = self.staged.pop(index)
+        print("Waited %.1fs for prefetched stream %s" % (time.time() - waitStart, streamname))
+
+        DownloadAccurevStream.create_directory(localdir)
+        for entry in os.listdir(path):
+            shutil.move(os.path.join(path, entry), os.path.join(localdir, entry))
+        shutil.rmtree(path)
+        retargeted = retargetJunctions(localdir, path, self.detector)
+        print("Moved prefetched stream %s into %s, %d junctions pointed into the staged tree"
+              % (streamname, localdir, retargeted))
+
+        with self.condition:
+            self.taken += 1
+            self.stagedBytes -= size
+            self.condition.notify_all()
+        return transaction
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+"""
+processRunner.py:
+Run external commands (accurev, git, fsutil, cmd) on an asyncio event loop shared by the whole run, so
+independent commands can run at the same time. The number of processes running per tool is limited, output
+is captured in memory or handed line by line to a parser as it arrives, and commands can be given a timeout
+or cancelled, which kills the process. Scripts keep calling synchronously with call() and callAll().
+Python version 3.6
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+from collections import namedtuple
+import migrationMetrics
+
+__author__ = "Samuel M Gile"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+# processes running at the same time per tool, other tools use DEFAULT_LIMIT
+LIMITS = {'accurev': 4, 'git': 8, 'fsutil': 16, 'cmd': 16}
+DEFAULT_LIMIT = 8
+CHUNK_SIZE = 64 * 1024
+
+# stdout and stderr are bytes, empty when they went to a file or a parser; returncode is None after a timeout
+ProcessResult = namedtuple('ProcessResult', ['returncode', 'stdout', 'stderr'])
+
+def toolName(cmd):
+    # "C:\\AccuRev\\bin\\accurev.exe" -> "accurev"
+    return os.path.splitext(os.path.basename(cmd[0]))[0].lower()
+
+def kill(process):
+    try:
+        process.kill()
+    except ProcessLookupError:
+        pass
+
+class ProcessRunner:
+    def __init__(self):
+        self.loop = None
+        self.lock = threading.Lock()
+        # tool -> asyncio.Semaphore, only used from the loop thread
+        self.semaphores = {}
+
+    def _eventLoop(self):
+        with self.lock:
+            if self.loop is None:
+                # subprocesses need the proactor loop on Windows
+                loop = asyncio.ProactorEventLoop() if os.name == 'nt' else asyncio.new_event_loop()
+                if os.name != 'nt' and sys.version_info < (3, 8):
+                    # the child watcher of older versions has to be attached from the main thread
+                    asyncio.get_child_watcher().attach_loop(loop)
+                threading.Thread(target=loop.run_forever, name='processRunner', daemon=True).start()
+                self.loop = loop
+            return self.loop
+
+    def _semaphore(self, tool):
+        if tool not in self.semaphores:
+            self.semaphores[tool] = asyncio.Semaphore(LIMITS.get(tool, DEFAULT_LIMIT))
+        return self.semaphores[tool]
+
+    async def _pump(self, stream, onLine, chunks):
+        # Collect the output, or hand every complete line to onLine as soon as it is read
+        pending = b''
+        while True:
+            chunk = await stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if onLine is None:
+                chunks.append(chunk)
+                continue
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                onLine(line.rstrip(b'\r').decode('utf-8', 'replace'))
+        if pending and onLine is not None:
+            onLine(pending.rstrip(b'\r').decode('utf-8', 'replace'))
+
+    async def _feed(self, process, input):
+        if input is not None:
+            process.stdin.write(input)
+            await process.stdin.drain()
+            process.stdin.close()
+
+    async def run(self, cmd, tool=None, timeout=None, input=None, stdout=None, onStdout=None, onStderr=None,
+                  cwd=None, shell=False):
+        # Coroutine running cmd once a process of its tool is free. stdout is a file object to write the output
+        # to; onStdout and onStderr receive the output line by line, they run on the loop thread and must not
+        # wait for other commands.
+        async with self._semaphore(tool or toolName(cmd)):
+            outputs = {'stdin': subprocess.PIPE if input is not None else subprocess.DEVNULL,
+                       'stdout': stdout if stdout is not None else subprocess.PIPE, 'stderr': subprocess.PIPE}
+            if shell:
+                process = await asyncio.create_subprocess_shell(subprocess.list2cmdline(cmd), cwd=cwd, **outputs)
+            else:
+                process = await asyncio.create_subprocess_exec(*cmd, cwd=cwd, **outputs)
+            out = []
+            err = []
+            tasks = [self._feed(process, input), self._pump(process.stderr, onStderr, err)]
+            if stdout is None:
+                tasks.append(self._pump(process.stdout, onStdout, out))
+            try:
+                await asyncio.wait_for(asyncio.gather(*tasks), timeout)
+                returncode = await process.wait()
+            except asyncio.TimeoutError:
+                kill(process)
+                await process.wait()
+                returncode = None
+            except asyncio.CancelledError:
+                kill(process)
+                raise
+            return ProcessResult(returncode, b''.join(out), b''.join(err))
+
+    def submit(self, cmd, **kwargs):
+        # Start cmd without waiting for it, returns a concurrent.futures.Future of its ProcessResult.
+        # Cancelling the future kills the process.
+        migrationMetrics.processStarted()
+        return asyncio.run_coroutine_threadsafe(self.run(cmd, **kwargs), self._eventLoop())
+
+    def wait(self, futures):
+        # ProcessResults of submitted commands, in the same order. The processes still running are killed
+        # when the wait is interrupted or one of the commands could not be started.
+        with migrationMetrics.waiting():
+            try:
+                return [future.result() for future in futures]
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    def call(self, cmd, **kwargs):
+        # Run cmd and wait for its ProcessResult, takes the arguments of run()
+        return self.wait([self.submit(cmd, **kwargs)])[0]
+
+    def callAll(self, commands, **kwargs):
+        # Run independent commands at the same time, within the limit of their tool
+        return self.wait([self.submit(cmd, **kwargs) for cmd in commands])
+
+_runner = None
+_runnerLock = threading.Lock()
+
+def getRunner():
+    # The runner shared by every script of this run
+    global _runner
+    with _runnerLock:
+        if _runner is None:
+            _runner = ProcessRunner()
+        return _runner
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+"""
+renameReplay.py:
+Replay the moves of an AccuRev diff in a git repo with a single index update. Moves are the elements of
+accurev diff -fx found under another path in the second stream, moves implied by the move of their parent folder are dropped, and every
+path of the index is mapped through the remaining moves at once, so folder renames, chains (a to b, b to c)
+and cycles (a to b, b to a) need no intermediate state. The working copy is moved along with the index.
+Python version 3.6
+"""
+
+import os
+import sys
+import time
+import accurevParsers
+import migrationMetrics
+import processRunner
+
+__author__ = "Corey Birdsall"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+ERR_GIT = 3             # Failure calling git command
+ERR_CONFLICT = 4        # Two moves end on the same path
+
+STAGING_DIR = 'accurev2git-moves'
+
+def depotRelative(path):
+    # "/./Folder/File.c" -> "Folder/File.c"
+    path = path.strip().replace('\\', '/')
+    if path.startswith('/./'):
+        path = path[3:]
+    return path.strip('/')
+
+def parseMoves(changes):
+    # [(source, target)] of the accurevParsers.ElementChanges which are moves, paths relative to the stream root
+    return [(depotRelative(change.oldPath), depotRelative(change.newPath)) for change in changes
+            if accurevParsers.isMove(change)]
+
+def parentPaths(path):
+    # "a/b/c" -> "a/b", "a"
+    parts = path.split('/')
+    for index in range(len(parts) - 1, 0, -1):
+        yield '/'.join(parts[:index])
+
+class MoveSet:
+    def __init__(self, moves):
+        self.moves = {}
+        for source, target in moves:
+            if source != target:
+                self.moves[source] = target
+        self.collapse()
+
+    def collapse(self):
+        # Drop the moves of elements which only follow the move of a folder they are in
+        for source in sorted(self.moves, key=lambda path: path.count('/'), reverse=True):
+            for parent in parentPaths(source):
+                if parent in self.moves:
+                    if self.moves[source] == self.moves[parent] + source[len(parent):]:
+                        del self.moves[source]
+                    break
+
+    def __len__(self):
+        return len(self.moves)
+
+    def map(self, path):
+        # New path of an index path: its own move, else the move of the closest folder it is in
+        if path in self.moves:
+            return self.moves[path]
+        for parent in parentPaths(path):
+            if parent in self.moves:
+                return self.moves[parent] + path[len(parent):]
+        return path
+
+def readIndex(gitRepo):
+    # [(mode, blob id, path)] of the index
+    result = processRunner.getRunner().call(["git", "-C", gitRepo, "ls-files", "-s", "-z"])
+    if result.returncode != 0:
+        print("Failed to read the index of %s" % gitRepo)
+        sys.exit(ERR_GIT)
+    entries = []
+    for record in result.stdout.decode('utf-8', 'surrogateescape').split('\0'):
+        if record:
+            info, path = record.split('\t', 1)
+            mode, blob, stage = info.split(' ')
+            entries.append((mode, blob, path))
+    return entries
+
+def updateIndex(gitRepo, removed, added):
+    # Remove and add index entries with one git update-index process
+    records = ["0 %s\t%s" % ('0' * 40, path) for path in removed]
+    records.extend("%s %s\t%s" % (mode, blob, path) for mode, blob, path in added)
+    result = processRunner.getRunner().call(["git", "-C", gitRepo, "update-index", "-z", "--index-info"],
+                                            input=''.join(record + '\0' for record in records)
+                                            .encode('utf-8', 'surrogateescape'))
+    if result.returncode != 0:
+        print("Failed to update the index of %s" % gitRepo)
+        sys.exit(ERR_GIT)
+
+def moveWorkingCopy(gitRepo, moveSet):
+    # Move every source out of the way first, deepest first, then into place, shallowest first,
+    # so a target may be the source of another move
+    staging = os.path.join(gitRepo, '.git', STAGING_DIR)
+    os.makedirs(staging, exist_ok=True)
+    staged = []
+    for index, source in enumerate(sorted(moveSet.moves, key=lambda path: path.count('/'), reverse=True)):
+        fullpath = os.path.join(gitRepo, *source.split('/'))
+        if not os.path.lexists(fullpath):
+            print("%s is not in the working copy, only the index is updated" % source)
+            continue
+        temporary = os.path.join(staging, str(index))
+        os.rename(fullpath, temporary)
+        staged.append((temporary, moveSet.moves[source]))
+    for temporary, target in sorted(staged, key=lambda move: move[1].count('/')):
+        fullpath = os.path.join(gitRepo, *target.split('/'))
+        os.makedirs(os.path.dirname(fullpath), exist_ok=True)
+        os.rename(temporary, fullpath)
+    os.rmdir(staging)
+
+def replayRenames(gitRepo, moves):
+    # Apply the (source, target) moves to the index and the working copy of gitRepo, nothing is committed.
+    # Returns the number of index entries moved.
+    moveSet = MoveSet(moves)
+    print("Replaying %d moves (%d listed): %s" % (len(moveSet), len(moves), time.strftime("%I:%M:%S")))
+    if not moveSet:
+        return 0
+    with migrationMetrics.span('renames') as renameSpan:
+        entries = readIndex(gitRepo)
+        removed = []
+        added = []
+        paths = {}
+        for mode, blob, path in entries:
+            newPath = moveSet.map(path)
+            if newPath != path:
+                removed.append(path)
+                added.append((mode, blob, newPath))
+            if newPath in paths:
+                print("%s and %s are both moved to %s" % (paths[newPath], path, newPath))
+                sys.exit(ERR_CONFLICT)
+            paths[newPath] = path
+        moveWorkingCopy(gitRepo, moveSet)
+        updateIndex(gitRepo, removed, added)
+        renameSpan.add(files=len(added), moves=len(moveSet))
+    print("Moved %d files" % len(added))
+    return len(added)
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+"""
+reparsePoints.py:
+Detect Windows junctions and links in a populated tree and convert them, using in-process filesystem
+metadata where possible and the fsutil/mklink commands only when that is not enough.
+The POSIX detector treats symbolic links with an absolute target as junctions, so the conversion can be
+exercised on Linux.
+Python version 3.6
+"""
+
+import abc
+import os
+import stat
+import sys
+import processRunner
+
+__author__ = "Kiersten Marr"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+FILE_ATTRIBUTE_REPARSE_POINT = 0x400
+IO_REPARSE_TAG_MOUNT_POINT = 0xA0000003
+
+class ReparsePointDetector(abc.ABC):
+    # Detectors implement the abstract methods, a detector missing one of them cannot be created
+    def __init__(self):
+        # number of external processes started, reported by the scripts using the detector
+        self.subprocessCalls = 0
+
+    @abc.abstractmethod
+    def isReparsePoint(self, path):
+        # True for junctions and links, which must not be descended into
+        pass
+
+    def isReparseEntry(self, entry):
+        # Same as isReparsePoint for an os.scandir entry, detectors can use the metadata cached in the entry
+        return self.isReparsePoint(entry.path)
+
+    @abc.abstractmethod
+    def junctionTarget(self, path):
+        # Absolute target of a junction, None if path is not a junction (for instance already a symbolic link)
+        pass
+
+    @abc.abstractmethod
+    def removeJunction(self, path):
+        # Delete the junction without removing its destination
+        pass
+
+    @abc.abstractmethod
+    def createDirectoryLink(self, path, target):
+        # Create a symbolic link to a directory, target is relative to the link's directory
+        pass
+
+    @abc.abstractmethod
+    def createJunction(self, path, target):
+        # Create a junction to a directory, target is absolute
+        pass
+
+    def junctionTargets(self, paths):
+        # junctionTarget of several paths, detectors starting processes look them up at the same time
+        return [self.junctionTarget(path) for path in paths]
+
+    def convertJunctions(self, junctions):
+        # Replace the junctions of a list of (path, link target relative to the link's directory) by links
+        for path, target in junctions:
+            self.removeJunction(path)
+            self.createDirectoryLink(path, target)
+
+class FsutilDetector(ReparsePointDetector):
+    # One fsutil process per query, this is what the scripts did originally. Queries of several paths run at
+    # the same time through processRunner.py.
+    def _call(self, cmd, **kwargs):
+        self.subprocessCalls += 1
+        return processRunner.getRunner().call(cmd, **kwargs)
+
+    def _callAll(self, commands, **kwargs):
+        self.subprocessCalls += len(commands)
+        return processRunner.getRunner().callAll(commands, **kwargs)
+
+    def _substituteName(self, result):
+        if result.returncode != 0:
+            return None
+        searchString = "\\??\\"
+        for line in result.stdout.decode(errors='replace').splitlines():
+            if "Substitute" in line and searchString in line:
+                return line[line.find(searchString) + len(searchString):].strip()
+        return None
+
+    def isReparsePoint(self, path):
+        return self._call(["fsutil", "reparsepoint", "query", path]).returncode == 0
+
+    def junctionTarget(self, path):
+        return self._substituteName(self._call(["fsutil", "reparsepoint", "query", path]))
+
+    def junctionTargets(self, paths):
+        return [self._substituteName(result)
+                for result in self._callAll([["fsutil", "reparsepoint", "query", path] for path in paths])]
+
+    def removeJunction(self, path):
+        self._call(["fsutil", "reparsepoint", "delete", path])
+        os.rmdir(path)
+
+    def createDirectoryLink(self, path, target):
+        self._call(["cmd", "/c", "mklink", "/d", path, target])
+
+    def createJunction(self, path, target):
+        # junctions need no privilege, but only cmd can create them
+        self._call(["cmd", "/c", "mklink", "/j", path, target])
+
+    def convertJunctions(self, junctions):
+        self._callAll([["fsutil", "reparsepoint", "delete", path] for path, target in junctions])
+        for path, target in junctions:
+            os.rmdir(path)
+        self._callAll([["cmd", "/c", "mklink", "/d", path, target] for path, target in junctions])
+
+class WindowsDetector(FsutilDetector):
+    # Reads the reparse attributes from lstat, falls back to fsutil on Python versions without st_reparse_tag
+    def junctionTargets(self, paths):
+        # lstat answers without starting a process
+        return ReparsePointDetector.junctionTargets(self, paths)
+
+    def convertJunctions(self, junctions):
+        ReparsePointDetector.convertJunctions(self, junctions)
+
+    def isReparsePoint(self, path):
+        try:
+            attributes = os.lstat(path).st_file_attributes
+        except OSError:
+            return False
+        return bool(attributes & FILE_ATTRIBUTE_REPARSE_POINT)
+
+    def isReparseEntry(self, entry):
+        # the attributes come with the directory listing on Windows, no extra system call is made
+        try:
+            attributes = entry.stat(follow_symlinks=False).st_file_attributes
+        except OSError:
+            return False
+        return bool(attributes & FILE_ATTRIBUTE_REPARSE_POINT)
+
+    def junctionTarget(self, path):
+        info = os.lstat(path)
+        if not info.st_file_attributes & FILE_ATTRIBUTE_REPARSE_POINT:
+            return None
+        tag = getattr(info, 'st_reparse_tag', None)
+        if tag is None:
+            return FsutilDetector.junctionTarget(self, path)
+        if tag != IO_REPARSE_TAG_MOUNT_POINT:
+            return None
+        try:
+            target = os.readlink(path)
+        except (OSError, ValueError):
+            return FsutilDetector.junctionTarget(self, path)
+        for prefix in ("\\\\?\\", "\\??\\"):
+            if target.startswith(prefix):
+                target = target[len(prefix):]
+        return target
+
+    def removeJunction(self, path):
+        # removing a junction as a directory leaves its destination alone
+        os.rmdir(path)
+
+    def createDirectoryLink(self, path, target):
+        try:
+            os.symlink(target, path, target_is_directory=True)
+        except OSError:
+            # creating symbolic links needs a privilege or developer mode, mklink may still succeed through cmd
+            FsutilDetector.createDirectoryLink(self, path, target)
+
+class PosixDetector(ReparsePointDetector):
+    # Symbolic links stand in for reparse points, those with an absolute target stand in for junctions
+    def isReparsePoint(self, path):
+        try:
+            return stat.S_ISLNK(os.lstat(path).st_mode)
+        except OSError:
+            return False
+
+    def isReparseEntry(self, entry):
+        return entry.is_symlink()
+
+    def junctionTarget(self, path):
+        if not os.path.islink(path):
+            return None
+        target = os.readlink(path)
+        return target if os.path.isabs(target) else None
+
+    def removeJunction(self, path):
+        os.remove(path)
+
+    def createDirectoryLink(self, path, target):
+        os.symlink(target, path, target_is_directory=True)
+
+    def createJunction(self, path, target):
+        os.symlink(target, path, target_is_directory=True)
+
+DETECTORS = {'fsutil': FsutilDetector, 'windows': WindowsDetector, 'posix': PosixDetector}
+
+def getDetector(name=None):
+    # name is one of DETECTORS, by default the detector matching the platform is used
+    if name is None:
+        name = 'windows' if sys.platform == 'win32' else 'posix'
+    return DETECTORS[name]()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+"""
+sharedStore.py:
+Share git objects between migrations. The migrated repo borrows the objects of a persistent bare repo through
+git alternates, so files already stored by an earlier run or by a sibling repo are not written again. Once the
+migration completes its branches and tags are pushed to the store under refs/migrations/<name>/, which only
+copies the objects the store does not have yet and keeps them from being pruned.
+Example args:
+    --store C:\\git-objects.git
+    --prune (remove the refs of migrated repos which no longer exist, then the objects nothing refers to)
+    --expire 2.weeks.ago (optional, objects added to the store since are kept by --prune)
+    --dissociate C:\\Migration\\repo (copy the borrowed objects into a migrated repo and stop using the store)
+Python version 3.6
+"""
+
+import getopt
+import json
+import os
+import subprocess
+import sys
+import time
+import migrationMetrics
+
+__author__ = "Michael C Brown"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+ERR_PARSING_ARGS = 1    # Encounter an error parsing arguments
+ERR_GIT = 3             # Failure calling git command
+
+REGISTRY_NAME = 'accurev2git-repos.json'
+REF_PREFIX = 'refs/migrations/'
+DEFAULT_EXPIRE = '2.weeks.ago'
+
+def git(args, cwd):
+    returncode = migrationMetrics.runProcess(subprocess.call, ["git", "-C", cwd] + args)
+    if returncode != 0:
+        print("Failed to execute command: git " + " ".join(args))
+        sys.exit(ERR_GIT)
+
+def gitOutput(args, cwd):
+    return migrationMetrics.runProcess(subprocess.check_output, ["git", "-C", cwd] + args).decode().strip()
+
+def alternatesPath(localdir):
+    # objects/info/alternates of the repo, worktrees share the one of their main repo
+    path = gitOutput(["rev-parse", "--git-path", "objects/info/alternates"], localdir)
+    return path if os.path.isabs(path) else os.path.join(localdir, path)
+
+def readAlternates(localdir):
+    path = alternatesPath(localdir)
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as alternatesFile:
+        return [line.strip() for line in alternatesFile if line.strip() and not line.startswith('#')]
+
+class SharedStore:
+    def __init__(self, path, name=None):
+        self.path = os.path.abspath(path)
+        self.name = name
+        self.objects = os.path.join(self.path, 'objects').replace('\\', '/')
+        self.attached = set()
+        if not os.path.exists(os.path.join(self.path, 'objects')):
+            print("Creating shared object store %s" % self.path)
+            git(["init", "-q", "--bare", self.path], os.getcwd())
+
+    def registryPath(self):
+        return os.path.join(self.path, REGISTRY_NAME)
+
+    def registry(self):
+        # {name: {"path": migrated repo, "published": seconds since the epoch}}
+        try:
+            with open(self.registryPath(), 'r') as registryFile:
+                return json.load(registryFile)
+        except (OSError, ValueError):
+            return {}
+
+    def saveRegistry(self, registry):
+        with open(self.registryPath(), 'w') as registryFile:
+            json.dump(registry, registryFile, indent=4, sort_keys=True)
+
+    def repoName(self, localdir):
+        return self.name or os.path.basename(os.path.abspath(localdir).rstrip('\\/'))
+
+    def attach(self, localdir):
+        # Let the repo read the objects of the store, git then skips writing the objects it already holds
+        if localdir in self.attached:
+            return
+        self.attached.add(localdir)
+        if self.objects in readAlternates(localdir):
+            return
+        with open(alternatesPath(localdir), 'a') as alternatesFile:
+            alternatesFile.write(self.objects + '\n')
+        print("Borrowing objects from the shared store %s" % self.path)
+
+    def publish(self, localdir):
+        # Copy the objects the store does not have yet and keep every object of the repo reachable in the store
+        name = self.repoName(localdir)
+        with migrationMetrics.span('publishObjects', repo=name):
+            prefix = REF_PREFIX + name + '/'
+            git(["push", "-q", "--prune", self.path, "+refs/heads/*:%sheads/*" % prefix,
+                 "+refs/tags/*:%stags/*" % prefix], localdir)
+        registry = self.registry()
+        registry[name] = {'path': os.path.abspath(localdir), 'published': time.time()}
+        self.saveRegistry(registry)
+        print("Published the objects of %s to the shared store %s" % (name, self.path))
+
+    def prune(self, expire=DEFAULT_EXPIRE):
+        # Forget the repos which were deleted or no longer borrow from the store, then delete the objects
+        # none of the remaining repos refer to. Never prune while a migration into the store is running.
+        registry = self.registry()
+        for name, entry in sorted(registry.items()):
+            repo = entry['path']
+            if os.path.isdir(repo) and self.objects in readAlternates(repo):
+                continue
+            print("Repo %s is gone from %s, removing its refs" % (name, repo))
+            refs = gitOutput(["for-each-ref", "--format=%(refname)", REF_PREFIX + name + '/'], self.path).split()
+            if refs:
+                subprocess.run(["git", "-C", self.path, "update-ref", "--stdin"],
+                               input=''.join("delete %s\n" % ref for ref in refs).encode('utf-8'), check=True)
+            del registry[name]
+        self.saveRegistry(registry)
+        git(["-c", "gc.reflogExpire=now", "gc", "-q", "--prune=" + expire], self.path)
+        print("Pruned the shared store %s" % self.path)
+
+def dissociate(localdir):
+    # Copy every borrowed object into the repo and stop borrowing, for instance before the store is deleted
+    if not readAlternates(localdir):
+        print("%s does not borrow objects" % localdir)
+        return
+    git(["repack", "-a", "-d", "-q"], localdir)
+    os.remove(alternatesPath(localdir))
+    print("%s no longer uses a shared object store" % localdir)
+
+def parse_arguments(argv):
+    try:
+        print("Importing arguments")
+        opts, args = getopt.getopt(argv, "", ["store=", "prune", "expire=", "dissociate="])
+    except Exception as e:
+        print(e)
+        sys.exit(ERR_PARSING_ARGS)
+
+    arguments = {'store': None, 'prune': False, 'expire': DEFAULT_EXPIRE, 'dissociate': None}
+    for opt, arg in opts:
+        if opt == '--store':
+            arguments['store'] = arg
+        elif opt == '--prune':
+            arguments['prune'] = True
+        elif opt == '--expire':
+            arguments['expire'] = arg
+        elif opt == '--dissociate':
+            arguments['dissociate'] = arg
+    if arguments['prune'] and arguments['store'] is None:
+        print("--prune needs the --store to prune")
+        sys.exit(ERR_PARSING_ARGS)
+
+    print("Finished importing arguments")
+    return arguments
+
+def main(store=None, prune=False, expire=DEFAULT_EXPIRE, dissociateRepo=None):
+    print("Starting sharedStore.py: %s" % time.strftime("%I:%M:%S"))
+    if dissociateRepo is not None:
+        dissociate(dissociateRepo)
+    if prune:
+        SharedStore(store).prune(expire)
+    print("Finished sharedStore.py: %s" % time.strftime("%I:%M:%S"))
+
+
+if __name__ == '__main__':
+    arguments = parse_arguments(sys.argv[1:])
+    main(arguments['store'], arguments['prune'], arguments['expire'], arguments['dissociate'])
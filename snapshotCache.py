@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+
+"""
+snapshotCache.py:
+Keep the populated trees of stream snapshots in a local cache keyed by stream and transaction, so a rerun
+restores them instead of populating them from AccuRev again. File contents are stored once by git blob id
+however many snapshots contain them, each snapshot is a manifest of its folders, files and links. Once the
+contents grow past the disk budget the least recently used snapshots are dropped, along with the contents no
+other snapshot uses.
+Python version 3.6
+"""
+
+import collections
+import json
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+import contentManifest
+import materializer
+import migrationMetrics
+import reparsePoints
+
+__author__ = "Corey Birdsall"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+DEFAULT_BUDGET_GB = 50
+COPY_WORKERS = 8
+GB = 1024 * 1024 * 1024
+
+def defaultPath(localdir):
+    return localdir.rstrip('\\/') + '_snapshots'
+
+def snapshotName(stream, transaction):
+    return "%s@%s.json" % (re.sub(r'[^\w.-]', '_', stream), transaction)
+
+def localPath(dirname, relative):
+    return os.path.join(dirname, *[part for part in relative.split('/') if part not in ('', '.')])
+
+def writeJson(path, content):
+    # a snapshot being read by another process is never seen half written
+    handle, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.snapshot')
+    with os.fdopen(handle, 'w') as target:
+        json.dump(content, target)
+    os.replace(temporary, path)
+
+class SnapshotCache:
+    def __init__(self, path, diskBudget, workers=COPY_WORKERS, hardlinks=True):
+        self.path = path
+        self.objectsDir = os.path.join(path, 'objects')
+        self.snapshotsDir = os.path.join(path, 'snapshots')
+        # bytes of file contents kept, the manifests are not counted
+        self.diskBudget = diskBudget
+        self.workers = workers
+        # restored files may be hard links to the stored contents, which are never written to
+        self.hardlinks = hardlinks
+        self.detector = reparsePoints.getDetector()
+
+    def _objectPath(self, blob):
+        return os.path.join(self.objectsDir, blob[0:2], blob[2:])
+
+    def _snapshotPath(self, stream, transaction):
+        return os.path.join(self.snapshotsDir, snapshotName(stream, transaction))
+
+    def lookup(self, stream, transaction, blacklist):
+        # The snapshot of the stream at the transaction, None when it is not cached or was stored with paths
+        # left out which blacklist (a populatePlanner.Blacklist) no longer leaves out
+        try:
+            with open(self._snapshotPath(stream, transaction), 'r') as snapshotFile:
+                snapshot = json.load(snapshotFile)
+        except (OSError, ValueError):
+            return None
+        if snapshot.get('stream') != stream or snapshot.get('transaction') != transaction:
+            return None
+        if not set(snapshot['excluded']) <= set(blacklist.entries):
+            print("Snapshot of stream %s at transaction %s was cached with another blacklist" % (stream, transaction))
+            return None
+        return snapshot
+
+    def restore(self, snapshot, dirname, blacklist):
+        # Fill dirname, empty apart from its .git folder, with a snapshot returned by lookup. Returns False when
+        # contents of the snapshot were evicted meanwhile, dirname must then be cleared by the caller.
+        stream, transaction = snapshot['stream'], snapshot['transaction']
+        kept = lambda relative: not blacklist.excludes(relative)
+        files = [(relative, blob, size) for relative, (blob, size) in snapshot['files'].items() if kept(relative)]
+        try:
+            for relative in snapshot['dirs']:
+                if kept(relative):
+                    os.makedirs(localPath(dirname, relative), exist_ok=True)
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                methods = list(pool.map(lambda item: self._copyOut(dirname, *item[0:2]), files))
+            for relative, (kind, target) in snapshot['links'].items():
+                if kept(relative):
+                    self._createLink(dirname, relative, kind, target)
+        except OSError as ex:
+            print("Snapshot of stream %s at transaction %s could not be restored: %s" % (stream, transaction, ex))
+            self._remove(self._snapshotPath(stream, transaction))
+            return False
+        # the modification time of the manifest is the last use the eviction goes by
+        os.utime(self._snapshotPath(stream, transaction))
+        placed = collections.Counter()
+        for (relative, blob, size), method in zip(files, methods):
+            placed[method] += size
+        print("Restored stream %s at transaction %s from the snapshot cache (%d files): %.1f MB cloned, "
+              "%.1f MB hard linked, %.1f MB copied" % (stream, transaction, len(files),
+              placed[materializer.REFLINK] / 1024.0 / 1024.0, placed[materializer.HARDLINK] / 1024.0 / 1024.0,
+              placed[materializer.COPY] / 1024.0 / 1024.0))
+        migrationMetrics.current().add(clonedBytes=placed[materializer.REFLINK],
+                                       linkedBytes=placed[materializer.HARDLINK],
+                                       copiedBytes=placed[materializer.COPY])
+        return True
+
+    def _copyOut(self, dirname, relative, blob):
+        return materializer.getMaterializer().place(self._objectPath(blob), localPath(dirname, relative),
+                                                    linkable=self.hardlinks)
+
+    def _createLink(self, dirname, relative, kind, target):
+        path = localPath(dirname, relative)
+        if kind == 'link':
+            os.symlink(target, path)
+        else:
+            # junctions into the tree point to the tree being restored, not to the one which was cached
+            if kind == 'treeJunction':
+                target = os.path.abspath(localPath(dirname, target))
+            self.detector.createJunction(path, target)
+
+    def store(self, stream, transaction, dirname, blacklist):
+        # Add the tree populated in dirname, from which the paths of blacklist were left out. A cache which
+        # can't be written only costs the next run a population.
+        print("Storing stream %s at transaction %s in the snapshot cache: %s"
+              % (stream, transaction, time.strftime("%I:%M:%S")))
+        dirs = []
+        files = {}
+        links = {}
+        try:
+            self._scan(dirname, '', dirs, files, links)
+            paths = list(files)
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                stored = list(pool.map(self._storeFile, [files[path] for path in paths]))
+            os.makedirs(self.snapshotsDir, exist_ok=True)
+            writeJson(self._snapshotPath(stream, transaction),
+                      {'stream': stream, 'transaction': transaction, 'excluded': sorted(blacklist.entries),
+                       'dirs': dirs, 'files': dict((path, [blob, size]) for path, (blob, size, new)
+                                                   in zip(paths, stored)),
+                       'links': links})
+        except OSError as ex:
+            print("Could not store stream %s in the snapshot cache: %s" % (stream, ex))
+            return
+        newBytes = sum(size for blob, size, new in stored if new)
+        print("Stored %d files of stream %s, %.1f MB of new contents"
+              % (len(stored), stream, newBytes / 1024.0 / 1024.0))
+        self.evict(keep=snapshotName(stream, transaction))
+
+    def _scan(self, dirname, relative, dirs, files, links):
+        for entry in os.scandir(localPath(dirname, relative)):
+            child = relative + '/' + entry.name if relative else entry.name
+            if child == '.git':
+                continue
+            if self.detector.isReparseEntry(entry):
+                links[child] = self._link(dirname, entry.path)
+            elif entry.is_dir():
+                dirs.append(child)
+                self._scan(dirname, child, dirs, files, links)
+            else:
+                files[child] = entry.path
+
+    def _link(self, dirname, path):
+        # [kind, target]: junctions into the tree keep their target relative to the tree
+        target = self.detector.junctionTarget(path)
+        if target is None:
+            return ['link', os.readlink(path)]
+        root = os.path.normcase(os.path.abspath(dirname))
+        absolute = os.path.abspath(target)
+        if os.path.normcase(absolute) == root or os.path.normcase(absolute).startswith(root + os.sep):
+            return ['treeJunction', os.path.relpath(absolute, os.path.abspath(dirname)).replace(os.sep, '/')]
+        return ['junction', target]
+
+    def _storeFile(self, fullpath):
+        # Returns (blob id, size, stored): stored is False when the content was already in the cache
+        blob = contentManifest.blobId(fullpath)
+        size = os.path.getsize(fullpath)
+        target = self._objectPath(blob)
+        if os.path.exists(target):
+            return blob, size, False
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        handle, temporary = tempfile.mkstemp(dir=os.path.dirname(target), prefix='.snapshot')
+        os.close(handle)
+        # the working copy is still to be post-processed, it is cloned or copied but never linked
+        materializer.getMaterializer().place(fullpath, temporary)
+        os.replace(temporary, target)
+        return blob, size, True
+
+    def _objects(self):
+        # {blob id: size} of the stored contents
+        objects = {}
+        if not os.path.isdir(self.objectsDir):
+            return objects
+        for prefix in os.listdir(self.objectsDir):
+            for entry in os.scandir(os.path.join(self.objectsDir, prefix)):
+                if not entry.name.startswith('.'):
+                    objects[prefix + entry.name] = entry.stat().st_size
+        return objects
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def evict(self, keep=None):
+        # Drop the least recently used snapshots other than keep until the contents fit in the disk budget.
+        # A snapshot restored by another process while its contents go is populated from AccuRev instead.
+        objects = self._objects()
+        used = sum(objects.values())
+        if used <= self.diskBudget:
+            return
+        snapshots = []
+        references = collections.Counter()
+        for name in os.listdir(self.snapshotsDir):
+            path = os.path.join(self.snapshotsDir, name)
+            if not name.endswith('.json') or name.startswith('.'):
+                continue
+            try:
+                lastUse = os.stat(path).st_mtime
+                with open(path, 'r') as snapshotFile:
+                    blobs = set(blob for blob, size in json.load(snapshotFile)['files'].values())
+            except (OSError, ValueError, KeyError):
+                continue
+            references.update(blobs)
+            snapshots.append((lastUse, name, blobs))
+
+        def release(blobs):
+            freed = 0
+            for blob in blobs:
+                references[blob] -= 1
+                if references[blob] <= 0 and blob in objects:
+                    self._remove(self._objectPath(blob))
+                    freed += objects.pop(blob)
+            return freed
+
+        # contents of snapshots which were never completely stored
+        used -= release([blob for blob in objects if not references[blob]])
+        evicted = 0
+        for lastUse, name, blobs in sorted(snapshots):
+            if used <= self.diskBudget:
+                break
+            if name == keep:
+                continue
+            self._remove(os.path.join(self.snapshotsDir, name))
+            used -= release(blobs)
+            evicted += 1
+        print("Evicted %d snapshots from the snapshot cache, %.1f MB of contents left"
+              % (evicted, used / 1024.0 / 1024.0))
+
+_cache = None
+
+def configure(localdir, settings):
+    # settings of the "snapshotCache" key of config.json, None disables the cache
+    global _cache
+    if settings is None:
+        _cache = None
+    else:
+        _cache = SnapshotCache(settings.get('path', defaultPath(localdir)),
+                               settings.get('diskBudgetGB', DEFAULT_BUDGET_GB) * GB,
+                               settings.get('workers', COPY_WORKERS), settings.get('hardlinks', True))
+
+def getCache():
+    # The cache configured for this process, None when snapshots are not cached
+    return _cache
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+"""
+streamGraph.py:
+Migrate the AccuRev stream hierarchy instead of the releases of config.json (masterScript.py with "streamGraph").
+Streams are migrated parents first, each onto a branch of its own named after it. The parent of its commit is
+the commit of the already migrated stream whose tree is closest, looked for among the streams a few basis links
+away in the hierarchy. The working copy is brought to the tree of that base and only the elements which differ
+are populated.
+Python version 3.6
+"""
+
+import collections
+import re
+import sys
+import time
+import accurevSession
+import contentManifest
+import DownloadAccurevStream
+import masterScript
+import migrationJournal
+import migrationMetrics
+import migrationPlanner
+import populatePlanner
+import transactionCache
+
+__author__ = "Samuel M Gile"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+ERR_ACCUREV = 3         # Error communicating with Accurev
+ERR_STREAMS = 4         # streamGraph names streams AccuRev does not know
+
+DEFAULT_SEARCH_DEPTH = 2
+# workspaces hold the work of a single user, they are never migrated
+SKIPPED_TYPES = ('workspace',)
+
+def branchName(stream):
+    # AccuRev allows characters in stream names which git does not allow in ref names
+    name = re.sub(r'[\s~^:?*\[\\]+|\.\.+|@\{', '_', stream)
+    return name.strip('./') or '_'
+
+class StreamGraph:
+    # The hierarchy of "accurev show streams", every stream is linked to its basis
+    def __init__(self, streams):
+        # {stream name: accurevParsers.Stream}
+        self.streams = streams
+        self.children = collections.defaultdict(list)
+        for stream in streams.values():
+            if stream.basis in streams:
+                self.children[stream.basis].append(stream.name)
+
+    def _known(self, names):
+        unknown = [name for name in names if name not in self.streams]
+        if unknown:
+            print("Streams %s of streamGraph are not in AccuRev" % ", ".join(unknown))
+            sys.exit(ERR_STREAMS)
+        return names
+
+    def select(self, settings):
+        # Streams to migrate in migration order: the streams listed, the hierarchy below root or every stream
+        if 'streams' in settings:
+            selected = set(self._known(settings['streams']))
+        elif 'root' in settings:
+            selected = set(self.below(self._known([settings['root']])[0]))
+        else:
+            selected = set(self.streams)
+        return self.order(set(name for name in selected if self.streams[name].type not in SKIPPED_TYPES))
+
+    def below(self, root):
+        found = []
+        pending = [root]
+        while pending:
+            name = pending.pop()
+            found.append(name)
+            pending.extend(self.children[name])
+        return found
+
+    def ancestors(self, name):
+        seen = set()
+        basis = self.streams[name].basis
+        while basis in self.streams and basis not in seen:
+            seen.add(basis)
+            yield basis
+            basis = self.streams[basis].basis
+
+    def _sortKey(self, name):
+        created = self.streams[name].time
+        return (int(created) if created and created.isdigit() else 0, name)
+
+    def order(self, selected):
+        # parents before their children, siblings in the order they were created
+        roots = [name for name in selected if not any(basis in selected for basis in self.ancestors(name))]
+        ordered = []
+        pending = sorted(roots, key=self._sortKey, reverse=True)
+        while pending:
+            name = pending.pop()
+            if name in selected:
+                ordered.append(name)
+            pending.extend(sorted(self.children[name], key=self._sortKey, reverse=True))
+        return ordered
+
+    def neighbours(self, name, depth):
+        # {stream: basis links away from name} of the streams at most depth links away, name included
+        distances = {name: 0}
+        frontier = [name]
+        for hop in range(1, depth + 1):
+            following = []
+            for current in frontier:
+                linked = list(self.children[current])
+                if self.streams[current].basis in self.streams:
+                    linked.append(self.streams[current].basis)
+                for stream in linked:
+                    if stream not in distances:
+                        distances[stream] = hop
+                        following.append(stream)
+            frontier = following
+        return distances
+
+def chooseBase(graph, stream, elements, listings, depth):
+    # (base, elements differing from it) of the migrated stream with the closest tree among the neighbours of
+    # stream, (None, None) when no neighbour is migrated. listings holds the element listings of migrated streams.
+    best = None
+    for candidate, hops in graph.neighbours(stream, depth).items():
+        if candidate == stream or candidate not in listings:
+            continue
+        changed, changedBytes, moved, movedBytes, removed = migrationPlanner.compareElements(listings[candidate],
+                                                                                            elements)
+        key = (changed + moved + removed, hops)
+        if best is None or key < best[0]:
+            best = (key, candidate)
+    if best is None:
+        return None, None
+    return best[1], best[0][0]
+
+def startBranch(localdir, context, branch, base, baseTransaction):
+    # Create the branch at the commit of base with the tree of base in the working copy, or as a new history
+    # without any commit when base is None
+    if context.resuming and context.journal.lastCommit(branch) is not None:
+        context.currentBranch = branch
+        return
+    if context.resuming:
+        context.resumeAt(localdir)
+    if base is None:
+        print("Starting a new history on branch %s" % branch)
+        if context.importer is not None:
+            context.importer.checkout(branch)
+        else:
+            masterScript.gitCallHandler(["symbolic-ref", "HEAD", "refs/heads/" + branch], localdir)
+            masterScript.gitCallHandler(["rm", "-r", "-q", "--cached", "--ignore-unmatch", "."], localdir)
+        DownloadAccurevStream.clearDirectory(localdir)
+        context.currentBranch = branch
+        context.setPopulated(None, None)
+        return
+
+    baseBranch = branchName(base)
+    with migrationMetrics.span('checkout', branch=baseBranch):
+        if context.populatedStream != base:
+            # the working copy holds another stream, the base tree is checked out for the delta to apply to
+            if context.importer is not None:
+                context.importer.checkpoint()
+            masterScript.gitCallHandler(["checkout", "-f", "-q", "--detach", "refs/heads/" + baseBranch], localdir)
+            masterScript.gitCallHandler(["clean", "-fdq"], localdir)
+            if context.statManifest:
+                contentManifest.recordFromIndex(localdir)
+            context.setPopulated(base, baseTransaction)
+        if context.importer is not None:
+            context.importer.createBranch(branch, baseBranch)
+        else:
+            masterScript.gitCallHandler(["checkout", "-q", "-B", branch, "refs/heads/" + baseBranch], localdir)
+    context.currentBranch = branch
+    context.record('branch:' + branch, migrationJournal.BRANCHED, localdir, commit=True)
+
+def lastUses(graph, order, depth):
+    # {stream: index in order of the last stream it can be the base of}
+    index = dict((stream, position) for position, stream in enumerate(order))
+    return dict((stream, max(index.get(neighbour, -1) for neighbour in graph.neighbours(stream, depth)))
+                for stream in order)
+
+def migrate(accurevuser, accurevpass, data, context):
+    # Runs the migration with the journal, metrics and transaction cache set up by masterScript.main
+    settings = data['streamGraph']
+    localdir = data['gitRepo']
+    blacklist = data['blacklist']
+    depth = settings.get('searchDepth', DEFAULT_SEARCH_DEPTH)
+    tags = settings.get('tags', {})
+    session = accurevSession.getSession(accurevuser, accurevpass)
+
+    streams = transactionCache.queryStreams(session)
+    if streams is None:
+        sys.exit(ERR_ACCUREV)
+    graph = StreamGraph(streams)
+    order = graph.select(settings)
+    print("Migrating %d streams of the stream hierarchy: %s" % (len(order), time.strftime("%I:%M:%S")))
+    if not order:
+        return
+    cache = transactionCache.getCache()
+    with migrationMetrics.span('resolveTransactions'):
+        cache.resolve(session, order)
+    # every stream is populated as the differences to its base
+    context.deltaPopulate = True
+    DownloadAccurevStream.create_directory(localdir)
+
+    lastUse = lastUses(graph, order, depth)
+    exclude = populatePlanner.Blacklist(blacklist)
+    listings = {}
+    transactions = {}
+    for index, stream in enumerate(order):
+        transaction = cache.entries[stream]['transaction']
+        with migrationMetrics.span('listElements', stream) as listSpan:
+            elements = migrationPlanner.listElements(session, stream, transaction, exclude)[0]
+            base, distance = chooseBase(graph, stream, elements, listings, depth)
+            listSpan.add(files=len(elements), base=base, distance=distance)
+        if base is not None:
+            print("Stream %s is based on stream %s, %d of its %d files differ"
+                  % (stream, base, distance, len(elements)))
+        startBranch(localdir, context, branchName(stream), base, transactions.get(base))
+        transactions[stream] = masterScript.startMigrate(accurevuser, accurevpass, localdir, stream, tags.get(stream),
+                                                         blacklist, "Added stream %s" % stream, context)
+        if lastUse[stream] > index:
+            listings[stream] = elements
+        for name in [name for name in listings if lastUse[name] <= index]:
+            del listings[name]
+
+    # prevent new binaries from being added to the branches of streams which are still worked on
+    for stream in order:
+        if graph.streams[stream].type != 'snapshot':
+            masterScript.checkoutBranch(branchName(stream), localdir, context)
+            masterScript.finishBranch(localdir, context)
+    first = branchName(order[0])
+    if context.importer is not None:
+        context.importer.checkpoint()
+        masterScript.gitCallHandler(["symbolic-ref", "HEAD", "refs/heads/" + first], localdir)
+    else:
+        masterScript.gitCallHandler(["checkout", "-q", first], localdir)
+    masterScript.finishMigrate(localdir, context)
+    # files of the last stream migrated are not on the branch checked out
+    masterScript.gitCallHandler(["clean", "-fdq"], localdir)
+    if context.sharedStore is not None:
+        context.sharedStore.publish(localdir)
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+
+"""
+fakeStreams.py:
+Shared by the tests driving the scripts against benchmark/fakeAccurev.py: generates small streams with
+benchmark/generateStreams.py and points ACCUREV_EXE to the fake executable serving them.
+Python version 3.6
+"""
+
+import os
+import shlex
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCHMARK_DIR = os.path.join(os.path.dirname(TESTS_DIR), 'benchmark')
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+sys.path.insert(0, BENCHMARK_DIR)
+
+import accurevSession
+import generateStreams
+
+__author__ = "Samuel M Gile"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+SMALL_STREAMS = {'releases': 1, 'maint': 1, 'files': 40, 'depth': 2, 'fanout': 3, 'meanSize': 200, 'emptyDirs': 2,
+                 'links': 3, 'blacklistFiles': 2}
+
+def fakeCommand(script='fakeAccurev.py'):
+    command = [sys.executable, os.path.join(BENCHMARK_DIR, script)]
+    return ' '.join(command) if os.name == 'nt' else ' '.join(shlex.quote(part) for part in command)
+
+def useFakeAccurev(root, settings=None):
+    # Generate the streams in root and serve them to the sessions created from now on.
+    # Returns the generateStreams.StreamGenerator.
+    generator = generateStreams.main(root, dict(SMALL_STREAMS, **(settings or {})))
+    os.environ['FAKE_ACCUREV_ROOT'] = root
+    os.environ['ACCUREV_EXE'] = fakeCommand()
+    # sessions created before keep the executable they were created with
+    accurevSession._sessions.clear()
+    return generator
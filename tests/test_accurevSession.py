@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+"""
+test_accurevSession.py:
+Runs commands through an AccuRev session against benchmark/fakeAccurev.py failing on purpose, and checks the
+transient failures and timeouts are retried, the login included.
+Python version 3.6
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fakeStreams
+import accurevSession
+
+__author__ = "Samuel M Gile"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+class RetryTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.root = os.path.join(self.workdir, 'streams')
+        fakeStreams.useFakeAccurev(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def addFaults(self, faults):
+        # fakeAccurev.py serves the faults of each command before answering it
+        with open(os.path.join(self.root, 'faults.json'), 'w') as faultsFile:
+            json.dump(faults, faultsFile)
+
+    def session(self, **options):
+        return accurevSession.AccurevSession('user', 'pass', backoff=0, **options)
+
+    def test_transient_failure_retried(self):
+        self.addFaults({'login': ["Unable to connect to server"], 'show': ["Server is busy", "Server is busy"]})
+        session = self.session()
+        result = session.run(["show", "-fx", "streams"])
+        self.assertEqual(result.returncode, 0)
+        self.assertIn("<stream ", result.stdout)
+        # two logins and three shows
+        self.assertEqual(session.commandCount, 5)
+
+    def test_timeout_retried(self):
+        self.addFaults({'hist': [30]})
+        session = self.session(timeouts={'hist': 1})
+        result = session.run(["hist", "-fx", "-s", "Rel1", "-t", "now"])
+        self.assertEqual(result.returncode, 0)
+        self.assertIn("<transaction ", result.stdout)
+        self.assertEqual(session.commandCount, 3)
+
+    def test_timeout_after_last_retry(self):
+        self.addFaults({'hist': [30, 30]})
+        session = self.session(timeouts={'hist': 1}, retries=1)
+        result = session.run(["hist", "-fx", "-s", "Rel1", "-t", "now"])
+        self.assertIsNone(result.returncode)
+        self.assertIn("timed out", result.stderr)
+
+    def test_other_failures_not_retried(self):
+        session = self.session()
+        result = session.run(["hist", "-fx", "-s", "NoSuchStream", "-t", "now"])
+        self.assertEqual(result.returncode, 1)
+        self.assertEqual(session.commandCount, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+"""
+test_contentManifest.py:
+Records the manifest of a committed tree, changes the files the way a population does and checks which ones
+reuseUnchanged takes from the manifest: a file of another element version is hashed again even when it was left
+in place, and files without an element version are compared by their stat data.
+Python version 3.6
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import contentManifest
+
+__author__ = "James Newkirk"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+FILES = {'kept.txt': '1:\\1\\1', 'changed.txt': '2:\\1\\1', 'repopulated.txt': '3:\\1\\1', 'unversioned.txt': None}
+
+class ReuseTest(unittest.TestCase):
+    def setUp(self):
+        self.localdir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.localdir, '.git'))
+        for path in FILES:
+            self.write(path, 'committed')
+        versions = dict((path, version) for path, version in FILES.items() if version)
+        contentManifest.saveManifest(self.localdir, dict((path, 'blob-' + path) for path in FILES), versions)
+        self.manifest = contentManifest.loadManifest(self.localdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.localdir)
+
+    def write(self, path, content):
+        # a population replaces the file, it gets a new modification time
+        fullpath = os.path.join(self.localdir, path)
+        if os.path.exists(fullpath):
+            os.remove(fullpath)
+        with open(fullpath, 'w') as target:
+            target.write(content)
+        info = os.lstat(fullpath)
+        os.utime(fullpath, ns=(info.st_mtime_ns + 10 ** 9, info.st_mtime_ns + 10 ** 9))
+
+    def reuse(self, versions):
+        return contentManifest.reuseUnchanged(self.localdir, self.manifest, sorted(FILES), versions)[0]
+
+    def test_changed_version_not_reused(self):
+        # changed.txt holds new content of the same size, left in place or not it must be hashed again
+        versions = dict(FILES, **{'changed.txt': '2:\\1\\2', 'unversioned.txt': None})
+        self.assertEqual(sorted(self.reuse(versions)), ['kept.txt', 'repopulated.txt', 'unversioned.txt'])
+        self.write('changed.txt', 'new value')
+        self.write('repopulated.txt', 'committed')
+        self.assertEqual(sorted(self.reuse(versions)), ['kept.txt', 'repopulated.txt', 'unversioned.txt'])
+        # the recorded modification time is restored
+        self.assertEqual(os.lstat(os.path.join(self.localdir, 'repopulated.txt')).st_mtime_ns,
+                         self.manifest['repopulated.txt'][1])
+
+    def test_missing_version_falls_back_to_stat(self):
+        self.write('repopulated.txt', 'committed')
+        self.write('unversioned.txt', 'committed')
+        # stat reported no version for the elements this time
+        self.assertEqual(sorted(self.reuse({})), ['changed.txt', 'kept.txt'])
+
+if __name__ == '__main__':
+    unittest.main()
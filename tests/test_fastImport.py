@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+"""
+test_fastImport.py:
+Commits the same tree with git commit and with git fast-import and checks both record the same author and
+committer.
+Python version 3.6
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fastImport
+import workspace2repo
+
+__author__ = "James Newkirk"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+def git(localdir, *args):
+    return subprocess.check_output(["git", "-C", localdir] + list(args)).decode()
+
+class CommitterTest(unittest.TestCase):
+    def setUp(self):
+        self.localdir = tempfile.mkdtemp()
+        git(self.localdir, "init", "-q")
+        with open(os.path.join(self.localdir, 'file.txt'), 'w') as sourceFile:
+            sourceFile.write("content\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.localdir)
+
+    def identities(self, ref):
+        # "author" and "committer" lines of the commit without their dates
+        lines = git(self.localdir, "cat-file", "commit", ref).splitlines()
+        return [line.rsplit(' ', 2)[0] for line in lines if line.startswith(('author ', 'committer '))]
+
+    def test_same_identities_as_git_commit(self):
+        git(self.localdir, "config", "user.name", "Migration Host")
+        git(self.localdir, "config", "user.email", "migration@ptc.com")
+        workspace2repo.commitRepo(self.localdir, None, "Commit by git")
+        importer = fastImport.FastImporter(self.localdir, "imported")
+        importer.commitTree("Commit by git fast-import")
+        importer.close()
+        self.assertEqual(self.identities("master"), self.identities("imported"))
+        self.assertIn("committer Migration Host <migration@ptc.com>", self.identities("imported"))
+
+    def test_default_committer(self):
+        # no global or system configuration either
+        environ = dict(os.environ)
+        os.environ.update(HOME=self.localdir, XDG_CONFIG_HOME=self.localdir, GIT_CONFIG_NOSYSTEM='1')
+        try:
+            self.assertEqual(fastImport.committerIdentity(self.localdir), fastImport.AUTHOR)
+        finally:
+            os.environ.clear()
+            os.environ.update(environ)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+
+"""
+test_historyReplay.py:
+Replays a small history with a stand-in AccuRev session, interrupts it after a directory move and checks that
+the resumed replay commits the same tree as an uninterrupted one, and that a blacklisted directory moved out of
+the blacklist is downloaded.
+Python version 3.6
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from xml.sax.saxutils import quoteattr
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import accurevSession
+import fastImport
+import historyReplay
+
+__author__ = "James Newkirk"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+# element id -> (path, is a directory) after each transaction, and the content of the files changed by it
+DIRS = {'10': 'src', '11': 'src/lib'}
+HISTORY = [
+    ('1', 'promote', {}, {'src/a.txt': 'a1', 'src/lib/b.txt': 'b1', 'readme.txt': 'r1'}),
+    ('2', 'promote', {'30': 'readme.txt'}, {'readme.txt': 'r2'}),
+    ('3', 'promote', {'30': 'readme.txt'}, {'readme.txt': 'r3'}),
+    ('4', 'move', {'10': 'code'}, {}),
+    ('5', 'promote', {'20': 'code/a.txt'}, {'code/a.txt': 'a2'}),
+]
+FILES = {'20': 'src/a.txt', '21': 'src/lib/b.txt', '30': 'readme.txt'}
+
+class Interrupted(Exception):
+    pass
+
+class FakeSession:
+    # Answers the stat, hist and pop commands of historyReplay from history, pop of interruptAt raises Interrupted
+    def __init__(self, interruptAt=None, history=HISTORY):
+        self.interruptAt = interruptAt
+        self.history = history
+
+    def _state(self, transaction):
+        # ({element id: path}, {path: content}) of the stream at the transaction
+        paths = dict(DIRS, **FILES)
+        contents = {}
+        for transactionId, kind, versions, changed in self.history:
+            if int(transactionId) > int(transaction):
+                break
+            for eid, path in versions.items():
+                old = paths[eid]
+                for other, known in list(paths.items()):
+                    if known == old or known.startswith(old + '/'):
+                        paths[other] = path + known[len(old):]
+                for known in list(contents):
+                    if known == old or known.startswith(old + '/'):
+                        contents[path + known[len(old):]] = contents.pop(known)
+            contents.update(changed)
+        return paths, contents
+
+    def _option(self, args, flag):
+        for index, arg in enumerate(args):
+            if arg == flag:
+                return args[index + 1]
+            if arg.startswith(flag):
+                return arg[len(flag):]
+
+    def run(self, args, okCodes=(0,), stdout=None, onStdout=None):
+        transaction = self._option(args, '-t')
+        if args[0] == 'stat':
+            paths, contents = self._state(transaction)
+            stdout.write(b"<AcResponse>\n")
+            for eid, path in sorted(paths.items()):
+                stdout.write(('<element location=%s id="%s" dir="%s"/>\n'
+                              % (quoteattr('/./' + path), eid, 'yes' if eid in DIRS else 'no')).encode())
+            stdout.write(b"</AcResponse>\n")
+        elif args[0] == 'hist':
+            high, low = [int(bound) for bound in transaction.split('-')]
+            stdout.write(b"<AcResponse>\n")
+            for transactionId, kind, versions, changed in reversed(self.history):
+                if low <= int(transactionId) <= high:
+                    stdout.write(('<transaction id="%s" type="%s" time="%d" user="tester"><comment>%s</comment>\n'
+                                  % (transactionId, kind, 1500000000 + int(transactionId), kind)).encode())
+                    for eid, path in versions.items():
+                        stdout.write(('<version path=%s eid="%s" dir="%s"/>\n'
+                                      % (quoteattr('/./' + path), eid, 'yes' if eid in DIRS else 'no')).encode())
+                    stdout.write(b"</transaction>\n")
+            stdout.write(b"</AcResponse>\n")
+        elif args[0] == 'pop':
+            if transaction == self.interruptAt:
+                raise Interrupted()
+            localdir = self._option(args, '-L')
+            with open(self._option(args, '-l'), 'r') as populateList:
+                wanted = [line.strip()[3:] for line in populateList if line.strip()]
+            for path, content in self._state(transaction)[1].items():
+                if any(path == item or path.startswith(item + '/') for item in wanted):
+                    fullpath = os.path.join(localdir, *path.split('/'))
+                    os.makedirs(os.path.dirname(fullpath), exist_ok=True)
+                    with open(fullpath, 'w') as target:
+                        target.write(content)
+        return accurevSession.CommandResult(0, '', '')
+
+def git(localdir, *args):
+    return subprocess.check_output(["git", "-C", localdir] + list(args)).decode()
+
+class ReplayTestCase(unittest.TestCase):
+    # Replays history on top of a commit of its first transaction
+    history = HISTORY
+    blacklist = []
+
+    def setUp(self):
+        self.localdir = tempfile.mkdtemp()
+        self.checkpointInterval = historyReplay.CHECKPOINT_INTERVAL
+        historyReplay.CHECKPOINT_INTERVAL = 2
+        git(self.localdir, "init", "-q")
+        git(self.localdir, "config", "user.name", "Tester")
+        git(self.localdir, "config", "user.email", "tester@ptc.com")
+        for path, content in FakeSession(history=self.history)._state('1')[1].items():
+            if any(path.startswith(excluded + '/') for excluded in self.blacklist):
+                continue
+            fullpath = os.path.join(self.localdir, *path.split('/'))
+            os.makedirs(os.path.dirname(fullpath), exist_ok=True)
+            with open(fullpath, 'w') as target:
+                target.write(content)
+        importer = fastImport.FastImporter(self.localdir, "master")
+        importer.commitTree("Stream at transaction 1")
+        importer.close()
+
+    def tearDown(self):
+        historyReplay.CHECKPOINT_INTERVAL = self.checkpointInterval
+        shutil.rmtree(self.localdir)
+
+    def replay(self, session, start, state):
+        importer = fastImport.FastImporter(self.localdir, "master")
+        self.replayer = historyReplay.HistoryReplay(session, "stream", self.localdir, self.blacklist)
+        self.replayer.loadElements(start)
+        try:
+            self.replayer.replay(importer, int(start) + 1, int(self.history[-1][0]), state, "master:stream")
+        except Interrupted:
+            # the process is killed, git fast-import never gets to update the branch
+            importer.process.kill()
+            importer.process.wait()
+            return False
+        importer.close()
+        return True
+
+class ResumeTest(ReplayTestCase):
+    def test_resume_after_directory_move(self):
+        state = {}
+        self.assertFalse(self.replay(FakeSession(interruptAt='5'), '1', state))
+        self.assertEqual(state, {"master:stream": '3'})
+        # the move was replayed in the working copy but is not on the branch
+        self.assertTrue(os.path.isdir(os.path.join(self.localdir, 'code')))
+
+        historyReplay.restoreCheckpoint(self.localdir)
+        self.assertTrue(self.replay(FakeSession(), state["master:stream"], state))
+        tree = git(self.localdir, "ls-tree", "-r", "--name-only", "master").split()
+        self.assertEqual(sorted(tree), ['code/a.txt', 'code/lib/b.txt', 'readme.txt'])
+        self.assertEqual(git(self.localdir, "show", "master:code/a.txt"), 'a2')
+        self.assertEqual(git(self.localdir, "show", "master:code/lib/b.txt"), 'b1')
+        self.assertEqual(git(self.localdir, "show", "master:readme.txt"), 'r3')
+
+# the blacklisted folder src/lib moves out of the blacklist, then moves again
+BLACKLISTED_MOVE = HISTORY[0:1] + [
+    ('2', 'move', {'11': 'lib'}, {}),
+    ('3', 'move', {'11': 'pkg'}, {}),
+]
+
+class BlacklistedMoveTest(ReplayTestCase):
+    history = BLACKLISTED_MOVE
+    blacklist = ['src/lib']
+
+    def test_move_of_folder_never_populated(self):
+        self.assertTrue(self.replay(FakeSession(history=self.history), '1', {}))
+        tree = git(self.localdir, "ls-tree", "-r", "--name-only", "master~1").split()
+        self.assertEqual(sorted(tree), ['lib/b.txt', 'readme.txt', 'src/a.txt'])
+        tree = git(self.localdir, "ls-tree", "-r", "--name-only", "master").split()
+        self.assertEqual(sorted(tree), ['pkg/b.txt', 'readme.txt', 'src/a.txt'])
+        self.assertEqual(git(self.localdir, "show", "master:pkg/b.txt"), 'b1')
+        self.assertEqual(self.replayer.paths.get('21'), 'pkg/b.txt')
+
+class PathIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = historyReplay.PathIndex({'1': 'a', '2': 'a/x.txt', '3': 'a/b', '4': 'a/b/y.txt', '5': 'a.txt',
+                                              '6': 'a0/z.txt', '7': 'c'})
+
+    def assertConsistent(self):
+        self.assertEqual(self.index.sorted, sorted(self.index.paths.values()))
+        self.assertEqual(self.index.eids, dict((path, eid) for eid, path in self.index.paths.items()))
+
+    def test_move_only_renames_the_subtree(self):
+        self.index.move('a', 'c/d')
+        self.index['1'] = 'c/d'
+        self.assertEqual(self.index.paths, {'1': 'c/d', '2': 'c/d/x.txt', '3': 'c/d/b', '4': 'c/d/b/y.txt',
+                                            '5': 'a.txt', '6': 'a0/z.txt', '7': 'c'})
+        self.assertConsistent()
+
+    def test_forget_drops_the_subtree(self):
+        self.index.forget('a')
+        self.assertEqual(self.index.paths, {'5': 'a.txt', '6': 'a0/z.txt', '7': 'c'})
+        self.assertConsistent()
+
+    def test_element_replacing_another(self):
+        self.index['8'] = 'a.txt'
+        self.index['2'] = 'a/w.txt'
+        self.assertIsNone(self.index.get('5'))
+        self.assertEqual(self.index.get('8'), 'a.txt')
+        self.assertEqual(self.index.get('2'), 'a/w.txt')
+        self.assertConsistent()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+"""
+test_prefetch.py:
+Populates a stream holding junctions once directly and once through a staging directory, and checks the links
+the post-processing converts them into are the same.
+Python version 3.6
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fakeStreams
+import DownloadAccurevStream
+import masterScript
+import prefetch
+
+__author__ = "Samuel M Gile"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+class SwapTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        fakeStreams.useFakeAccurev(os.path.join(self.workdir, 'streams'))
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_staged_junctions_point_into_working_copy(self):
+        direct = os.path.join(self.workdir, 'direct')
+        DownloadAccurevStream.Accurev('user', 'pass').download('Rel1', direct)
+        expected = masterScript.postProcess(direct, []).links
+        self.assertTrue(expected)
+
+        localdir = os.path.join(self.workdir, 'repo')
+        prefetcher = prefetch.StreamPrefetcher('user', 'pass', ['Rel1'], [], os.path.join(self.workdir, 'staging'))
+        prefetcher.start()
+        prefetcher.swapInto('Rel1', localdir)
+        self.assertEqual(masterScript.postProcess(localdir, []).links, expected)
+
+if __name__ == '__main__':
+    unittest.main()
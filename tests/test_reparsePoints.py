@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+"""
+test_reparsePoints.py:
+Checks the POSIX detector finds the symbolic links standing in for junctions and converts them into links
+relative to their directory.
+Python version 3.6
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import reparsePoints
+
+__author__ = "Kiersten Marr"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+@unittest.skipIf(os.name == 'nt', "symbolic links stand in for junctions on POSIX only")
+class PosixDetectorTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.detector = reparsePoints.getDetector('posix')
+        self.target = os.path.join(self.workdir, 'real')
+        os.makedirs(self.target)
+        with open(os.path.join(self.target, 'file.txt'), 'w') as content:
+            content.write('content')
+        self.junction = os.path.join(self.workdir, 'junction')
+        self.detector.createJunction(self.junction, self.target)
+        self.link = os.path.join(self.workdir, 'link')
+        self.detector.createDirectoryLink(self.link, 'real')
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_detection(self):
+        self.assertTrue(self.detector.isReparsePoint(self.junction))
+        self.assertTrue(self.detector.isReparsePoint(self.link))
+        self.assertFalse(self.detector.isReparsePoint(self.target))
+        self.assertFalse(self.detector.isReparsePoint(os.path.join(self.workdir, 'missing')))
+        entries = dict((entry.name, self.detector.isReparseEntry(entry)) for entry in os.scandir(self.workdir))
+        self.assertEqual(entries, {'real': False, 'junction': True, 'link': True})
+
+    def test_only_absolute_links_are_junctions(self):
+        self.assertEqual(self.detector.junctionTarget(self.junction), self.target)
+        self.assertIsNone(self.detector.junctionTarget(self.link))
+        self.assertIsNone(self.detector.junctionTarget(self.target))
+        self.assertEqual(self.detector.junctionTargets([self.junction, self.link]), [self.target, None])
+
+    def test_conversion(self):
+        self.detector.convertJunctions([(self.junction, 'real')])
+        self.assertEqual(os.readlink(self.junction), 'real')
+        self.assertIsNone(self.detector.junctionTarget(self.junction))
+        self.assertTrue(self.detector.isReparsePoint(self.junction))
+        self.assertEqual(os.listdir(self.junction), ['file.txt'])
+        # the destination is left alone
+        self.assertEqual(os.listdir(self.target), ['file.txt'])
+
+if __name__ == '__main__':
+    unittest.main()
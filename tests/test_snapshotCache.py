@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+"""
+test_snapshotCache.py:
+Restores a cached snapshot holding a root .gitignore into a working copy and commits it with finishBranch, then
+checks the cached content was left as it was stored.
+Python version 3.6
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import contentManifest
+import masterScript
+import populatePlanner
+import snapshotCache
+
+__author__ = "Corey Birdsall"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+GITIGNORE = "*.o\n"
+
+def git(localdir, *args):
+    return subprocess.check_output(["git", "-C", localdir] + list(args)).decode()
+
+class RestoreTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.localdir = os.path.join(self.workdir, 'gitRepo')
+        os.makedirs(os.path.join(self.localdir, 'src'))
+        git(self.localdir, "init", "-q")
+        git(self.localdir, "config", "user.name", "Tester")
+        git(self.localdir, "config", "user.email", "tester@ptc.com")
+        with open(os.path.join(self.localdir, '.gitignore'), 'w') as gitignoreFile:
+            gitignoreFile.write(GITIGNORE)
+        with open(os.path.join(self.localdir, 'src', 'main.c'), 'w') as sourceFile:
+            sourceFile.write("int main() { return 0; }\n")
+        self.cache = snapshotCache.SnapshotCache(snapshotCache.defaultPath(self.localdir), snapshotCache.GB)
+        self.blacklist = populatePlanner.Blacklist([])
+        self.cache.store('stream', '10', self.localdir, self.blacklist)
+        os.remove(os.path.join(self.localdir, '.gitignore'))
+        shutil.rmtree(os.path.join(self.localdir, 'src'))
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_finish_branch_leaves_cache_intact(self):
+        snapshot = self.cache.lookup('stream', '10', self.blacklist)
+        self.assertTrue(self.cache.restore(snapshot, self.localdir, self.blacklist))
+        blob = snapshot['files']['.gitignore'][0]
+        objectPath = self.cache._objectPath(blob)
+        masterScript.gitCallHandler(["add", "-A"], self.localdir)
+        masterScript.gitCallHandler(["commit", "-q", "-m", "Stream at transaction 10"], self.localdir)
+
+        masterScript.finishBranch(self.localdir, masterScript.MigrationContext())
+        with open(objectPath, 'r') as objectFile:
+            self.assertEqual(objectFile.read(), GITIGNORE)
+        self.assertEqual(contentManifest.blobId(objectPath), blob)
+        committed = git(self.localdir, "show", "HEAD:.gitignore")
+        self.assertTrue(committed.startswith(GITIGNORE) and "*.dll" in committed)
+
+        # a later restore gets the content which was stored
+        shutil.rmtree(os.path.join(self.localdir, 'src'))
+        self.assertTrue(self.cache.restore(snapshot, self.localdir, self.blacklist))
+        with open(os.path.join(self.localdir, '.gitignore'), 'r') as gitignoreFile:
+            self.assertEqual(gitignoreFile.read(), GITIGNORE)
+
+if __name__ == '__main__':
+    unittest.main()
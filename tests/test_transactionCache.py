@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+"""
+test_transactionCache.py:
+Resolves streams served by benchmark/fakeAccurev.py through two transaction caches sharing a file, and checks
+snapshots are only queried again after a refresh and streams of unknown type are not kept for later runs.
+Python version 3.6
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fakeStreams
+import accurevSession
+import transactionCache
+
+__author__ = "Samuel M Gile"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+class TransactionCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.root = os.path.join(self.workdir, 'streams')
+        self.streams = fakeStreams.useFakeAccurev(self.root).streams
+        self.path = os.path.join(self.workdir, transactionCache.CACHE_FILE)
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def session(self):
+        return accurevSession.AccurevSession('user', 'pass', backoff=0)
+
+    def test_snapshots_reused_by_later_runs(self):
+        first = transactionCache.TransactionCache(self.path)
+        first.resolve(self.session(), ['Rel1', 'Rel1_Maint1'])
+        self.assertEqual(first.entries['Rel1']['transaction'], str(self.streams['Rel1']['transaction']))
+
+        session = self.session()
+        second = transactionCache.TransactionCache(self.path)
+        self.assertEqual(second.transaction(session, 'Rel1'), first.entries['Rel1']['transaction'])
+        self.assertEqual(second.transaction(session, 'Rel1_Maint1'), first.entries['Rel1_Maint1']['transaction'])
+        self.assertEqual(session.commandCount, 0)
+
+        # --refreshtransactions
+        second.refresh()
+        self.assertFalse(second.isCurrent('Rel1'))
+        self.assertEqual(second.transaction(session, 'Rel1'), first.entries['Rel1']['transaction'])
+        self.assertGreater(session.commandCount, 0)
+
+    def test_unknown_type_not_saved(self):
+        with open(os.path.join(self.root, 'faults.json'), 'w') as faultsFile:
+            json.dump({'show': ["You are not authorized to list streams"]}, faultsFile)
+        first = transactionCache.TransactionCache(self.path)
+        self.assertEqual(first.transaction(self.session(), 'Rel1'), str(self.streams['Rel1']['transaction']))
+        self.assertTrue(first.isCurrent('Rel1'))
+        self.assertNotIn('Rel1', transactionCache.TransactionCache(self.path).entries)
+
+if __name__ == '__main__':
+    unittest.main()
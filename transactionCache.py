@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+"""
+transactionCache.py:
+Resolve the transaction each AccuRev stream is migrated at and keep the results in transactionCache.json.
+Snapshots can never change, so their transactions are reused by every later run. Other streams are resolved
+once per run, masterScript.py resolves all streams of config.json up front.
+Python version 3.6
+"""
+
+import io
+import json
+import os
+import sys
+import accurevParsers
+
+__author__ = "Samuel M Gile"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+ERR_ACCUREV = 3         # Error communicating with Accurev
+
+CACHE_FILE = 'transactionCache.json'
+
+def transactionQuery(stream):
+    return ["hist", "-fx", "-s" + stream, "-t", "now.1"]
+
+def latestTransaction(stream, result):
+    if result.returncode == 0:
+        for transaction in accurevParsers.iterTransactions(io.BytesIO(result.stdout.encode('utf-8'))):
+            return transaction.id
+    print("Failed to find the transaction of stream %s: %s" % (stream, result.stderr))
+    sys.exit(ERR_ACCUREV)
+
+def queryTransaction(session, stream):
+    # Latest transaction of the stream, straight from the server
+    return latestTransaction(stream, session.run(transactionQuery(stream)))
+
+def queryTransactions(session, streams):
+    # Latest transactions of several streams, the queries run at the same time
+    results = session.runAll([transactionQuery(stream) for stream in streams])
+    return [latestTransaction(stream, result) for stream, result in zip(streams, results)]
+
+def queryStreams(session):
+    # {stream name: accurevParsers.Stream} of every stream visible to the user, None if it can't be listed
+    result = session.run(["show", "-fx", "streams"])
+    if result.returncode != 0:
+        print("Could not list AccuRev streams: %s" % result.stderr)
+        return None
+    return accurevParsers.parseStreams(io.BytesIO(result.stdout.encode('utf-8')))
+
+class TransactionCache:
+    def __init__(self, path=CACHE_FILE):
+        self.path = path
+        # stream -> {"transaction": id, "snapshot": bool}, snapshot is None when the stream type is unknown
+        self.entries = {}
+        # streams resolved during this run, their entries are current even if they are not snapshots
+        self.resolved = set()
+        try:
+            with open(self.path, 'r') as cacheFile:
+                self.entries = json.load(cacheFile)
+        except (OSError, ValueError):
+            pass
+
+    def save(self):
+        # entries of unknown type are only kept for this run
+        known = dict((stream, entry) for stream, entry in self.entries.items() if entry['snapshot'] is not None)
+        with open(self.path, 'w') as cacheFile:
+            json.dump(known, cacheFile, indent=4, sort_keys=True)
+
+    def refresh(self):
+        # Forget every cached transaction, snapshots included
+        print("Clearing cached transactions in %s" % self.path)
+        self.entries = {}
+        self.resolved = set()
+        self.save()
+
+    def isCurrent(self, stream):
+        entry = self.entries.get(stream)
+        return entry is not None and (entry['snapshot'] or stream in self.resolved)
+
+    def resolve(self, session, streams):
+        # Planning pass: resolve every stream which has no current entry, listing the stream types only once
+        pending = [stream for stream in streams if not self.isCurrent(stream)]
+        print("Resolving transactions: %d streams cached, %d to query"
+              % (len(set(streams)) - len(set(pending)), len(set(pending))))
+        if not pending:
+            return
+        streamInfo = queryStreams(session)
+        if streamInfo is None:
+            print("Warning: the stream types are unknown, the transactions resolved now are not cached for later runs")
+            streamInfo = {}
+        pending = sorted(set(pending))
+        for stream, transaction in zip(pending, queryTransactions(session, pending)):
+            info = streamInfo.get(stream)
+            self.entries[stream] = {'transaction': transaction,
+                                    'snapshot': None if info is None else info.type == 'snapshot'}
+            self.resolved.add(stream)
+            print("Stream %s is at transaction %s" % (stream, self.entries[stream]['transaction']))
+        self.save()
+
+    def transaction(self, session, stream):
+        if not self.isCurrent(stream):
+            self.resolve(session, [stream])
+        return self.entries[stream]['transaction']
+
+_cache = None
+
+def getCache():
+    # The cache shared by every script of this run, kept next to config.json
+    global _cache
+    if _cache is None:
+        _cache = TransactionCache(os.path.join(os.getcwd(), CACHE_FILE))
+    return _cache
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+"""
+treeScanner.py:
+Walk a populated tree once with os.scandir and hand every directory, file and reparse point to a list of
+handlers (blacklist pruning, junction conversion, empty directory markers, ...). The files, links and
+directories left in the tree are collected into a TreeManifest for the later stages.
+Python version 3.6
+"""
+
+import os
+import time
+import reparsePoints
+
+__author__ = "James Newkirk"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+class TreeManifest:
+    # Paths are relative to the scanned root and '/' separated, the root itself is ''
+    def __init__(self):
+        self.files = {}         # path -> size in bytes
+        self.links = {}         # path -> link target
+        self.directories = []
+
+    def totalBytes(self):
+        return sum(self.files.values())
+
+class ScanHandler:
+    # Base class for the per-stage handlers, every method is optional.
+    # stage names the handler in the time spent per handler (TreeScanner.handlerSeconds).
+    stage = None
+
+    def include(self, scanner, path, relative, isDir):
+        # Return False to drop the entry (and everything below it) from the scan
+        return True
+
+    def reparsePoint(self, scanner, path, relative):
+        # Called for junctions and symbolic links, which are never descended into
+        pass
+
+    def file(self, scanner, path, relative, size):
+        pass
+
+    def directory(self, scanner, path, relative, entryCount):
+        # Called once the directory is listed, entryCount excludes the entries dropped by include()
+        pass
+
+    def finish(self, scanner):
+        # Called once the whole tree is scanned
+        pass
+
+class TreeScanner:
+    def __init__(self, root, handlers, detector=None):
+        self.root = root
+        self.handlers = list(handlers)
+        self.detector = detector or reparsePoints.getDetector()
+        self.manifest = TreeManifest()
+        # stage -> seconds spent in the handler
+        self.handlerSeconds = dict((self._stage(handler), 0.0) for handler in self.handlers)
+
+    def _stage(self, handler):
+        return handler.stage or type(handler).__name__
+
+    def _call(self, handler, method, *args):
+        started = time.perf_counter()
+        try:
+            return getattr(handler, method)(self, *args)
+        finally:
+            self.handlerSeconds[self._stage(handler)] += time.perf_counter() - started
+
+    def _include(self, path, relative, isDir):
+        for handler in self.handlers:
+            if not self._call(handler, 'include', path, relative, isDir):
+                return False
+        return True
+
+    def scan(self):
+        print("Scanning %s: %s" % (self.root, time.strftime("%I:%M:%S")))
+        stack = [(self.root, '')]
+        while stack:
+            path, relative = stack.pop()
+            with os.scandir(path) as iterator:
+                entries = list(iterator)
+            entryCount = 0
+            for entry in entries:
+                if relative == '' and entry.name == '.git':
+                    continue
+                childRelative = entry.name if relative == '' else relative + '/' + entry.name
+                isDir = entry.is_dir(follow_symlinks=False)
+                if entry.is_symlink() or (isDir and self.detector.isReparseEntry(entry)):
+                    if not self._include(entry.path, childRelative, True):
+                        continue
+                    entryCount += 1
+                    for handler in self.handlers:
+                        self._call(handler, 'reparsePoint', entry.path, childRelative)
+                    if os.path.islink(entry.path):
+                        self.manifest.links[childRelative] = os.readlink(entry.path)
+                elif isDir:
+                    if not self._include(entry.path, childRelative, True):
+                        continue
+                    entryCount += 1
+                    stack.append((entry.path, childRelative))
+                else:
+                    if not self._include(entry.path, childRelative, False):
+                        continue
+                    entryCount += 1
+                    size = entry.stat(follow_symlinks=False).st_size
+                    self.manifest.files[childRelative] = size
+                    for handler in self.handlers:
+                        self._call(handler, 'file', entry.path, childRelative, size)
+            self.manifest.directories.append(relative)
+            for handler in self.handlers:
+                self._call(handler, 'directory', path, relative, entryCount)
+        for handler in self.handlers:
+            self._call(handler, 'finish')
+        print("Scanned %d directories, %d files, %d links: %s" % (len(self.manifest.directories),
+              len(self.manifest.files), len(self.manifest.links), time.strftime("%I:%M:%S")))
+        return self.manifest
+
+def scanTree(root, handlers, detector=None):
+    return TreeScanner(root, handlers, detector).scan()
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+
+"""
+verifyMigration.py:
+Check a migrated repo against AccuRev. For every tagged stream of config.json the tree of the tagged commit is
+compared with the elements of the stream at the transaction it was migrated at: the paths, files against links,
+and the git blob id of every file against the content of its AccuRev version. The blacklist, the .gitignore
+files marking empty directories, the links junctions were converted into and the pointer files of the binary
+store are taken into account. Contents are hashed by a pool of processes and the blob id of every element
+version is kept in the gitRepo path followed by "_hashes.json", so a version shared by several streams or
+verified by an earlier run is neither downloaded nor hashed again. Mismatches are printed per path and written
+to the gitRepo path followed by "_verify.json".
+Example args:
+    --accurevuser name
+    --accurevpass pass
+    --stream ExampleStream (optional, only verify this stream, can be repeated)
+    --workers 8 (optional, number of hashing processes, default the number of processors)
+Python version 3.6
+"""
+
+import getopt
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from xml.etree.ElementTree import ParseError
+import accurevParsers
+import accurevSession
+import binaryStore
+import contentManifest
+import masterScript
+import MigrateEmptyDirs
+import migrationJournal
+import populatePlanner
+import processRunner
+import transactionCache
+
+__author__ = "James Newkirk"
+__copyright__ = "Copyright 2018, PTC, Inc."
+
+ERR_PARSING_ARGS = 1    # Encounter an error parsing arguments
+ERR_UNKNOWN = 2         # Fail unknown reason
+ERR_ACCUREV = 3         # Error communicating with Accurev
+ERR_GIT = 4             # Failure calling git command
+ERR_MISMATCH = 5        # The repo differs from AccuRev
+
+MODE_LINK = '120000'
+HASH_CHUNK = 64         # files handed to a hashing process at a time
+REPORT_LIMIT = 20       # mismatches printed per stream, the report file holds all of them
+
+# problem is "missing", "unexpected", "content", "type" or "tag"
+Mismatch = namedtuple('Mismatch', ['path', 'problem', 'expected', 'found'])
+
+def hashesPath(localdir):
+    return localdir.rstrip('\\/') + '_hashes.json'
+
+def reportPath(localdir):
+    return localdir.rstrip('\\/') + '_verify.json'
+
+def textBlobId(text):
+    content = text.encode('utf-8')
+    return hashlib.sha1(("blob %d\0" % len(content)).encode('ascii') + content).hexdigest()
+
+# the markers are written in text mode, with Windows line endings on Windows
+MARKER_BLOBS = set(textBlobId(marker) for marker in (MigrateEmptyDirs.GITIGNORE_MARKER,
+                                                     MigrateEmptyDirs.GITIGNORE_MARKER.replace('\n', '\r\n')))
+
+def hashFile(fullpath, withOid):
+    # [git blob id, sha256 id of the binary store or None, size] of a file, runs in the hashing processes
+    return [contentManifest.blobId(fullpath), binaryStore.fileOid(fullpath) if withOid else None,
+            os.path.getsize(fullpath)]
+
+def taggedStreams(data):
+    # [(branch, stream, tag)] of the streams masterScript.py committed with a tag
+    streams = []
+    for release in data['releases']:
+        if release['ReleaseTag'] not in ["", None]:
+            streams.append(("master", release['StreamName'], release['ReleaseTag']))
+        for stream in release['Maint']:
+            if stream['tag'] not in ["", None]:
+                streams.append((release['Version'] + "_Maint", stream['name'], stream['tag']))
+    return streams
+
+class HashCache:
+    # {"element id:real version": [blob id, sha256 id or None, size]}, versions never change once created
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        try:
+            with open(self.path, 'r') as cacheFile:
+                self.entries = json.load(cacheFile)
+        except (OSError, ValueError):
+            pass
+
+    def key(self, element):
+        if element.version is None:
+            return None
+        return "%s:%s" % (element.eid, element.version)
+
+    def get(self, element, withOid):
+        entry = self.entries.get(self.key(element))
+        if entry is None or (withOid and entry[1] is None):
+            return None
+        return entry
+
+    def put(self, element, entry):
+        key = self.key(element)
+        if key is not None:
+            self.entries[key] = entry
+
+    def save(self):
+        with open(self.path, 'w') as cacheFile:
+            json.dump(self.entries, cacheFile)
+
+def git(args, localdir, okCodes=(0,)):
+    result = processRunner.getRunner().call(["git", "-C", localdir] + args)
+    if result.returncode not in okCodes:
+        print("Failed to execute command: git " + " ".join(args))
+        sys.exit(ERR_GIT)
+    return result
+
+def tagCommit(localdir, tag):
+    result = git(["rev-parse", "--verify", "-q", tag + "^{commit}"], localdir, okCodes=(0, 1))
+    return result.stdout.decode().strip() if result.returncode == 0 else None
+
+def gitTree(localdir, commit):
+    # {path: (mode, blob id)} of every file and link of the commit
+    tree = {}
+    output = git(["ls-tree", "-r", "-z", "--full-tree", commit], localdir).stdout
+    for record in output.decode('utf-8', 'surrogateescape').split('\0'):
+        if record:
+            info, path = record.split('\t', 1)
+            mode, kind, blob = info.split(' ')
+            tree[path] = (mode, blob)
+    return tree
+
+def ignoredPaths(localdir, tree, paths):
+    # Paths the .gitignore files of the commit kept out of it. The .gitignore files are written to a scratch
+    # repo, git check-ignore only needs the patterns.
+    if not paths:
+        return set()
+    scratch = tempfile.mkdtemp(prefix='accurev2git-ignore')
+    try:
+        git(["init", "-q", scratch], localdir)
+        for path, (mode, blob) in tree.items():
+            if path.split('/')[-1] == '.gitignore' and blob not in MARKER_BLOBS:
+                content = git(["cat-file", "blob", blob], localdir).stdout
+                fullpath = os.path.join(scratch, *path.split('/'))
+                os.makedirs(os.path.dirname(fullpath), exist_ok=True)
+                with open(fullpath, 'wb') as gitignoreFile:
+                    gitignoreFile.write(content)
+        result = processRunner.getRunner().call(["git", "-C", scratch, "check-ignore", "--no-index", "--stdin", "-z"],
+                                                input='\0'.join(paths).encode('utf-8', 'surrogateescape'))
+        return set(path for path in result.stdout.decode('utf-8', 'surrogateescape').split('\0') if path)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+def listElements(session, stream, transaction):
+    with tempfile.TemporaryFile() as statstream:
+        result = session.run(["stat", "-a", "-fx", "-s", stream, "-t", transaction], stdout=statstream)
+        if result.returncode != 0:
+            print("Failed to list the elements of stream %s: %s" % (stream, result.stderr))
+            sys.exit(ERR_ACCUREV)
+        statstream.seek(0)
+        try:
+            return list(accurevParsers.iterElements(statstream))
+        except ParseError as ex:
+            print("Could not parse the elements of stream %s: %s" % (stream, ex))
+            sys.exit(ERR_ACCUREV)
+
+def expectedTree(elements, blacklist):
+    # ({path: Element} of the files, {path: Element} of the links, paths of the empty directory markers)
+    # the migration should have committed, before the .gitignore files are applied
+    files = {}
+    links = {}
+    directories = set()
+    nonEmpty = set()
+    for element in elements:
+        relative = populatePlanner.relativePath(element.path)
+        if not relative or blacklist.excludes(relative):
+            continue
+        nonEmpty.add(relative.rsplit('/', 1)[0] if '/' in relative else '')
+        if element.isLink:
+            links[relative] = element
+        elif element.isDir:
+            directories.add(relative)
+        else:
+            files[relative] = element
+    # the root .gitignore is replaced by gitignoreForMigration
+    files.pop('.gitignore', None)
+    markers = set(directory + '/.gitignore' for directory in directories if directory not in nonEmpty)
+    return files, links, markers
+
+def downloadAndHash(session, pool, stream, transaction, elements, scratch, withOid):
+    # {path: [blob id, sha256 id, size]} of the elements, populated at the transaction into the scratch directory
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as populateList:
+        populateList.write('\n'.join(element.path for element in elements.values()) + '\n')
+    try:
+        result = session.run(["pop", "-R", "-O", "-v" + stream, "-L" + scratch, "-t" + transaction,
+                              "-l", populateList.name])
+    finally:
+        os.remove(populateList.name)
+    if result.returncode != 0:
+        print("Failed to download the elements of stream %s: %s" % (stream, result.stderr))
+        sys.exit(ERR_ACCUREV)
+    paths = [path for path, element in elements.items()
+             if os.path.isfile(accurevParsers.depotPathToLocal(scratch, element.path))]
+    fullpaths = [accurevParsers.depotPathToLocal(scratch, elements[path].path) for path in paths]
+    return dict(zip(paths, pool.map(hashFile, fullpaths, [withOid] * len(fullpaths), chunksize=HASH_CHUNK)))
+
+def compareTree(tree, files, links, markers, hashes, withOid):
+    # Returns (mismatches, paths missing from the commit)
+    mismatches = []
+    missing = []
+    for path, element in sorted(files.items()):
+        entry = tree.get(path)
+        if entry is None:
+            missing.append(path)
+        elif entry[0] == MODE_LINK:
+            mismatches.append(Mismatch(path, 'type', 'file', 'link'))
+        elif path not in hashes:
+            mismatches.append(Mismatch(path, 'content', 'not populated by AccuRev', entry[1]))
+        elif entry[1] != hashes[path][0] and not (path == '.gitattributes' and withOid):
+            blob, oid, size = hashes[path]
+            if not (withOid and entry[1] == textBlobId(binaryStore.pointerText(oid, size))):
+                mismatches.append(Mismatch(path, 'content', blob, entry[1]))
+    for path in sorted(links):
+        entry = tree.get(path)
+        if entry is None:
+            missing.append(path)
+        elif entry[0] != MODE_LINK:
+            mismatches.append(Mismatch(path, 'type', 'link', 'file'))
+    for path in sorted(markers):
+        entry = tree.get(path)
+        if entry is None:
+            missing.append(path)
+        elif entry[1] not in MARKER_BLOBS:
+            mismatches.append(Mismatch(path, 'content', 'empty directory marker', entry[1]))
+    for path in sorted(tree):
+        if path in files or path in links or path in markers or path == '.gitignore':
+            continue
+        if path == '.gitattributes' and withOid:
+            # written by the binary store
+            continue
+        mismatches.append(Mismatch(path, 'unexpected', None, tree[path][1]))
+    return mismatches, missing
+
+def verifyStream(session, pool, localdir, data, stream, tag, transaction, hashCache):
+    # Returns (number of paths checked, mismatches, number of paths kept out by .gitignore files)
+    print("Verifying stream %s (tag %s, transaction %s): %s" % (stream, tag, transaction, time.strftime("%I:%M:%S")))
+    commit = tagCommit(localdir, tag)
+    if commit is None:
+        return 0, [Mismatch('', 'tag', tag, None)], 0
+    withOid = 'binaryStore' in data
+    files, links, markers = expectedTree(listElements(session, stream, transaction),
+                                         populatePlanner.Blacklist(data['blacklist']))
+    tree = gitTree(localdir, commit)
+
+    hashes = {}
+    pending = {}
+    for path, element in files.items():
+        entry = hashCache.get(element, withOid)
+        if entry is None:
+            pending[path] = element
+        else:
+            hashes[path] = entry
+    print("%d files, %d hashes cached, %d to download and hash" % (len(files), len(hashes), len(pending)))
+    if pending:
+        scratch = tempfile.mkdtemp(prefix='accurev2git-verify', dir=os.path.dirname(os.path.abspath(localdir)))
+        try:
+            downloaded = downloadAndHash(session, pool, stream, transaction, pending, scratch, withOid)
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+        for path, entry in downloaded.items():
+            hashCache.put(pending[path], entry)
+        hashes.update(downloaded)
+        hashCache.save()
+
+    mismatches, missing = compareTree(tree, files, links, markers, hashes, withOid)
+    ignored = ignoredPaths(localdir, tree, missing)
+    mismatches.extend(Mismatch(path, 'missing', 'present', None) for path in missing if path not in ignored)
+    return len(files) + len(links) + len(markers), mismatches, len(ignored)
+
+def migratedTransaction(journal, branch, stream):
+    # Transaction the journal recorded the stream as downloaded at, None without a journal
+    if journal is None:
+        return None
+    stage = journal.stages(branch + ':' + stream).get(migrationJournal.DOWNLOADED)
+    return stage.transactionId if stage is not None else None
+
+def parse_arguments(argv):
+    try:
+        print("Importing arguments")
+        opts, args = getopt.getopt(argv, "", ["accurevuser=",
+                                              "accurevpass=",
+                                              "stream=",
+                                              "workers="])
+    except Exception as e:
+        print(e)
+        sys.exit(ERR_PARSING_ARGS)
+
+    streams = []
+    workers = None
+    for opt, arg in opts:
+        if opt == '--accurevuser':
+            accurevuser = arg
+        elif opt == '--accurevpass':
+            accurevpass = arg
+        elif opt == '--stream':
+            streams.append(arg)
+        elif opt == '--workers':
+            workers = int(arg)
+    try:
+        print("Finished importing arguments")
+        return {'username': accurevuser, 'password': accurevpass, 'streams': streams, 'workers': workers}
+    except UnboundLocalError as e:
+        print("Could not find necessary arguments. Exiting . . . ")
+        print(e)
+        sys.exit(ERR_PARSING_ARGS)
+
+def main(accurevuser, accurevpass, streams=None, workers=None):
+    print("Starting verifyMigration.py: %s" % time.strftime("%I:%M:%S"))
+    data = masterScript.parseConfigFile()
+    localdir = data['gitRepo']
+    accurevSession.DEFAULT_TIMEOUTS.update(data.get('accurevTimeouts', {}))
+    processRunner.LIMITS.update(data.get('processLimits', {}))
+    session = accurevSession.getSession(accurevuser, accurevpass)
+    journal = None
+    if os.path.exists(migrationJournal.journalPath(localdir)):
+        journal = migrationJournal.MigrationJournal(migrationJournal.journalPath(localdir))
+    cache = transactionCache.getCache()
+    hashCache = HashCache(hashesPath(localdir))
+
+    report = {}
+    failed = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for branch, stream, tag in taggedStreams(data):
+                if streams and stream not in streams:
+                    continue
+                transaction = migratedTransaction(journal, branch, stream) or cache.transaction(session, stream)
+                checked, mismatches, ignored = verifyStream(session, pool, localdir, data, stream, tag, transaction,
+                                                            hashCache)
+                report[stream] = {'tag': tag, 'transaction': transaction, 'checked': checked, 'ignored': ignored,
+                                  'mismatches': [mismatch._asdict() for mismatch in mismatches]}
+                print("Stream %s: %d paths checked, %d kept out by .gitignore, %d mismatches"
+                      % (stream, checked, ignored, len(mismatches)))
+                for mismatch in mismatches[:REPORT_LIMIT]:
+                    print("    %s %s: expected %s, found %s" % (mismatch.problem, mismatch.path, mismatch.expected,
+                                                               mismatch.found))
+                if len(mismatches) > REPORT_LIMIT:
+                    print("    ... %d more in %s" % (len(mismatches) - REPORT_LIMIT, reportPath(localdir)))
+                if mismatches:
+                    failed += 1
+    finally:
+        if journal is not None:
+            journal.close()
+        with open(reportPath(localdir), 'w') as reportFile:
+            json.dump(report, reportFile, indent=4)
+        print("Finished verifyMigration.py: %s" % time.strftime("%I:%M:%S"))
+    if failed:
+        print("%d of %d streams differ from AccuRev, see %s" % (failed, len(report), reportPath(localdir)))
+        sys.exit(ERR_MISMATCH)
+    print("All %d streams match AccuRev" % len(report))
+
+
+if __name__ == '__main__':
+    arguments = parse_arguments(sys.argv[1:])
+    main(arguments['username'], arguments['password'], arguments['streams'], arguments['workers'])
@@ -13,6 +13,7 @@ import getopt
 import sys
 import time
 from subprocess import call
+import migrationMetrics
 
 __author__ = "James Newkirk"
 __copyright__ = "Copyright 2018, PTC, Inc."
@@ -42,7 +43,7 @@ def parse_arguments(argv):
 
 def gitCaller(cmd, dirname):
     try:
-        returnCode = call(["git", "-C", dirname] + cmd)
+        returnCode = migrationMetrics.runProcess(call, ["git", "-C", dirname] + cmd)
         if returnCode == 0:
             print("Successfully executed command: git " + " ".join(cmd))
         else:
@@ -52,31 +53,46 @@ def gitCaller(cmd, dirname):
         print(e)
         sys.exit(ERR_UNKNOWN)
 
-# Take in path to workspace. Add and commit to git
-def commitRepo(dirname, tag, message=""):
-    gitAdd = ["add", dirname]
-    gitCaller(gitAdd, dirname)
+def commitMessage(tag, message):
     if tag == "":
-        gitCommit = ["commit", "--allow-empty", "-m", 'Added Maint', '--author="GeneralUser <GeneralUser@ptc.com>"']
+        return 'Added Maint'
     elif tag == None:
-        gitCommit = ["commit", "--allow-empty", "-m", message, '--author="GeneralUser <GeneralUser@ptc.com>"']
-    else:
-        gitCommit = ["commit", "--allow-empty", "-m", 'Added ' + tag, '--author="GeneralUser <GeneralUser@ptc.com>"']
-    gitCaller(gitCommit, dirname)
+        return message
+    return 'Added ' + tag
+
+# Take in path to workspace. Add and commit to git
+def commitRepo(dirname, tag, message="", importer=None, knownBlobs=None):
+    if importer is not None:
+        with migrationMetrics.span('commit', backend='fast-import') as commitSpan:
+            importer.commitTree(commitMessage(tag, message), knownBlobs)
+            commitSpan.add(files=len(importer.lastBlobs))
+        return
+    with migrationMetrics.span('add'):
+        gitAdd = ["add", dirname]
+        gitCaller(gitAdd, dirname)
+    with migrationMetrics.span('commit', backend='git'):
+        gitCommit = ["commit", "--allow-empty", "-m", commitMessage(tag, message), '--author="GeneralUser <GeneralUser@ptc.com>"']
+        gitCaller(gitCommit, dirname)
 
 # Add specified tag to repo
-def addTag(tag, dirname):
+def addTag(tag, dirname, importer=None):
     if tag not in ["", None]:
-        gitTag = ["tag", tag]
-        gitCaller(gitTag, dirname)
+        with migrationMetrics.span('tag', tag=tag):
+            if importer is not None:
+                importer.tag(tag)
+                return
+            gitTag = ["tag", tag]
+            gitCaller(gitTag, dirname)
 
 # Take in path to workspace. Initialize, add, and commit to git. Add specified tag to repo
-def main(dirname, tag, message):
+# When importer (a fastImport.FastImporter) is given, the commit and tag are streamed through git fast-import,
+# knownBlobs then lists the blob ids of files known to be unchanged.
+def main(dirname, tag, message, importer=None, knownBlobs=None):
     print("Starting workspace2repo.py: %s" % time.strftime("%I:%M:%S"))
 
     try:
-        commitRepo(dirname, tag, message)
-        addTag(tag, dirname)
+        commitRepo(dirname, tag, message, importer, knownBlobs)
+        addTag(tag, dirname, importer)
     except Exception as e:
         print(e)
         sys.exit(ERR_UNKNOWN)